@@ -122,6 +122,9 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'media', 'static')]  # Note the comma
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media_uploads')
 
+# Serve /chat-api/ with the async view; needs an ASGI server such as uvicorn
+CHAT_API_ASYNC = os.getenv('CHAT_API_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
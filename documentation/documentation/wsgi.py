@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'documentation.settings')
 
 application = get_wsgi_application()
+
+# Load the embedding model and check pgvector in the background; see /healthz/ready/
+from media.warmup import WARMUP_ON_START, start_background_warmup
+
+if WARMUP_ON_START:
+    start_background_warmup()
@@ -1,11 +1,32 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import DocumentationFile
+from .upload_ingest import upload_ingest_queue
 
 class DocumentationFileAdmin(admin.ModelAdmin):
-    list_display = ('name', 'doc_type', 'display_doc_file', 'display_ai_file', 'upload_date', 'last_updated')
-    list_filter = ('doc_type', 'upload_date')
+    list_display = ('name', 'doc_type', 'display_doc_file', 'display_ai_file', 'display_ingest_status', 'upload_date', 'last_updated')
+    list_filter = ('doc_type', 'upload_date', 'ingest_status')
     search_fields = ('name', 'doc_type')
+    readonly_fields = ('display_ingest_status', 'ingested_at', 'ingested_path', 'ingest_error')
+    actions = ['reingest_documents']
+    
+    def display_ingest_status(self, obj):
+        # Filled in by the background ingestion after each save; reload the page to follow it
+        if obj.ingest_status == 'processing':
+            return f"Processing {obj.ingest_progress}/{obj.ingest_total} chunks"
+        if obj.ingest_status == 'done':
+            return f"Done ({obj.ingest_total} chunks in {obj.doc_type}-docs)"
+        if obj.ingest_status == 'failed':
+            return format_html('<span title="{}" style="color: #ba2121">Failed</span>', obj.ingest_error)
+        return obj.get_ingest_status_display()
+    display_ingest_status.short_description = 'Vector Store'
+    
+    @admin.action(description="Chunk and embed the selected files again")
+    def reingest_documents(self, request, queryset):
+        queryset.update(ingest_status='queued', ingest_error='')
+        for doc_id in queryset.values_list('pk', flat=True):
+            upload_ingest_queue.enqueue(doc_id)
+        self.message_user(request, f"Queued {queryset.count()} files for ingestion.")
     
     def display_doc_file(self, obj):
         if obj.documentation_file:
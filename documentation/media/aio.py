@@ -0,0 +1,109 @@
+import asyncio
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncpg
+from asgiref.sync import sync_to_async
+from dotenv import load_dotenv
+
+from .db import PG_HOST, PG_PORT, PG_USER, PG_PASSWORD, PG_DATABASE, ensure_pgvector, pgvector_ready
+from .embeddings import EMBEDDING_BATCHING, embedding_batcher, embedding_cache, get_ml_model, normalize_question
+from .metrics import record_cache, span, timed
+from .retrieval import (
+    RRF_K, ann_limit, format_match, hybrid_candidates, hybrid_query_sql, resolve_mode, resolve_search_params,
+    search_memory_index, search_settings_sql, vector_query_sql,
+)
+
+# Load environment variables
+load_dotenv()
+
+ASYNC_PG_POOL_MIN_SIZE = int(os.getenv("ASYNC_PG_POOL_MIN_SIZE", "1"))
+ASYNC_PG_POOL_MAX_SIZE = int(os.getenv("ASYNC_PG_POOL_MAX_SIZE", "20"))
+# Threads used for CPU-bound question encoding
+EMBEDDING_EXECUTOR_WORKERS = int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", "2"))
+
+_encode_executor = ThreadPoolExecutor(max_workers=EMBEDDING_EXECUTOR_WORKERS, thread_name_prefix="encode")
+
+# asyncpg pools are bound to the event loop that created them
+_pools = weakref.WeakKeyDictionary()
+
+
+async def get_async_pool():
+    """Return the asyncpg pool for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            host=PG_HOST,
+            port=int(PG_PORT),
+            user=PG_USER,
+            password=PG_PASSWORD,
+            database=PG_DATABASE,
+            min_size=ASYNC_PG_POOL_MIN_SIZE,
+            max_size=ASYNC_PG_POOL_MAX_SIZE,
+        )
+        # Another request may have created one while we were connecting
+        existing = _pools.get(loop)
+        if existing is not None:
+            await pool.close()
+            return existing
+        _pools[loop] = pool
+    return pool
+
+
+async def async_encode_question(question):
+    """Embed a question without blocking the event loop."""
+    vector = embedding_cache.get(question)
+    record_cache("embedding", vector is not None)
+    if vector is None:
+        with span("encode"):
+            if EMBEDDING_BATCHING:
+                # Share a batched forward pass with other in-flight questions
+                vector = await asyncio.wrap_future(embedding_batcher.submit(normalize_question(question)))
+            else:
+                loop = asyncio.get_running_loop()
+                encoded = await loop.run_in_executor(_encode_executor, lambda: get_ml_model().encode(normalize_question(question)))
+                vector = encoded.tolist()
+        embedding_cache.set(question, vector)
+    return vector
+
+
+def _vector_literal(embedding):
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+@timed("retrieve")
+async def async_query_similar_docs(question_embedding, namespace, top_k=5, ef_search=None, probes=None, mode=None,
+                                   question=None):
+    """Async counterpart of ``retrieval.query_similar_docs`` using asyncpg."""
+    mode = resolve_mode(mode, question)
+    # The in-process index answers in well under a millisecond, no need to leave the loop
+    results = search_memory_index(question_embedding, namespace, top_k, mode)
+    if results is not None:
+        return results
+    try:
+        if not pgvector_ready():
+            await sync_to_async(ensure_pgvector, thread_sensitive=False)()
+        ef_search, probes = resolve_search_params(ann_limit(top_k, mode), ef_search, probes)
+        pool = await get_async_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # asyncpg uses prepared statements; a generic plan can't pick the
+                # namespace's partial index, so always plan with the actual namespace
+                await conn.execute(search_settings_sql(ef_search, probes) + " SET LOCAL plan_cache_mode = force_custom_plan;")
+                if mode == "hybrid":
+                    rows = await conn.fetch(
+                        hybrid_query_sql("$1::text", "$2", "$3", "$4", "$5", "$6"),
+                        _vector_literal(question_embedding), namespace, question, hybrid_candidates(top_k), RRF_K, top_k
+                    )
+                else:
+                    rows = await conn.fetch(
+                        vector_query_sql("$1::text", "$2", "$3"),
+                        _vector_literal(question_embedding), namespace, top_k
+                    )
+    except Exception as e:
+        print(f"Error querying PostgreSQL (async): {e}")
+        return {"matches": []}
+
+    return {"matches": [format_match(row) for row in rows]}
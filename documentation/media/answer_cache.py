@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .db import ensure_pgvector, get_pool
+
+# Load environment variables
+load_dotenv()
+
+# Semantic answer cache settings
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # minimum cosine similarity
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "500"))  # entries per namespace
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+# Seconds between checks for invalidations made by other processes (ingestion, other workers)
+ANSWER_CACHE_SYNC_INTERVAL = float(os.getenv("ANSWER_CACHE_SYNC_INTERVAL", "1"))
+# Namespaces whose generation is tracked; the least recently used are forgotten (and their answers dropped)
+ANSWER_CACHE_MAX_NAMESPACES = int(os.getenv("ANSWER_CACHE_MAX_NAMESPACES", "256"))
+
+# Generation row bumped by invalidate() without a namespace
+_ALL_NAMESPACES = "*"
+
+
+def bump_generation(namespace=None):
+    """Record in the database that cached answers for ``namespace`` (or all) are out of date."""
+    ensure_pgvector()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            INSERT INTO namespace_generations (namespace, generation) VALUES (%s, 1)
+            ON CONFLICT (namespace) DO UPDATE SET generation = namespace_generations.generation + 1;
+            """, (namespace or _ALL_NAMESPACES,))
+        conn.commit()
+
+
+def read_generations(namespaces):
+    """Generations of ``namespaces`` (and of the all-namespaces row) as a dict; missing rows are 0."""
+    ensure_pgvector()
+    names = list(namespaces) + [_ALL_NAMESPACES]
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT namespace, generation FROM namespace_generations WHERE namespace = ANY(%s);", (names,)
+            )
+            rows = dict(cursor.fetchall())
+    return {name: rows.get(name, 0) for name in names}
+
+
+class SemanticAnswerCache:
+    """Caches chat answers per namespace, keyed on the question embedding.
+
+    A lookup returns the answer of the most similar cached question when its
+    cosine similarity is at least ``threshold``. Entries expire after ``ttl``
+    seconds, each namespace keeps at most ``max_size`` entries (LRU), and
+    ``invalidate()`` drops a namespace when its documents change.
+
+    With a ``sync_interval``, invalidations are also recorded as a generation
+    counter in the database, and a background thread re-reads the counters of
+    the cached namespaces every ``sync_interval`` seconds, so an ingest in
+    another process reaches every worker's cache within that time rather than
+    at the TTL. Lookups never wait on the database; while it is unreachable
+    the cache keeps answering and the thread retries at the next interval.
+    At most ``max_namespaces`` namespaces are cached at once.
+    """
+
+    def __init__(self, threshold=0.95, max_size=500, ttl=3600, sync_interval=None, max_namespaces=256):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.max_namespaces = max_namespaces
+        self._generations = LRUCache(max_size=max_namespaces)  # namespace -> generation last seen
+        self._all_generation = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._namespaces = OrderedDict()  # namespace -> OrderedDict(entry_id -> (vector, payload, expires_at))
+        self._matrices = {}  # namespace -> (entry_ids, stacked unit vectors), rebuilt lazily
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _matrix(self, namespace, entries):
+        cached = self._matrices.get(namespace)
+        if cached is None:
+            entry_ids = list(entries.keys())
+            matrix = np.stack([entries[i][0] for i in entry_ids]) if entry_ids else None
+            cached = (entry_ids, matrix)
+            self._matrices[namespace] = cached
+        return cached
+
+    def _expire(self, namespace, entries):
+        now = time.monotonic()
+        expired = [entry_id for entry_id, (_, _, expires_at) in entries.items() if expires_at <= now]
+        for entry_id in expired:
+            del entries[entry_id]
+        if expired:
+            self._matrices.pop(namespace, None)
+
+    def _ensure_syncing(self):
+        if self.sync_interval is None:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sync_forever, name="answer-cache-sync", daemon=True)
+                self._thread.start()
+
+    def _sync_forever(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Error reading answer cache generations: {e}")
+
+    def _drop(self, namespace):
+        self._namespaces.pop(namespace, None)
+        self._matrices.pop(namespace, None)
+
+    def sync(self):
+        """Drop the cached namespaces another process invalidated since the last check."""
+        with self._lock:
+            namespaces = list(self._namespaces)
+        generations = read_generations(namespaces)
+        with self._lock:
+            everything = generations.pop(_ALL_NAMESPACES)
+            if self._all_generation is not None and everything != self._all_generation:
+                self._namespaces.clear()
+                self._matrices.clear()
+                self._generations.clear()
+                self.invalidations += 1
+            self._all_generation = everything
+            for namespace, generation in generations.items():
+                seen = self._generations.get(namespace)
+                if seen is not None and seen != generation:
+                    self._drop(namespace)
+                    self.invalidations += 1
+                self._generations.set(namespace, generation)
+
+    def get(self, namespace, embedding):
+        """Return ``(payload, similarity)`` for the closest cached question, or ``None``."""
+        query = self._unit(embedding)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries:
+                self._expire(namespace, entries)
+            if not entries:
+                self.misses += 1
+                return None
+
+            entry_ids, matrix = self._matrix(namespace, entries)
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = entry_ids[best]
+            entries.move_to_end(entry_id)
+            self._namespaces.move_to_end(namespace)
+            self.hits += 1
+            return entries[entry_id][1], similarity
+
+    def set(self, namespace, embedding, payload):
+        vector = self._unit(embedding)
+        self._ensure_syncing()
+        with self._lock:
+            if namespace not in self._namespaces:
+                while len(self._namespaces) >= self.max_namespaces:
+                    forgotten, _ = self._namespaces.popitem(last=False)
+                    self._matrices.pop(forgotten, None)
+                    self._generations.delete(forgotten)
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+            self._namespaces.move_to_end(namespace)
+            self._next_id += 1
+            entries[self._next_id] = (vector, payload, time.monotonic() + self.ttl)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+            self._matrices.pop(namespace, None)
+
+    def invalidate(self, namespace=None):
+        """Drop cached answers for ``namespace`` (or for every namespace), in every process."""
+        if self.sync_interval is not None:
+            try:
+                bump_generation(namespace)
+            except Exception as e:
+                print(f"Error recording answer cache invalidation for {namespace or 'all namespaces'}: {e}")
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+                self._matrices.clear()
+                self._generations.clear()
+                self._all_generation = None
+            else:
+                self._drop(namespace)
+                # The next sync() adopts the bumped generation instead of dropping the namespace again
+                self._generations.delete(namespace)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "namespaces": len(self._namespaces),
+                "entries": sum(len(entries) for entries in self._namespaces.values()),
+                "threshold": self.threshold,
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "sync_interval": self.sync_interval,
+                "max_namespaces": self.max_namespaces,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_size=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    sync_interval=ANSWER_CACHE_SYNC_INTERVAL,
+    max_namespaces=ANSWER_CACHE_MAX_NAMESPACES,
+)
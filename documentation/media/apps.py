@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class MediaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'media'
+
+    def ready(self):
+        # Connect the cache invalidation signal handlers
+        from . import signals
@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from .answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from .embeddings import encode_questions
+from .llm import PRIORITY_BATCH, LLMOverloaded, LLMUnavailable, llm_scheduler
+from .prompts import CHAT_MAX_TOKENS, CHAT_MODEL, CHAT_TEMPERATURE, CHAT_TOP_K, build_chat_messages, no_docs_answer
+from .rerank import candidate_count, rerank_matches
+from .retrieval import query_similar_docs_batch
+
+# Load environment variables
+load_dotenv()
+
+# Questions accepted by one batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+# Questions encoded and retrieved together; also bounds how many wait for the LLM
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "128"))
+# Items answered at once; keep it under LLM_QUEUE_SIZE so batches don't fill the scheduler's queue
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Seconds one item may wait for the LLM; batch work yields to interactive chats
+BATCH_LLM_DEADLINE = float(os.getenv("BATCH_LLM_DEADLINE", "300"))
+# Largest top_k a batch may ask for; it is multiplied into every item's retrieval LIMIT
+BATCH_MAX_TOP_K = int(os.getenv("BATCH_MAX_TOP_K", "20"))
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def parse_batch_items(items, default_tool_name=None):
+    """Validate ``[{"tool_name", "question", "id"?}, ...]``; returns ``(items, errors)``.
+
+    Each item gets its position as ``index``; invalid items become error results.
+    """
+    if not isinstance(items, list):
+        raise ValueError("items must be a list")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} items per batch")
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            item = {}
+        question = item.get("question")
+        tool_name = item.get("tool_name") or default_tool_name
+        entry = {"index": index, "id": item.get("id"), "tool_name": tool_name, "question": question}
+        if not question or not tool_name or not isinstance(question, str):
+            errors.append({**entry, "error": "Missing question or tool_name"})
+        else:
+            valid.append(entry)
+    return valid, errors
+
+
+def parse_top_k(value):
+    """``top_k`` from a request: None when unset, clamped to ``BATCH_MAX_TOP_K``; ValueError unless positive."""
+    if value is None or value == "":
+        return None
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("top_k must be a positive integer")
+    if top_k < 1:
+        raise ValueError("top_k must be a positive integer")
+    return min(top_k, BATCH_MAX_TOP_K)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _prepare(chunk, top_k, search_params):
+    """Encode a chunk of items in one pass and retrieve candidates per namespace in one query each."""
+    started = time.monotonic()
+    embeddings = encode_questions([item["question"] for item in chunk])
+    encode_time = time.monotonic() - started
+
+    by_namespace = {}
+    for item, embedding in zip(chunk, embeddings):
+        item["namespace"] = f"{item['tool_name']}-docs"
+        item["embedding"] = embedding
+        item["timings"] = {"encode_ms": _ms(encode_time / len(chunk))}
+        by_namespace.setdefault(item["namespace"], []).append(item)
+
+    for namespace, items in by_namespace.items():
+        started = time.monotonic()
+        # The answer cache may already have some of them
+        pending = []
+        for item in items:
+            cached = answer_cache.get(namespace, item["embedding"]) if ANSWER_CACHE_ENABLED else None
+            if cached is not None:
+                item["cached"] = cached[0]
+            else:
+                pending.append(item)
+        results = query_similar_docs_batch(
+            [item["embedding"] for item in pending], namespace, [item["question"] for item in pending],
+            top_k=candidate_count(top_k), **search_params)
+        retrieve_time = time.monotonic() - started
+        for item, result in zip(pending, results):
+            item["matches"] = result["matches"]
+        for item in items:
+            item["timings"]["retrieve_ms"] = _ms(retrieve_time / len(items))
+    return chunk
+
+
+def _complete(messages):
+    """Ask the scheduler at batch priority, waiting and retrying when interactive work fills the queue."""
+    deadline = time.monotonic() + BATCH_LLM_DEADLINE
+    attempt = 0
+    while True:
+        try:
+            return llm_scheduler.complete(
+                messages, priority=PRIORITY_BATCH, timeout=max(deadline - time.monotonic(), 0.0),
+                model=CHAT_MODEL, temperature=CHAT_TEMPERATURE, max_tokens=CHAT_MAX_TOKENS)
+        except LLMOverloaded:
+            delay = random.uniform(0, min(10.0, 0.5 * 2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            time.sleep(delay)
+
+
+def _answer(item, top_k):
+    started = time.monotonic()
+    result = {key: item[key] for key in ("index", "id", "tool_name", "question")}
+    timings = item["timings"]
+    try:
+        if "cached" in item:
+            result.update(item["cached"], cached=True)
+            return result
+        rerank_started = time.monotonic()
+        matches = rerank_matches(item["question"], item["matches"], top_k)
+        timings["rerank_ms"] = _ms(time.monotonic() - rerank_started)
+        if not matches:
+            result.update(answer=no_docs_answer(item["tool_name"]), sources=[])
+            return result
+        messages, sources = build_chat_messages(item["tool_name"], item["question"], matches)
+        llm_started = time.monotonic()
+        try:
+            response = _complete(messages)
+        except LLMUnavailable as e:
+            timings["llm_ms"] = _ms(time.monotonic() - llm_started)
+            result.update(answer=None, sources=sources, error=f"LLM unavailable: {e}")
+            return result
+        timings["llm_ms"] = _ms(time.monotonic() - llm_started)
+        payload = {"answer": response.choices[0].message.content, "sources": sources}
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.set(item["namespace"], item["embedding"], payload)
+        result.update(payload)
+        return result
+    except Exception as e:
+        print(f"Error answering batch item {item['index']}: {e}")
+        result.update(answer=None, error=str(e))
+        return result
+    finally:
+        timings["answer_ms"] = _ms(time.monotonic() - started)
+        result["timings"] = timings
+
+
+def run_batch(items, top_k=None, search_params=None, concurrency=None, invalid=()):
+    """Answer many questions; yields one result dict per item, in completion order.
+
+    Chunks of ``BATCH_CHUNK_SIZE`` questions are encoded together and retrieved
+    with one query per namespace, then answered by a pool of ``concurrency``
+    threads through the LLM scheduler at batch priority. The next chunk is
+    prepared while the previous one is being answered. Each result carries
+    ``timings`` in milliseconds (encode and retrieve are the item's share of
+    its chunk's batched call). ``invalid`` results from ``parse_batch_items``
+    come first and the last item yielded is a ``summary``.
+    """
+    top_k = CHAT_TOP_K if top_k is None else top_k
+    started = time.monotonic()
+    counts = {"items": len(items) + len(invalid), "answered": 0, "cached": 0, "errors": len(invalid)}
+    executor = ThreadPoolExecutor(max_workers=concurrency or BATCH_CONCURRENCY, thread_name_prefix="batch")
+    pending = set()
+
+    def finished(futures):
+        for future in futures:
+            result = future.result()
+            if result.get("error"):
+                counts["errors"] += 1
+            elif result.get("cached"):
+                counts["cached"] += 1
+            else:
+                counts["answered"] += 1
+            result["timings"]["completed_at_ms"] = _ms(time.monotonic() - started)
+            yield result
+
+    yield from invalid
+    try:
+        for chunk in _chunks(items, BATCH_CHUNK_SIZE):
+            try:
+                prepared = _prepare(chunk, top_k, search_params or {})
+            except Exception as e:
+                print(f"Error preparing batch chunk: {e}")
+                for item in chunk:
+                    counts["errors"] += 1
+                    yield {**{key: item[key] for key in ("index", "id", "tool_name", "question")}, "answer": None, "error": str(e)}
+                continue
+            for item in prepared:
+                pending.add(executor.submit(_answer, item, top_k))
+            # Backpressure: don't prepare more than a chunk ahead of the answers
+            while len(pending) > BATCH_CHUNK_SIZE:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+            done = {future for future in pending if future.done()}
+            pending -= done
+            yield from finished(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    yield {"summary": {**counts, "elapsed_ms": _ms(time.monotonic() - started)}}
+
+
+def ndjson_lines(results):
+    for result in results:
+        yield json.dumps(result) + "\n"
@@ -0,0 +1,391 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import django
+from django.test import RequestFactory
+
+from .answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from .db import ensure_pgvector, get_pool, embedding_storage
+from .embeddings import EMBEDDING_MODEL_NAME, encode_questions, get_ml_model, get_torch_device
+from .ingest import ingest_documents
+from .llm import LLM_MAX_CONCURRENCY, FakeProvider, RateLimiter, llm_scheduler
+from .memory_index import memory_index
+from .prompts import CHAT_TOP_K
+from .rerank import RERANK_ENABLED
+from .retrieval import RETRIEVAL_BACKEND, RETRIEVAL_MODE, query_similar_docs
+from .vector_index import drop_namespace_indexes
+
+# Synthetic namespaces are "bench0-docs", "bench1-docs", ... (tool names bench0, bench1, ...)
+BENCH_TOOL_PREFIX = "bench"
+BENCH_DOC_TYPE = "bench"
+# Where the store_documents scenario writes
+BENCH_INGEST_NAMESPACE = "bench-ingest-docs"
+
+REPORT_VERSION = 1
+
+# Vocabulary for the synthetic documentation; questions draw from it too, so full-text search has hits
+_WORDS = (
+    "model view template form field query queryset manager migration schema index table column row "
+    "request response middleware session cookie cache header status redirect route url path pattern "
+    "function class method argument parameter return value default option setting config environment "
+    "variable string number list dict tuple set iterator generator decorator context async await "
+    "thread process worker queue task job event signal handler callback hook plugin extension module "
+    "package import install upgrade version release deploy server client proxy socket stream buffer "
+    "file directory upload download storage media static asset image text json yaml xml csv parse "
+    "render serialize validate clean error exception warning log debug test fixture mock assert "
+    "user group permission auth token password login logout admin panel widget layout style theme "
+    "coroutine channel lock mutex timeout retry backoff limit batch page cursor filter sort search"
+).split()
+
+_QUESTION_TEMPLATES = (
+    "How do I {0} a {1} with {2}?",
+    "What is the difference between {0} and {1}?",
+    "Why does my {0} {1} raise an error in {2}?",
+    "How can I configure the {0} {1} for {2}?",
+    "Is there a way to {0} every {1} in a {2}?",
+)
+
+
+def bench_namespaces(count):
+    return [f"{BENCH_TOOL_PREFIX}{i}-docs" for i in range(count)]
+
+
+def synthetic_documents(namespace, count, seed=0, words_per_chunk=120):
+    """``count`` markdown-like chunks for ``namespace``, the same for the same seed."""
+    rng = random.Random(f"{seed}:{namespace}")
+    for i in range(count):
+        heading = " ".join(rng.choice(_WORDS) for _ in range(3)).capitalize()
+        sentences = []
+        words = 0
+        while words < words_per_chunk:
+            sentence = [rng.choice(_WORDS) for _ in range(rng.randint(6, 14))]
+            words += len(sentence)
+            sentences.append(" ".join(sentence).capitalize() + ".")
+        if i % 5 == 0:
+            sentences.append(f"\n```python\n{rng.choice(_WORDS)} = {rng.choice(_WORDS)}({rng.choice(_WORDS)})\n```")
+        yield {
+            "path": f"bench/{namespace}/page-{i // 4}.md",
+            "chunk_id": i % 4,
+            "heading": heading,
+            "url": f"https://example.com/{namespace}/{i // 4}#{i % 4}",
+            "content": " ".join(sentences),
+            "level": 2,
+        }
+
+
+def synthetic_questions(count, seed=0):
+    """``count`` distinct questions (numbered, so neither cache turns them into hits by accident)."""
+    rng = random.Random(f"{seed}:questions")
+    return [
+        rng.choice(_QUESTION_TEMPLATES).format(*(rng.choice(_WORDS) for _ in range(3))) + f" (#{i})"
+        for i in range(count)
+    ]
+
+
+def drop_namespaces(namespaces, drop_indexes=True):
+    """Delete the synthetic chunks, so a run never measures re-ingesting unchanged data.
+
+    Their partial vector indexes (if PGVECTOR_NAMESPACE_INDEXES lists them) are
+    dropped too unless ``drop_indexes`` is False; seeding creates them again.
+    """
+    ensure_pgvector()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM documents WHERE namespace = ANY(%s);", (list(namespaces),))
+            deleted = cursor.rowcount
+        conn.commit()
+    if drop_indexes:
+        drop_namespace_indexes(namespaces, log=lambda message: None)
+    for namespace in namespaces:
+        memory_index.mark_stale(namespace)
+        answer_cache.invalidate(namespace)
+    return deleted
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    """Latency percentiles (ms) and throughput for one scenario run."""
+    row = {"count": len(latencies), "errors": errors, "seconds": round(wall_seconds, 3),
+           "qps": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0}
+    if latencies:
+        ms = np.array(latencies) * 1000
+        row.update({
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "mean_ms": round(float(ms.mean()), 3),
+            "max_ms": round(float(ms.max()), 3),
+        })
+    return row
+
+
+def run_concurrent(call, jobs, concurrency):
+    """Run ``call(job)`` for every job on ``concurrency`` threads; returns ``(latencies, errors, wall_seconds)``.
+
+    ``call`` returns False (or raises) to count the job as an error.
+    """
+    def timed(job):
+        started = time.perf_counter()
+        try:
+            ok = call(job) is not False
+        except Exception as e:
+            print(f"Benchmark call failed: {e}")
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+        results = list(executor.map(timed, jobs))
+    wall = time.perf_counter() - started
+    latencies = [seconds for seconds, ok in results if ok]
+    return latencies, len(results) - len(latencies), wall
+
+
+@contextmanager
+def fake_llm(latency_ms):
+    """Answer LLM calls locally with a fixed latency and no provider rate limits."""
+    provider, limiter = llm_scheduler.provider, llm_scheduler.limiter
+    llm_scheduler.provider = FakeProvider(latency_ms=latency_ms)
+    llm_scheduler.limiter = RateLimiter(10 ** 9, 10 ** 12)
+    try:
+        yield
+    finally:
+        llm_scheduler.provider, llm_scheduler.limiter = provider, limiter
+
+
+def bench_seed(namespaces, docs_per_namespace, seed=0, batch_size=256, log=print):
+    """Load the synthetic namespaces through ``ingest_documents``; the timed part is the encode + COPY."""
+    rows = []
+    for namespace in namespaces:
+        batch_times = []
+        last = [time.monotonic()]
+
+        def progress(stats):
+            now = time.monotonic()
+            batch_times.append(now - last[0])
+            last[0] = now
+
+        stats = ingest_documents(synthetic_documents(namespace, docs_per_namespace, seed), namespace,
+                                 BENCH_DOC_TYPE, batch_size=batch_size, progress=progress)
+        summary = stats.as_dict()
+        log(f"  seeded {namespace}: {summary['count']} chunks in {summary['seconds']}s ({summary['docs_per_second']}/s)")
+        rows.append({
+            "scenario": "ingest_documents",
+            "namespace": namespace,
+            "concurrency": 1,
+            "batch_size": batch_size,
+            "docs": summary["count"],
+            "docs_per_second": summary["docs_per_second"],
+            "encode_seconds": summary["encode_seconds"],
+            "write_seconds": summary["write_seconds"],
+            # One "request" per batch
+            **summarize(batch_times, summary["seconds"]),
+        })
+    return rows
+
+
+def bench_store_documents(concurrency_levels, requests=20, docs_per_request=32, seed=0, log=print):
+    """POST new chunks to the ``store_documents`` view from several threads at once."""
+    from .views import store_documents
+
+    factory = RequestFactory()
+    documents = list(synthetic_documents(BENCH_INGEST_NAMESPACE, requests * docs_per_request * len(concurrency_levels), seed))
+    rows = []
+    for level, concurrency in enumerate(concurrency_levels):
+        batches = [
+            documents[(level * requests + i) * docs_per_request:(level * requests + i + 1) * docs_per_request]
+            for i in range(requests)
+        ]
+
+        def post(batch):
+            request = factory.post("/api/documents/", json.dumps({
+                "documents": batch, "namespace": BENCH_INGEST_NAMESPACE, "doc_type": BENCH_DOC_TYPE,
+            }), content_type="application/json")
+            return store_documents(request).status_code == 200
+
+        latencies, errors, wall = run_concurrent(post, batches, concurrency)
+        row = {"scenario": "store_documents", "concurrency": concurrency, "docs_per_request": docs_per_request,
+               **summarize(latencies, wall, errors)}
+        row["docs_per_second"] = round(len(latencies) * docs_per_request / wall, 1) if wall else 0.0
+        log(_describe(row))
+        rows.append(row)
+    return rows
+
+
+def bench_retrieval(namespaces, questions, modes, concurrency_levels, top_k=5, warmup=10, log=print):
+    """Time ``query_similar_docs`` with pre-encoded questions, so only the search is measured."""
+    embeddings = encode_questions(questions)
+    jobs = [(embedding, question, namespaces[i % len(namespaces)])
+            for i, (embedding, question) in enumerate(zip(embeddings, questions))]
+    rows = []
+    for mode in modes:
+        def search(job):
+            embedding, question, namespace = job
+            return bool(query_similar_docs(embedding, namespace, top_k=top_k, mode=mode, question=question)["matches"])
+
+        run_concurrent(search, jobs[:warmup], 1)
+        for concurrency in concurrency_levels:
+            latencies, errors, wall = run_concurrent(search, jobs, concurrency)
+            row = {"scenario": "query_similar_docs", "mode": mode, "concurrency": concurrency, "top_k": top_k,
+                   **summarize(latencies, wall, errors)}
+            log(_describe(row))
+            rows.append(row)
+    return rows
+
+
+def bench_chat(namespaces, questions, concurrency_levels, llm_latency_ms, warmup=5, log=print):
+    """End to end through the ``chat_api`` view, with the LLM replaced by a fake of fixed latency.
+
+    Each concurrency level asks its own questions, so the answer and embedding
+    caches miss and every request embeds, retrieves, reranks and calls the LLM.
+    """
+    from .views import chat_api
+
+    factory = RequestFactory()
+
+    def ask(job):
+        question, namespace = job
+        request = factory.post("/chat-api/", json.dumps({
+            "question": question, "tool_name": namespace[:-len("-docs")],
+        }), content_type="application/json")
+        response = chat_api(request)
+        payload = json.loads(response.content)
+        return response.status_code == 200 and not payload.get("busy") and bool(payload.get("sources"))
+
+    per_level = len(questions) // (len(concurrency_levels) + 1)
+    jobs = [(question, namespaces[i % len(namespaces)]) for i, question in enumerate(questions)]
+    rows = []
+    with fake_llm(llm_latency_ms):
+        run_concurrent(ask, jobs[-warmup:], 1)
+        for level, concurrency in enumerate(concurrency_levels):
+            hits = answer_cache.hits
+            latencies, errors, wall = run_concurrent(ask, jobs[level * per_level:(level + 1) * per_level], concurrency)
+            row = {"scenario": "chat_api", "concurrency": concurrency, "llm_latency_ms": llm_latency_ms,
+                   "answer_cache_hits": answer_cache.hits - hits, **summarize(latencies, wall, errors)}
+            log(_describe(row))
+            rows.append(row)
+    return rows
+
+
+def _describe(row):
+    label = row["scenario"] + (f" [{row['mode']}]" if row.get("mode") else "")
+    if not row.get("count"):
+        return f"  {label} x{row['concurrency']}: no successful calls ({row['errors']} errors)"
+    return (f"  {label} x{row['concurrency']}: p50 {row['p50_ms']}ms, p95 {row['p95_ms']}ms, "
+            f"p99 {row['p99_ms']}ms, {row['qps']}/s, {row['errors']} errors")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """What the numbers depend on, so two reports can be told apart."""
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version(), (SELECT extversion FROM pg_extension WHERE extname = 'vector');")
+            postgres, pgvector = cursor.fetchone()
+    return {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "postgres": postgres.split(",")[0],
+        "pgvector": pgvector,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "embedding_device": str(get_torch_device()),
+        "embedding_storage": embedding_storage(),
+        "retrieval_backend": RETRIEVAL_BACKEND,
+        "retrieval_mode": RETRIEVAL_MODE,
+        "rerank_enabled": RERANK_ENABLED,
+        "answer_cache_enabled": ANSWER_CACHE_ENABLED,
+        "chat_top_k": CHAT_TOP_K,
+        "llm_max_concurrency": LLM_MAX_CONCURRENCY,
+    }
+
+
+def run_benchmark(namespaces=3, docs_per_namespace=1000, queries=200, concurrency_levels=(1, 4, 16),
+                  modes=("vector", "hybrid"), scenarios=("ingest", "retrieval", "chat"), llm_latency_ms=300,
+                  chat_queries=None, ingest_requests=20, docs_per_request=32, top_k=5, seed=0, keep=False, log=print):
+    """Seed synthetic namespaces and measure ingestion, retrieval and chat; returns the report dict.
+
+    The synthetic namespaces are dropped before seeding (so ingestion always
+    embeds everything) and again at the end unless ``keep``.
+    """
+    names = bench_namespaces(namespaces)
+    get_ml_model()  # load it before anything is timed
+    started = time.monotonic()
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "parameters": {
+            "namespaces": namespaces, "docs_per_namespace": docs_per_namespace, "queries": queries,
+            "chat_queries": chat_queries or queries, "concurrency": list(concurrency_levels), "modes": list(modes),
+            "scenarios": list(scenarios), "llm_latency_ms": llm_latency_ms, "ingest_requests": ingest_requests,
+            "docs_per_request": docs_per_request, "top_k": top_k, "seed": seed,
+        },
+        "environment": environment(),
+        "results": [],
+    }
+    results = report["results"]
+    try:
+        log(f"Seeding {namespaces} namespaces x {docs_per_namespace} chunks...")
+        drop_namespaces(names + [BENCH_INGEST_NAMESPACE])
+        seeded = bench_seed(names, docs_per_namespace, seed, log=log)
+        if "ingest" in scenarios:
+            results.extend(seeded)
+            log("store_documents:")
+            results.extend(bench_store_documents(concurrency_levels, ingest_requests, docs_per_request, seed, log=log))
+        if "retrieval" in scenarios:
+            log("query_similar_docs:")
+            results.extend(bench_retrieval(names, synthetic_questions(queries, seed), modes, concurrency_levels,
+                                           top_k=top_k, log=log))
+        if "chat" in scenarios:
+            log(f"chat_api (fake LLM, {llm_latency_ms}ms):")
+            count = (chat_queries or queries) * (len(concurrency_levels) + 1)
+            results.extend(bench_chat(names, synthetic_questions(count, seed + 1), concurrency_levels,
+                                      llm_latency_ms, log=log))
+    finally:
+        if not keep:
+            drop_namespaces(names + [BENCH_INGEST_NAMESPACE])
+    report["seconds"] = round(time.monotonic() - started, 1)
+    return report
+
+
+def result_key(row):
+    return (row["scenario"], row.get("namespace") or row.get("mode") or "", row["concurrency"])
+
+
+def compare_reports(baseline, report, tolerance=0.2):
+    """Line up the results of two reports; returns one row per scenario both have.
+
+    A row is a regression when p95 latency grew, or throughput fell, by more than ``tolerance``.
+    """
+    before = {result_key(row): row for row in baseline.get("results", [])}
+    rows = []
+    for row in report.get("results", []):
+        old = before.get(result_key(row))
+        if not old or not old.get("count") or not row.get("count"):
+            continue
+        p95_change = row["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        qps_change = row["qps"] / old["qps"] - 1 if old["qps"] else 0.0
+        rows.append({
+            "key": " ".join(part for part in result_key(row)[:2] if part) + f" x{row['concurrency']}",
+            "p95_ms": (old["p95_ms"], row["p95_ms"]),
+            "qps": (old["qps"], row["qps"]),
+            "p95_change": round(p95_change, 4),
+            "qps_change": round(qps_change, 4),
+            "regression": p95_change > tolerance or qps_change < -tolerance,
+        })
+    return rows
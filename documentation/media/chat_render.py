@@ -0,0 +1,115 @@
+import html
+import re
+from urllib.parse import quote
+
+import markdown
+from markdown.extensions import Extension
+from markdown.postprocessors import Postprocessor
+from markdown.treeprocessors import Treeprocessor
+
+CITATIONS_MARKER = "Cited documentation sections:"
+# Relative links must start with a single slash; browsers read "//host" and "/\host" as another site
+SAFE_URL = re.compile(r"^(https?:|mailto:|/(?![/\\])|#)", re.IGNORECASE)
+
+# Same look as formatMarkdown() in scriptsai.js
+ELEMENT_CLASSES = {
+    "h1": "text-2xl font-bold mt-6 mb-3",
+    "h2": "text-xl font-bold mt-6 mb-2",
+    "h3": "text-lg font-bold mt-4 mb-2",
+}
+PARAGRAPH_CLASS = "mb-3"
+INLINE_CODE_CLASS = "bg-gray-100 px-1 py-0.5 rounded text-pink-600"
+PRE_CLASS = "bg-gray-900 rounded-md p-4 my-4 overflow-x-auto w-full"
+CODE_BLOCK = re.compile(r'<pre><code(?: class="language-([^"]+)")?>')
+
+
+class _ChatTreeprocessor(Treeprocessor):
+    def run(self, root):
+        block_code = {child for pre in root.iter("pre") for child in pre}
+        for element in root.iter():
+            if element.tag in ELEMENT_CLASSES:
+                element.set("class", ELEMENT_CLASSES[element.tag])
+            elif element.tag == "code" and element not in block_code:
+                element.set("class", INLINE_CODE_CLASS)
+            elif element.tag == "a":
+                if not SAFE_URL.match(element.get("href", "")):
+                    element.set("href", "#")
+                element.set("target", "_blank")
+                element.set("rel", "noopener")
+            elif element.tag == "img":
+                # Answers don't need images; keep the alt text only
+                alt = element.get("alt", "")
+                element.clear()
+                element.tag = "span"
+                element.text = alt
+
+
+class _BlockClassPostprocessor(Postprocessor):
+    # Fenced blocks are stashed as raw HTML, so style them after they're put back;
+    # paragraphs too, as a class on <p> would stop markdown unwrapping stashed blocks.
+    # Blocks without a language get python, like the client did
+    def run(self, text):
+        text = text.replace("<p>", f'<p class="{PARAGRAPH_CLASS}">')
+        return CODE_BLOCK.sub(
+            lambda m: f'<pre class="{PRE_CLASS}"><code class="language-{m.group(1) or "python"} block text-left">', text)
+
+
+class ChatMarkdownExtension(Extension):
+    """Markdown for chat answers: raw HTML is escaped, not passed through."""
+
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister("html_block")
+        md.inlinePatterns.deregister("html")
+        md.treeprocessors.register(_ChatTreeprocessor(md), "chat", 0)
+        md.postprocessors.register(_BlockClassPostprocessor(md), "chat_classes", 0)
+
+
+def _markdown():
+    return markdown.Markdown(
+        extensions=["fenced_code", "tables", "sane_lists", ChatMarkdownExtension()],
+        extension_configs={"fenced_code": {"lang_prefix": "language-"}},
+    )
+
+
+def _citations_html(citations, tool_name):
+    items = []
+    for match in re.finditer(r"\s*Section:\s*(.*?)(?:¶|\n|$)", citations):
+        section = match.group(1).strip()
+        if not section:
+            continue
+        if tool_name == "flask":
+            url = f"https://flask.palletsprojects.com/en/latest/search/?q={quote(section)}"
+        else:
+            url = f"https://docs.python.org/3/search.html?q={quote(section)}"
+        items.append(f'<li><a href="{html.escape(url)}" target="_blank" rel="noopener" '
+                     f'class="text-blue-600 hover:underline">{html.escape(section)}</a></li>')
+    if not items:
+        return ""
+    return f'<div class="citation-list"><h3>References</h3><ul class="list-disc">{"".join(items)}</ul></div>'
+
+
+def render_message(content, tool_name="generic", md=None):
+    """Render one AI answer to the HTML the chat page shows for it."""
+    md = md or _markdown()
+    content = content or ""
+    citations = ""
+    if CITATIONS_MARKER in content:
+        content, citations = content.split(CITATIONS_MARKER, 1)
+    body = md.reset().convert(content.strip())
+    return f'<div class="prose max-w-none text-gray-800">{body}{_citations_html(citations, tool_name)}</div>'
+
+
+def render_chat(chat_data):
+    """Copy of ``chat_data`` where every AI message carries its rendered ``html``.
+
+    User messages stay plain text; the page shows them with textContent.
+    """
+    md = _markdown()
+    tool_name = chat_data.get("tool_name", "generic")
+    messages = []
+    for message in chat_data.get("messages", []):
+        message = {key: value for key, value in message.items() if key != "html"}
+        if message.get("sender") != "user":
+            message["html"] = render_message(str(message.get("content", "")), tool_name, md)
+        messages.append(message)
+    return {**chat_data, "messages": messages}
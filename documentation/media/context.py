@@ -0,0 +1,148 @@
+import os
+import re
+
+from dotenv import load_dotenv
+
+from .tokens import count_tokens, truncate_to_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Upper bound on the documentation context sent to the LLM, in tokens; the reranker keeps
+# chunks within the same budget before they are merged and trimmed here
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Overlap between consecutive chunks shorter than this is left alone
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 2000
+# Don't start a section that would have to be cut below this many tokens
+MIN_SECTION_TOKENS = 50
+# Repeated paragraphs shorter than this (fences, "Example:", ...) are kept
+MIN_DEDUP_CHARS = 40
+
+
+def strip_overlap(previous, text):
+    """Drop the start of ``text`` that repeats the end of ``previous``."""
+    limit = min(len(previous), len(text), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:].lstrip()
+    return text
+
+
+def merge_matches(matches):
+    """Group matches into sections of consecutive chunks of the same path.
+
+    ``matches`` is in relevance order; a section ranks as its best chunk did.
+    """
+    runs = {}  # path -> list of runs, each a list of (rank, match)
+    for rank, match in enumerate(matches):
+        path = match["metadata"].get("path") or f"#{match['id']}"
+        runs.setdefault(path, []).append((rank, match))
+
+    sections = []
+    for path, items in runs.items():
+        items.sort(key=lambda item: (item[1]["metadata"].get("chunk_id") is None, item[1]["metadata"].get("chunk_id") or 0))
+        current = []
+        for rank, match in items:
+            chunk_id = match["metadata"].get("chunk_id")
+            previous_id = current[-1][1]["metadata"].get("chunk_id") if current else None
+            if current and chunk_id is not None and previous_id is not None:
+                if chunk_id == previous_id:
+                    continue  # same chunk twice
+                if chunk_id == previous_id + 1:
+                    current.append((rank, match))
+                    continue
+            if current:
+                sections.append(current)
+            current = [(rank, match)]
+        if current:
+            sections.append(current)
+
+    sections.sort(key=lambda run: min(rank for rank, _ in run))
+    return sections
+
+
+def _section_text(run, seen_paragraphs):
+    """Join the chunks of one run, removing overlaps and paragraphs already used."""
+    heading = run[0][1]["metadata"].get("heading") or ""
+    parts = []
+    previous, previous_heading = "", heading
+    for _, match in run:
+        metadata = match["metadata"]
+        content = strip_overlap(previous, metadata.get("content") or "") if previous else metadata.get("content") or ""
+        previous = metadata.get("content") or ""
+        # Keep sub-headings of merged chunks so the LLM can still cite them
+        if metadata.get("heading") and metadata.get("heading") != previous_heading:
+            content = f"{metadata['heading']}\n\n{content}"
+            previous_heading = metadata["heading"]
+        parts.append(content)
+
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", "\n\n".join(parts)):
+        key = re.sub(r"\s+", " ", paragraph).strip()
+        if not key:
+            continue
+        if len(key) >= MIN_DEDUP_CHARS:
+            if key in seen_paragraphs:
+                continue
+            seen_paragraphs.add(key)
+        paragraphs.append(paragraph.strip("\n"))
+    return heading, "\n\n".join(paragraphs)
+
+
+def format_section(section):
+    return f"Section: {section['heading']}\n\nContent: {section['content']}"
+
+
+def _trim(section, max_tokens):
+    """Cut a section's content to fit ``max_tokens``, preferably at a paragraph break."""
+    header_tokens = count_tokens(format_section({**section, "content": ""}))
+    content = truncate_to_tokens(section["content"], max_tokens - header_tokens - 2)
+    cut = content.rfind("\n\n")
+    if cut > len(content) // 2:
+        content = content[:cut]
+    if content.count("```") % 2:
+        content += "\n```"  # don't leave a code block open
+    return {**section, "content": content + "\n…"}
+
+
+def build_context(matches, token_budget=None):
+    """Turn retrieved matches into prompt sections that fit in ``token_budget`` tokens.
+
+    Consecutive chunks of one path are merged into a single section, text that
+    two chunks share is sent once, and sections are added best-first until the
+    budget is used up; the last one is cut short if it doesn't fit whole.
+    Returns dicts with heading, path, content, chunk_ids and tokens.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    sections, used = [], 0
+    seen_paragraphs = set()
+    for run in merge_matches(matches):
+        heading, content = _section_text(run, seen_paragraphs)
+        if not content:
+            continue
+        section = {
+            "heading": heading,
+            "path": run[0][1]["metadata"].get("path", ""),
+            "content": content,
+            "chunk_ids": [match["metadata"].get("chunk_id") for _, match in run],
+        }
+        tokens = count_tokens(format_section(section))
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining < MIN_SECTION_TOKENS:
+                break
+            section = _trim(section, remaining)
+            tokens = count_tokens(format_section(section))
+        section["tokens"] = tokens
+        sections.append(section)
+        used += tokens
+        if used >= token_budget - MIN_SECTION_TOKENS:
+            break
+    return sections
+
+
+def context_sources(sections):
+    """Paths of the sections that went into the prompt, best first, each once."""
+    return list(dict.fromkeys(section["path"] for section in sections))
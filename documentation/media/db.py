@@ -0,0 +1,622 @@
+import os
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# PostgreSQL connection settings
+PG_HOST = os.getenv("PG_HOST", "127.0.0.1")
+PG_PORT = os.getenv("PG_PORT", "5432")
+PG_USER = os.getenv("PG_USER", "avi")
+PG_PASSWORD = os.getenv("PG_PASSWORD", "root")
+PG_DATABASE = os.getenv("PG_DATABASE", "documents")
+
+# Update dimension to match the all-mpnet-base-v2 model
+VECTOR_DIMENSION = 768  # Changed from 384 to match all-mpnet-base-v2 dimensions
+
+# HNSW build parameters for the embedding index
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+# How new tables store and index embeddings (convert existing ones with `manage.py quantize_embeddings`):
+#   vector  - float32 column and index
+#   halfvec - float16 column and index, about half the size (pgvector 0.7+)
+#   binary  - float16 column with a binary-quantized index, re-ranked on the float16 values (pgvector 0.7+)
+EMBEDDING_STORAGES = ("vector", "halfvec", "binary")
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector").lower()
+
+# Text search configuration of the generated search_vector column (hybrid retrieval)
+TEXT_SEARCH_CONFIG = "english"
+# Full-text search over heading and content; headings weigh more
+SEARCH_VECTOR_SQL = f"""GENERATED ALWAYS AS (
+    setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(heading, '')), 'A') ||
+    setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', content), 'B')
+) STORED"""
+
+# Connection pool settings
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "300"))  # ping idle connections older than this
+
+
+# Helper function for PostgreSQL connection
+def get_db_connection():
+    """Create and return a new (unpooled) connection to the PostgreSQL database."""
+    try:
+        conn = psycopg2.connect(
+            host=PG_HOST,
+            port=PG_PORT,
+            user=PG_USER,
+            password=PG_PASSWORD,
+            dbname=PG_DATABASE
+        )
+        return conn
+    except Exception as e:
+        print(f"Error connecting to PostgreSQL database: {e}")
+        raise
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Connections are borrowed with ``getconn()`` and handed back with
+    ``putconn()``; prefer the ``connection()`` context manager which does both.
+    """
+
+    def __init__(self, connect=get_db_connection, min_size=1, max_size=10,
+                 timeout=10.0, max_idle=300.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (connection, returned_at)
+        self._in_use = set()
+        self._closed = False
+
+        # Stats
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            try:
+                self._idle.append((self._new_connection(), time.monotonic()))
+            except Exception:
+                # The database may not be up yet; connections are opened on demand
+                break
+
+    def _new_connection(self):
+        conn = self._connect()
+        self._created += 1
+        return conn
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use)
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        try:
+            # An idle connection has nothing to read unless the server closed it
+            # (restart, idle timeout, pg_terminate_backend); no round trip needed
+            readable, _, _ = select.select([conn], [], [], 0)
+        except Exception:
+            return False
+        if readable:
+            return False
+        # Only round-trip to the server for connections that sat idle a while,
+        # which also catches a network that dropped them silently
+        if time.monotonic() - returned_at < self.max_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self, timeout=None):
+        """Borrow a connection, waiting up to ``timeout`` seconds for one to free up."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        # Keep its slot while it is checked outside the lock
+                        self._in_use.add(conn)
+                        break
+
+                    if self._size() < self.max_size:
+                        # Reserve the slot before connecting outside the lock
+                        conn = None
+                        placeholder = object()
+                        self._in_use.add(placeholder)
+                        break
+
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No PostgreSQL connection available after {timeout:.1f}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+
+            if conn is None:
+                break
+            # A slow ping only holds up this borrower, not the whole pool
+            healthy = self._is_healthy(conn, returned_at)
+            with self._lock:
+                if healthy:
+                    return self._checkout(conn, started, waited)
+                self._in_use.discard(conn)
+                self._discard(conn)
+                self._lock.notify()
+
+        try:
+            conn = self._new_connection()
+        except Exception:
+            with self._lock:
+                self._in_use.discard(placeholder)
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._in_use.discard(placeholder)
+            return self._checkout(conn, started, waited)
+
+    def _checkout(self, conn, started, waited):
+        wait = time.monotonic() - started
+        self._in_use.add(conn)
+        self._checkouts += 1
+        if waited:
+            self._waits += 1
+        self._wait_time += wait
+        self._max_wait = max(self._max_wait, wait)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection to the pool."""
+        if not (close or conn.closed):
+            try:
+                # Never hand out a connection with an open transaction; the round trip
+                # happens before taking the lock, so other borrowers don't wait on it
+                conn.rollback()
+            except Exception:
+                close = True
+        with self._lock:
+            self._in_use.discard(conn)
+            if close or self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_ms": round(self._wait_time * 1000, 3),
+                "avg_wait_ms": round(self._wait_time * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    min_size=PG_POOL_MIN_SIZE,
+                    max_size=PG_POOL_MAX_SIZE,
+                    timeout=PG_POOL_TIMEOUT,
+                    max_idle=PG_POOL_MAX_IDLE,
+                )
+    return _pool
+
+
+def pooled_connection(timeout=None):
+    """Context manager that borrows a connection from the shared pool."""
+    return get_pool().connection(timeout)
+
+
+# Setup pgvector and required tables
+def setup_pgvector():
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            # Create extension if it doesn't exist
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            conn.commit()
+            
+            # Check if the documents table exists
+            cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_schema = 'public'
+                AND table_name = 'documents'
+            );
+            """)
+            table_exists = cursor.fetchone()[0]
+            
+            if not table_exists:
+                storage = EMBEDDING_STORAGE
+                if storage not in EMBEDDING_STORAGES:
+                    print(f"Unknown EMBEDDING_STORAGE '{storage}', using vector")
+                    storage = "vector"
+                elif storage != "vector" and not pgvector_supports_halfvec(cursor):
+                    print(f"EMBEDDING_STORAGE={storage} needs pgvector 0.7+, using vector")
+                    storage = "vector"
+                
+                # Create documents table with the correct schema
+                cursor.execute(f"""
+                CREATE TABLE documents (
+                    id SERIAL PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    doc_type TEXT NOT NULL,
+                    heading TEXT,
+                    path TEXT,
+                    url TEXT,
+                    content TEXT NOT NULL,
+                    chunk_id INTEGER,
+                    total_chunks INTEGER,
+                    level INTEGER,
+                    content_hash TEXT,
+                    embedding {embedding_column_type(storage)} NOT NULL,
+                    search_vector TSVECTOR {SEARCH_VECTOR_SQL}
+                );
+                """)
+                conn.commit()
+                
+                # Create indices after table is created. HNSW needs no training data,
+                # so unlike ivfflat it can be built on the empty table; use the
+                # build_vector_index command to rebuild or resize it later.
+                if pgvector_supports_hnsw(cursor):
+                    cursor.execute(f"""
+                    CREATE INDEX IF NOT EXISTS documents_embedding_idx 
+                    ON documents 
+                    USING hnsw ({embedding_index_sql(storage)}) 
+                    WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
+                    """)
+                    conn.commit()
+                else:
+                    print("pgvector < 0.5 has no HNSW; run `manage.py build_vector_index` once documents are loaded")
+                
+                cursor.execute("CREATE INDEX IF NOT EXISTS documents_namespace_idx ON documents (namespace);")
+                # One row per (namespace, path, chunk_id) so ingestion can upsert
+                cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS documents_chunk_key ON documents (namespace, path, chunk_id);")
+                cursor.execute("CREATE INDEX IF NOT EXISTS documents_search_idx ON documents USING gin (search_vector);")
+                conn.commit()
+                
+                print("Database table created with proper schema")
+            else:
+                print("Using existing documents table")
+            
+            # Bumped whenever the cached answers of a namespace go out of date (see answer_cache.py)
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS namespace_generations (
+                namespace TEXT PRIMARY KEY,
+                generation BIGINT NOT NULL DEFAULT 0
+            );
+            """)
+            conn.commit()
+            
+            # Upgrading an existing table rewrites or locks it, so that is left to `manage.py upgrade_documents`
+            use_pending_upgrades(pending_schema_upgrades(cursor))
+            if _pending_upgrades:
+                print(f"documents needs {', '.join(_pending_upgrades)}; run `manage.py upgrade_documents`")
+            
+            use_embedding_storage(detect_embedding_storage(cursor))
+            if EMBEDDING_STORAGE in EMBEDDING_STORAGES and EMBEDDING_STORAGE != _embedding_storage:
+                print(f"documents stores {_embedding_storage} embeddings; run `manage.py quantize_embeddings "
+                      f"--storage {EMBEDDING_STORAGE}` to convert")
+                
+    except Exception as e:
+        conn.rollback()
+        print(f"Error setting up database: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def pgvector_version(cursor):
+    """Installed pgvector version as a tuple of ints, e.g. (0, 7, 0)."""
+    cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+    row = cursor.fetchone()
+    if not row:
+        return (0,)
+    return tuple(int(part) for part in row[0].split(".") if part.isdigit())
+
+
+def pgvector_supports_hnsw(cursor):
+    return pgvector_version(cursor) >= (0, 5, 0)
+
+
+def pgvector_supports_halfvec(cursor):
+    return pgvector_version(cursor) >= (0, 7, 0)
+
+
+def embedding_column_type(storage):
+    return f"{'VECTOR' if storage == 'vector' else 'HALFVEC'}({VECTOR_DIMENSION})"
+
+
+def embedding_index_sql(storage):
+    """Indexed expression and operator class of the embedding indexes for a storage mode."""
+    if storage == "halfvec":
+        return "embedding halfvec_cosine_ops"
+    if storage == "binary":
+        return f"(binary_quantize(embedding)::bit({VECTOR_DIMENSION})) bit_hamming_ops"
+    return "embedding vector_cosine_ops"
+
+
+def detect_embedding_storage(cursor):
+    """Storage mode of the documents table, from the column type and the main index."""
+    cursor.execute("""
+    SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+    WHERE attrelid = 'documents'::regclass AND attname = 'embedding';
+    """)
+    row = cursor.fetchone()
+    if not row or not row[0].startswith("halfvec"):
+        return "vector"
+    cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = 'documents' AND indexname = 'documents_embedding_idx';")
+    row = cursor.fetchone()
+    if row and "binary_quantize" in row[0]:
+        return "binary"
+    return "halfvec"
+
+
+_embedding_storage = "vector"
+
+
+def embedding_storage():
+    """Storage mode in use, as detected by ``setup_pgvector()``."""
+    return _embedding_storage
+
+
+def use_embedding_storage(storage):
+    global _embedding_storage
+    _embedding_storage = storage
+
+
+def _index_state(cursor, name):
+    """True for a valid index, False for one left invalid by a failed concurrent build, None if missing."""
+    cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s);", (name,))
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def _column_exists(cursor, column):
+    cursor.execute("""
+    SELECT EXISTS (
+        SELECT FROM information_schema.columns
+        WHERE table_schema = 'public'
+        AND table_name = 'documents'
+        AND column_name = %s
+    );
+    """, (column,))
+    return cursor.fetchone()[0]
+
+
+def pending_schema_upgrades(cursor):
+    """What ``upgrade_documents_schema()`` still has to add to the documents table."""
+    pending = []
+    if not _column_exists(cursor, "content_hash"):
+        pending.append("content_hash")
+    if not _index_state(cursor, "documents_chunk_key"):
+        pending.append("documents_chunk_key")
+    if not _column_exists(cursor, "search_vector"):
+        pending.append("search_vector")
+    if not _index_state(cursor, "documents_search_idx"):
+        pending.append("documents_search_idx")
+    return pending
+
+
+_pending_upgrades = []
+
+
+def pending_upgrades():
+    """Schema upgrades the documents table is missing, as found by ``setup_pgvector()``."""
+    return list(_pending_upgrades)
+
+
+def use_pending_upgrades(pending):
+    global _pending_upgrades
+    _pending_upgrades = list(pending)
+
+
+def _dedupe_chunks(cursor, log):
+    """Give every row a (namespace, path, chunk_id) key and keep the newest row of each key.
+
+    Older ingestion runs appended duplicates and could leave path or chunk_id NULL.
+    NULL paths become '' and rows without a chunk_id are numbered after the
+    chunk_ids of their path, in insertion order, as ``ingest_documents`` does;
+    copies of the same content under a NULL chunk_id are dropped first.
+    """
+    cursor.execute("UPDATE documents SET path = '' WHERE path IS NULL;")
+    if cursor.rowcount:
+        log(f"Set an empty path on {cursor.rowcount} chunks")
+    cursor.execute("""
+    DELETE FROM documents d
+    USING documents newer
+    WHERE d.chunk_id IS NULL AND newer.chunk_id IS NULL
+    AND d.namespace = newer.namespace
+    AND d.path = newer.path
+    AND md5(d.content) = md5(newer.content)
+    AND d.id < newer.id;
+    """)
+    if cursor.rowcount:
+        log(f"Removed {cursor.rowcount} duplicate chunks without a chunk_id")
+    cursor.execute("""
+    UPDATE documents d
+    SET chunk_id = numbered.chunk_id
+    FROM (
+        SELECT id, row_number() OVER (PARTITION BY namespace, path ORDER BY id) - 1 + coalesce((
+            SELECT max(chunk_id) + 1 FROM documents keyed
+            WHERE keyed.namespace = unnumbered.namespace AND keyed.path = unnumbered.path
+        ), 0) AS chunk_id
+        FROM documents unnumbered
+        WHERE chunk_id IS NULL
+    ) numbered
+    WHERE d.id = numbered.id;
+    """)
+    if cursor.rowcount:
+        log(f"Numbered {cursor.rowcount} chunks without a chunk_id")
+    cursor.execute("""
+    DELETE FROM documents d
+    USING documents newer
+    WHERE d.namespace = newer.namespace
+    AND d.path = newer.path
+    AND d.chunk_id = newer.chunk_id
+    AND d.id < newer.id;
+    """)
+    if cursor.rowcount:
+        log(f"Removed {cursor.rowcount} duplicate chunks")
+
+
+def upgrade_documents_schema(log=print):
+    """Bring an existing documents table up to date; safe to run repeatedly.
+
+    Meant to be run once per deployment (``manage.py upgrade_documents``), not
+    from a request: it deletes duplicate rows, rewrites the table to add the
+    full-text column and builds indexes. Indexes are built concurrently so
+    reads and writes carry on meanwhile. Returns the upgrades that were applied.
+    """
+    ensure_pgvector()
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    applied = []
+    try:
+        with conn.cursor() as cursor:
+            pending = pending_schema_upgrades(cursor)
+
+            # Content hash for incremental re-ingestion; a nullable column without a default is only a catalog change
+            if "content_hash" in pending:
+                cursor.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+                log("Added documents.content_hash")
+                applied.append("content_hash")
+
+            if "documents_chunk_key" in pending:
+                cursor.execute("BEGIN;")
+                _dedupe_chunks(cursor, log)
+                cursor.execute("COMMIT;")
+                # Leftover from an interrupted build
+                cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS documents_chunk_key;")
+                log("Building documents_chunk_key...")
+                cursor.execute(
+                    "CREATE UNIQUE INDEX CONCURRENTLY documents_chunk_key ON documents (namespace, path, chunk_id);")
+                applied.append("documents_chunk_key")
+
+            # Full-text search for hybrid retrieval. A stored generated column rewrites the
+            # table under an ACCESS EXCLUSIVE lock, so reads and writes wait until it is done
+            if "search_vector" in pending:
+                log("Adding full-text search column to documents (rewrites the table once)...")
+                cursor.execute(f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector TSVECTOR {SEARCH_VECTOR_SQL};")
+                applied.append("search_vector")
+
+            if "documents_search_idx" in pending:
+                cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS documents_search_idx;")
+                log("Building documents_search_idx...")
+                cursor.execute("CREATE INDEX CONCURRENTLY documents_search_idx ON documents USING gin (search_vector);")
+                applied.append("documents_search_idx")
+
+            use_pending_upgrades(pending_schema_upgrades(cursor))
+    finally:
+        conn.close()
+    return applied
+
+
+_pgvector_ready = False
+_pgvector_lock = threading.Lock()
+
+
+def ensure_pgvector():
+    """Run ``setup_pgvector()`` once per process, on first use rather than at import time.
+
+    A failed attempt is retried on the next call.
+    """
+    global _pgvector_ready
+    if _pgvector_ready:
+        return
+    with _pgvector_lock:
+        if not _pgvector_ready:
+            setup_pgvector()
+            _pgvector_ready = True
+            print("✅ pgvector setup complete")
+
+
+def pgvector_ready():
+    return _pgvector_ready
@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .models import DocumentationFile
+
+# Load environment variables
+load_dotenv()
+
+# Cached documentation texts for copy_doc_text / copy_ai_summary
+DOC_TEXT_CACHE_SIZE = int(os.getenv("DOC_TEXT_CACHE_SIZE", "256"))
+# Name lookups are invalidated by post_save in this process only; other worker processes
+# keep serving an old upload for up to this many seconds (0 means until they restart)
+DOC_TEXT_CACHE_TTL = int(os.getenv("DOC_TEXT_CACHE_TTL", "60"))
+
+_NOT_FOUND = "not-found"
+
+
+def _file_path(field):
+    try:
+        return field.path if field else None
+    except Exception as e:
+        print(f"❌ ERROR: {str(e)}")
+        return None
+
+
+def text_etag(text):
+    return '"' + hashlib.sha1(text.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+class DocumentTextCache:
+    """Process-level cache of documentation file texts.
+
+    ``document()`` maps a name to the file paths of its DocumentationFile, so a
+    click doesn't hit the ORM; ``read()`` keys file texts by path, mtime and
+    size, so a re-uploaded file is picked up on the next request without any
+    invalidation. Each text carries an ETag and its mtime for conditional GETs.
+    """
+
+    def __init__(self, max_size=256, ttl=60):
+        self.documents = LRUCache(max_size=max_size, ttl=ttl)
+        self.texts = LRUCache(max_size=max_size)
+
+    def document(self, name):
+        """Return ``{"name", "doc_type", "documentation_path", "ai_documentation_path"}`` or None."""
+        key = name.lower()
+        info = self.documents.get(key)
+        if info is None:
+            try:
+                doc = DocumentationFile.objects.get(name__iexact=name)
+            except DocumentationFile.DoesNotExist:
+                self.documents.set(key, _NOT_FOUND)
+                return None
+            info = {
+                "name": doc.name,
+                "doc_type": doc.doc_type,
+                "documentation_path": _file_path(doc.documentation_file),
+                "ai_documentation_path": _file_path(doc.ai_documentation_file),
+            }
+            self.documents.set(key, info)
+        return None if info == _NOT_FOUND else info
+
+    def read(self, path):
+        """Return ``(text, etag, mtime)`` for a file, or None if it doesn't exist."""
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        entry = self.texts.get(key)
+        if entry is None:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            entry = (text, text_etag(text), int(stat.st_mtime))
+            self.texts.set(key, entry)
+        return entry
+
+    def invalidate(self):
+        """Forget every name lookup; called when a DocumentationFile is saved or deleted."""
+        self.documents.clear()
+
+    def stats(self):
+        return {
+            "documents": self.documents.stats(),
+            "texts": self.texts.stats(),
+        }
+
+
+doc_text_cache = DocumentTextCache(max_size=DOC_TEXT_CACHE_SIZE, ttl=DOC_TEXT_CACHE_TTL)
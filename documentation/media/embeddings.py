@@ -0,0 +1,294 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.core.cache import caches
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .metrics import record_cache, span
+
+# Load environment variables
+load_dotenv()
+
+# Use the same model as in pgvector.ipynb
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-mpnet-base-v2")
+
+# Question embedding cache settings
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))  # seconds
+# Name of a Django cache alias (e.g. "default") to share embeddings across workers; empty disables it
+EMBEDDING_CACHE_ALIAS = os.getenv("EMBEDDING_CACHE_ALIAS", "")
+
+# Micro-batching of concurrent encode calls
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "true").lower() in ("1", "true", "yes")
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+
+_model = None
+_device = None
+_model_lock = threading.Lock()
+
+
+def get_torch_device():
+    """Pick the device the embedding model runs on (EMBEDDING_DEVICE overrides auto-detection)."""
+    global _device
+    if _device is None:
+        device = os.getenv("EMBEDDING_DEVICE")
+        if not device:
+            import torch
+            if torch.cuda.is_available():
+                device = "cuda"
+            elif getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+                device = "mps"
+            else:
+                device = "cpu"
+        _device = device
+    return _device
+
+
+def get_ml_model():
+    """Return the SentenceTransformer, loading it on first use.
+
+    Importing sentence_transformers and loading the weights takes seconds, so
+    it is deferred until a request (or the background warm-up) needs it.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                started = time.monotonic()
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=get_torch_device())
+                print(f"✅ Loaded {EMBEDDING_MODEL_NAME} on {get_torch_device()} in {time.monotonic() - started:.1f}s")
+    return _model
+
+
+def ml_model_loaded():
+    return _model is not None
+
+
+def normalize_question(question):
+    """Collapse whitespace so trivially different questions share a cache entry."""
+    return re.sub(r"\s+", " ", question).strip()
+
+
+class EmbeddingCache:
+    """Question embedding cache with a local LRU/TTL tier and an optional shared Django cache tier."""
+
+    def __init__(self, model_name, max_size=2048, ttl=86400, shared_alias=""):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.shared_alias = shared_alias
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def make_key(self, question):
+        digest = hashlib.sha1(f"{self.model_name}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+        return f"qemb:{digest}"
+
+    def _shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, question):
+        key = self.make_key(question)
+        vector = self.local.get(key)
+        if vector is not None:
+            return vector
+
+        shared = self._shared()
+        if shared is None:
+            return None
+        try:
+            raw = shared.get(key)
+        except Exception as e:
+            print(f"Error reading shared embedding cache: {e}")
+            return None
+        if raw is None:
+            self.shared_misses += 1
+            return None
+        self.shared_hits += 1
+        vector = np.frombuffer(raw, dtype=np.float32).tolist()
+        self.local.set(key, vector)
+        return vector
+
+    def set(self, question, vector):
+        key = self.make_key(question)
+        vector = list(vector)
+        self.local.set(key, vector)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(key, np.asarray(vector, dtype=np.float32).tobytes(), self.ttl)
+            except Exception as e:
+                print(f"Error writing shared embedding cache: {e}")
+
+    def stats(self):
+        stats = self.local.stats()
+        stats["shared_alias"] = self.shared_alias or None
+        stats["shared_hits"] = self.shared_hits
+        stats["shared_misses"] = self.shared_misses
+        return stats
+
+
+embedding_cache = EmbeddingCache(
+    EMBEDDING_MODEL_NAME,
+    max_size=EMBEDDING_CACHE_SIZE,
+    ttl=EMBEDDING_CACHE_TTL,
+    shared_alias=EMBEDDING_CACHE_ALIAS,
+)
+
+
+class EmbeddingBatcher:
+    """Collects concurrent encode requests and runs them as one batched forward pass.
+
+    A background thread takes the first waiting text, keeps collecting for up
+    to ``window_ms`` or until ``max_batch_size`` texts are queued, encodes them
+    together and resolves each caller's future with its own vector.
+    """
+
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+    def __init__(self, encode_batch, max_batch_size=32, window_ms=5.0):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = {bucket: 0 for bucket in self.BATCH_SIZE_BUCKETS}
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_encode_time = 0.0
+        self.errors = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text):
+        """Queue ``text`` for encoding and return a Future for its vector (a list of floats)."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def encode(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+
+            # Identical texts in one batch are encoded once
+            unique_texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = self.encode_batch(unique_texts)
+                by_text = {text: vectors[i].tolist() for i, text in enumerate(unique_texts)}
+                for text, future, _ in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                print(f"Error encoding embedding batch: {e}")
+                with self._stats_lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            self._record(batch, started, time.monotonic() - started)
+
+    def _record(self, batch, started, encode_time):
+        size = len(batch)
+        with self._stats_lock:
+            self.batches += 1
+            self.items += size
+            self.max_batch_seen = max(self.max_batch_seen, size)
+            for bucket in self.BATCH_SIZE_BUCKETS:
+                if size <= bucket:
+                    self.batch_size_counts[bucket] += 1
+                    break
+            for _, _, queued_at in batch:
+                wait = started - queued_at
+                self.total_queue_wait += wait
+                self.max_queue_wait = max(self.max_queue_wait, wait)
+            self.total_encode_time += encode_time
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window * 1000,
+                "batches": self.batches,
+                "items": self.items,
+                "queued": self._queue.qsize(),
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "batch_size_counts": {f"<={bucket}": count for bucket, count in self.batch_size_counts.items()},
+                "avg_queue_wait_ms": round(self.total_queue_wait * 1000 / self.items, 3) if self.items else 0.0,
+                "max_queue_wait_ms": round(self.max_queue_wait * 1000, 3),
+                "avg_encode_ms": round(self.total_encode_time * 1000 / self.batches, 3) if self.batches else 0.0,
+                "errors": self.errors,
+            }
+
+
+embedding_batcher = EmbeddingBatcher(
+    lambda texts: get_ml_model().encode(texts),
+    max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+    window_ms=EMBEDDING_BATCH_WINDOW_MS,
+)
+
+
+def encode_question(question):
+    """Return the embedding for a chat question as a list, using the cache when possible."""
+    vector = embedding_cache.get(question)
+    record_cache("embedding", vector is not None)
+    if vector is None:
+        with span("encode"):
+            if EMBEDDING_BATCHING:
+                vector = embedding_batcher.encode(normalize_question(question))
+            else:
+                vector = get_ml_model().encode(normalize_question(question)).tolist()
+        embedding_cache.set(question, vector)
+    return vector
+
+
+def encode_questions(questions, batch_size=64):
+    """Embeddings for many questions: cache hits are reused, the rest go through the model in one call."""
+    vectors = [embedding_cache.get(question) for question in questions]
+    missing = list(dict.fromkeys(question for question, vector in zip(questions, vectors) if vector is None))
+    if missing:
+        encoded = get_ml_model().encode([normalize_question(question) for question in missing], batch_size=batch_size)
+        by_question = {question: encoded[i].tolist() for i, question in enumerate(missing)}
+        for question, vector in by_question.items():
+            embedding_cache.set(question, vector)
+        vectors = [vector if vector is not None else by_question[question] for question, vector in zip(questions, vectors)]
+    return vectors
@@ -0,0 +1,381 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .answer_cache import answer_cache
+from .db import VECTOR_DIMENSION, ensure_pgvector, get_pool, pending_upgrades
+from .embeddings import get_ml_model
+from .memory_index import memory_index
+from .vector_index import ensure_namespace_index
+
+# Load environment variables
+load_dotenv()
+
+# Number of chunks encoded and written per transaction
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+# Columns written by COPY, in order
+COPY_COLUMNS = (
+    "namespace", "doc_type", "heading", "path", "url", "content",
+    "chunk_id", "total_chunks", "level", "content_hash", "embedding",
+)
+
+# Columns refreshed when an existing chunk changed
+UPSERT_COLUMNS = [column for column in COPY_COLUMNS if column not in ("namespace", "path", "chunk_id")]
+
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def embedding_text(doc):
+    """Text that gets embedded for a chunk: its heading followed by its content."""
+    return f"{doc.get('heading', '')}\n\n{doc.get('content', '')}"
+
+
+def content_hash(doc):
+    """Hash of everything stored for a chunk except its embedding."""
+    fields = [doc.get(key) for key in ("doc_type", "heading", "url", "content", "total_chunks", "level")]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def prepare_document(doc, namespace, doc_type, chunk_counters):
+    """Resolve defaults for one chunk and attach its content hash.
+
+    Chunks without a ``chunk_id`` are numbered in the order they appear within their path.
+    """
+    doc = dict(doc)
+    doc["namespace"] = doc.get("namespace") or namespace
+    doc["doc_type"] = doc.get("doc_type") or doc_type
+    if not doc["namespace"] or not doc["doc_type"]:
+        raise ValueError("Missing namespace or doc_type")
+    if not doc.get("content"):
+        raise ValueError(f"Chunk {doc.get('path', '')!r} has no content")
+    doc["path"] = doc.get("path") or ""
+    doc["heading"] = doc.get("heading") or ""
+    doc["url"] = doc.get("url") or ""
+    doc["level"] = doc.get("level", 1)
+
+    counter_key = (doc["namespace"], doc["path"])
+    if doc.get("chunk_id") is None:
+        doc["chunk_id"] = chunk_counters.get(counter_key, 0)
+    chunk_counters[counter_key] = int(doc["chunk_id"]) + 1
+
+    doc["content_hash"] = content_hash(doc)
+    return doc
+
+
+def chunk_key(doc):
+    return (doc["namespace"], doc["path"], int(doc["chunk_id"]))
+
+
+def iter_ndjson(lines):
+    """Yield one document per non-empty line of NDJSON (``lines`` may yield bytes or str)."""
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+
+
+def iter_json_array(fp, chunk_size=1 << 16):
+    """Incrementally yield the objects of the first JSON array in a text file.
+
+    Works for a bare ``[...]`` file as well as ``{"documents": [...]}`` without
+    loading the whole file into memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    in_array = False
+    eof = False
+
+    while True:
+        if not eof and len(buffer) < chunk_size:
+            data = fp.read(chunk_size)
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            if not data:
+                eof = True
+            buffer += data
+
+        if not in_array:
+            start = buffer.find("[")
+            if start == -1:
+                if eof:
+                    return
+                buffer = ""
+                continue
+            buffer = buffer[start + 1:]
+            in_array = True
+
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        if not buffer:
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Object continues past the buffer; read more before retrying
+            data = fp.read(chunk_size)
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            if not data:
+                eof = True
+            buffer += data
+            continue
+        buffer = buffer[end:]
+        yield item
+
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BinaryCopyBuffer:
+    """Builds a PostgreSQL binary COPY stream for rows of the documents table."""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        # Signature, flags, header extension length
+        self._buffer.write(_COPY_SIGNATURE + struct.pack("!ii", 0, 0))
+
+    def _text(self, value):
+        if value is None:
+            self._buffer.write(struct.pack("!i", -1))
+            return
+        data = str(value).encode("utf-8")
+        self._buffer.write(struct.pack("!i", len(data)))
+        self._buffer.write(data)
+
+    def _int(self, value):
+        if value is None:
+            self._buffer.write(struct.pack("!i", -1))
+            return
+        self._buffer.write(struct.pack("!ii", 4, int(value)))
+
+    def _vector(self, values):
+        # pgvector binary format: int16 dimensions, int16 unused, float4 values
+        values = np.asarray(values, dtype=">f4")
+        self._buffer.write(struct.pack("!ihh", 4 + 4 * len(values), len(values), 0))
+        self._buffer.write(values.tobytes())
+
+    def add_row(self, doc, embedding):
+        self._buffer.write(struct.pack("!h", len(COPY_COLUMNS)))
+        self._text(doc["namespace"])
+        self._text(doc["doc_type"])
+        self._text(doc.get("heading", ""))
+        self._text(doc.get("path", ""))
+        self._text(doc.get("url", ""))
+        self._text(doc.get("content", ""))
+        self._int(doc.get("chunk_id"))
+        self._int(doc.get("total_chunks"))
+        self._int(doc.get("level", 1))
+        self._text(doc.get("content_hash"))
+        self._vector(embedding)
+
+    def finish(self):
+        self._buffer.write(struct.pack("!h", -1))
+        self._buffer.seek(0)
+        return self._buffer
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.documents = 0
+        self.embedded = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.batches = 0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self.namespaces = set()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            "count": self.documents,
+            "embedded": self.embedded,
+            "unchanged": self.unchanged,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "namespaces": sorted(self.namespaces),
+            "seconds": round(elapsed, 3),
+            "encode_seconds": round(self.encode_seconds, 3),
+            "write_seconds": round(self.write_seconds, 3),
+            "docs_per_second": round(self.documents / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def _create_stage_table(cursor):
+    cursor.execute(f"""
+    CREATE TEMP TABLE IF NOT EXISTS documents_stage (
+        namespace TEXT,
+        doc_type TEXT,
+        heading TEXT,
+        path TEXT,
+        url TEXT,
+        content TEXT,
+        chunk_id INTEGER,
+        total_chunks INTEGER,
+        level INTEGER,
+        content_hash TEXT,
+        embedding VECTOR({VECTOR_DIMENSION})
+    ) ON COMMIT DELETE ROWS;
+    """)
+
+
+def _existing_hashes(cursor, keys):
+    """Map (namespace, path, chunk_id) -> content_hash for the keys already stored."""
+    cursor.execute("""
+        SELECT d.namespace, d.path, d.chunk_id, d.content_hash
+        FROM documents d
+        JOIN unnest(%s::text[], %s::text[], %s::int[]) AS k(namespace, path, chunk_id)
+        ON d.namespace = k.namespace AND d.path = k.path AND d.chunk_id = k.chunk_id
+    """, ([k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys]))
+    return {(row[0], row[1], row[2]): row[3] for row in cursor.fetchall()}
+
+
+def _delete_missing(cursor, namespace, seen_keys):
+    """Delete chunks of ``namespace`` that were not part of this ingestion run."""
+    paths = [key[1] for key in seen_keys]
+    chunk_ids = [key[2] for key in seen_keys]
+    cursor.execute("""
+        DELETE FROM documents d
+        WHERE d.namespace = %s
+        AND NOT EXISTS (
+            SELECT 1 FROM unnest(%s::text[], %s::int[]) AS k(path, chunk_id)
+            WHERE k.path = d.path AND k.chunk_id = d.chunk_id
+        )
+    """, (namespace, paths, chunk_ids))
+    return cursor.rowcount
+
+
+def ingest_documents(documents, namespace, doc_type, batch_size=INGEST_BATCH_SIZE, progress=None, sync=False):
+    """Encode and upsert an iterable of chunks, one batch and one transaction at a time.
+
+    Only ``batch_size`` chunks are held in memory at once. Each document may set
+    its own ``namespace``/``doc_type``; otherwise the arguments are used.
+    Chunks are keyed on (namespace, path, chunk_id): unchanged chunks (same
+    content hash) are skipped without re-embedding, new or changed ones are
+    upserted. With ``sync=True`` the input is treated as the full source for
+    its namespaces and stored chunks that did not appear are deleted.
+    ``progress`` is called with the running ``IngestStats`` after every batch.
+    """
+    ensure_pgvector()
+    if "documents_chunk_key" in pending_upgrades():
+        raise ValueError("The documents table has no (namespace, path, chunk_id) key yet; run `manage.py upgrade_documents`")
+    model = get_ml_model()
+    pool = get_pool()
+    stats = IngestStats()
+    chunk_counters = {}
+    seen_keys = {}  # namespace -> set of (namespace, path, chunk_id), only kept for sync
+
+    for batch in iter_batches(documents, batch_size):
+        # Later copies of the same chunk in a batch win
+        prepared = {}
+        for doc in batch:
+            doc = prepare_document(doc, namespace, doc_type, chunk_counters)
+            prepared[chunk_key(doc)] = doc
+        keys = list(prepared)
+
+        # A new namespace gets its own partial vector index before its first rows land
+        for batch_namespace in {key[0] for key in keys}:
+            ensure_namespace_index(batch_namespace)
+
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                existing = _existing_hashes(cursor, keys)
+                changed = [prepared[key] for key in keys if existing.get(key) != prepared[key]["content_hash"]]
+
+                if changed:
+                    started = time.monotonic()
+                    embeddings = model.encode([embedding_text(doc) for doc in changed], batch_size=min(len(changed), 64))
+                    stats.encode_seconds += time.monotonic() - started
+
+                    started = time.monotonic()
+                    copy_buffer = BinaryCopyBuffer()
+                    for doc, embedding in zip(changed, embeddings):
+                        copy_buffer.add_row(doc, embedding)
+
+                    _create_stage_table(cursor)
+                    cursor.copy_expert(
+                        f"COPY documents_stage ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT binary)",
+                        copy_buffer.finish()
+                    )
+                    columns = ", ".join(COPY_COLUMNS)
+                    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in UPSERT_COLUMNS)
+                    cursor.execute(f"""
+                        INSERT INTO documents ({columns})
+                        SELECT {columns} FROM documents_stage
+                        ON CONFLICT (namespace, path, chunk_id) DO UPDATE SET {updates}
+                    """)
+                    stats.write_seconds += time.monotonic() - started
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+        batch_namespaces = {key[0] for key in keys}
+        stats.documents += len(batch)
+        stats.embedded += len(changed)
+        stats.unchanged += len(keys) - len(changed)
+        stats.batches += 1
+        stats.namespaces |= batch_namespaces
+        # Cached answers for these namespaces may now be out of date
+        for changed_namespace in {doc["namespace"] for doc in changed}:
+            answer_cache.invalidate(changed_namespace)
+            memory_index.mark_stale(changed_namespace)
+        if sync:
+            for key in keys:
+                seen_keys.setdefault(key[0], set()).add(key)
+        if progress:
+            progress(stats)
+
+    if sync and seen_keys:
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                for seen_namespace, keys in seen_keys.items():
+                    deleted = _delete_missing(cursor, seen_namespace, keys)
+                    stats.deleted += deleted
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+        for seen_namespace in seen_keys:
+            answer_cache.invalidate(seen_namespace)
+            memory_index.mark_stale(seen_namespace)
+
+    return stats
@@ -0,0 +1,609 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+from .metrics import current_trace, record_tokens
+
+# Load environment variables
+load_dotenv()
+
+# "groq" calls the Groq API; "fake" answers locally (for load tests and development)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+# Provider limits; the scheduler keeps under both
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+# Calls in flight at once, and requests allowed to wait for one
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+# Seconds a chat request may wait for the LLM (queueing, rate limits and retries included)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # seconds
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))  # seconds
+# Seconds a streamed answer may take to be read; its call slot is held until then
+LLM_STREAM_TIMEOUT = float(os.getenv("LLM_STREAM_TIMEOUT", "300"))
+# Fake provider behaviour
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailable(Exception):
+    """The scheduler couldn't get an answer in time; callers should degrade, not fail."""
+
+
+class LLMOverloaded(LLMUnavailable):
+    """Rejected at admission: the queue is full or the wait would exceed the deadline."""
+
+
+class LLMTimeout(LLMUnavailable):
+    """The request's deadline passed while it was queued, rate limited or retrying."""
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """Rough token count of a request (about 4 characters per token) plus its completion budget.
+
+    Good enough for rate limiting; the bucket is corrected with the reported usage afterwards.
+    """
+    prompt = sum(len(message.get("content") or "") // 4 + 4 for message in messages)
+    return prompt + (max_tokens or 0)
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units a minute, holding at most ``capacity``.
+
+    Not thread-safe on its own; RateLimiter locks around it.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` units are available (after ``refill``)."""
+        amount = min(amount, self.capacity)  # a huge request waits for a full bucket, not forever
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate else float("inf")
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets, taken together."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self, tokens, requests=1):
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.requests.wait_time(requests), self.tokens.wait_time(tokens), self.paused_until - now)
+
+    def projected_wait(self, tokens, requests=1):
+        """Seconds before ``requests`` calls using ``tokens`` could start, ignoring other waiters."""
+        with self._lock:
+            return self._wait_time(tokens, requests)
+
+    def acquire(self, tokens, deadline):
+        """Block until one request of ``tokens`` fits in both buckets; False if that's after ``deadline``."""
+        while True:
+            with self._lock:
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def settle(self, estimated, actual):
+        """Give back (or charge) the difference between estimated and reported tokens."""
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+
+    def pause(self, seconds):
+        """Stop starting calls for ``seconds``, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            self._wait_time(0)
+            return {
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            }
+
+
+class GroqProvider:
+    """Synchronous Groq client; the scheduler's worker threads are its only callers."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from groq import Groq
+                    # The scheduler does the retrying
+                    self._client = Groq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+        return self._client
+
+    def complete(self, messages, **params):
+        return self.client.chat.completions.create(messages=messages, **params)
+
+    def stream(self, messages, **params):
+        return self.client.chat.completions.create(messages=messages, stream=True, **params)
+
+
+class FakeProviderError(Exception):
+    def __init__(self, message, status_code=503, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class FakeProvider:
+    """Local stand-in for Groq with the same response shape.
+
+    Sleeps ``latency_ms`` per call (jittered) and fails ``error_rate`` of the
+    calls with a retryable 503, so the scheduler can be exercised without a key.
+    """
+
+    def __init__(self, latency_ms=300, error_rate=0.0, tokens_per_second=400):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, messages):
+        question = messages[-1].get("content", "") if messages else ""
+        question = question.split("\n", 1)[0].replace("Question: ", "")
+        return f"This is a fake answer to: {question}\n\nCited documentation sections:\nSection: Fake section"
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeProviderError("fake provider overloaded", status_code=503)
+
+    def complete(self, messages, **params):
+        self._call()
+        answer = self._answer(messages)
+        prompt_tokens = estimate_tokens(messages)
+        completion_tokens = len(answer) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=answer))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+        )
+
+    def stream(self, messages, **params):
+        self._call()
+        answer = self._answer(messages)
+
+        def chunks():
+            for word in answer.split(" "):
+                time.sleep(1.0 / self.tokens_per_second)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+        return chunks()
+
+
+def is_retryable(error):
+    if isinstance(error, FakeProviderError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    try:
+        import groq
+    except ImportError:
+        groq = None
+    if groq is not None and isinstance(error, (groq.APIConnectionError, groq.APITimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after(error):
+    """Seconds from a Retry-After header (or attribute), if the provider sent one."""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, maximum=8.0):
+    """Full-jitter exponential backoff: uniform between 0 and ``base * 2**attempt`` (capped)."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class _Stream:
+    """A provider's chunk iterator that reports when it is done with.
+
+    ``finished`` is set once the chunks run out, reading them fails, or the
+    iterator is closed or garbage collected by an abandoned response.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.finished = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.finished.is_set():
+            return
+        self.finished.set()
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def __del__(self):
+        self.close()
+
+
+def _close_abandoned_stream(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class _Job:
+    __slots__ = ("messages", "params", "stream", "priority", "deadline", "key", "future", "tokens", "queued_at", "trace")
+
+    def __init__(self, messages, params, stream, priority, deadline, key):
+        self.messages = messages
+        self.params = params
+        self.stream = stream
+        self.priority = priority
+        self.deadline = deadline
+        self.key = key
+        self.future = Future()
+        # Running futures can't be cancelled, so one caller giving up (e.g. asyncio.wait_for) leaves the rest waiting
+        self.future.set_running_or_notify_cancel()
+        self.tokens = estimate_tokens(messages, params.get("max_tokens"))
+        self.queued_at = time.monotonic()
+        # The submitting request's trace (if sampled), filled in from the worker thread
+        self.trace = current_trace()
+
+
+class LLMScheduler:
+    """Owns the LLM provider and decides when each chat completion runs.
+
+    Requests wait in a bounded priority queue (interactive before batch, then
+    first come first served) and are refused up front when the queue is full
+    or the rate limits mean they couldn't start before their deadline. Worker
+    threads take them off the queue, wait for the request and token buckets,
+    and retry retryable failures with jittered backoff until the deadline.
+    Identical non-streaming requests in flight share one call, which runs until
+    the latest of their deadlines while each caller waits only its own timeout.
+    A streamed answer keeps its slot until it has been read, so at most
+    ``max_concurrency`` calls, streams included, are open at once.
+    """
+
+    def __init__(self, provider, requests_per_minute=30, tokens_per_minute=30000, max_concurrency=8,
+                 queue_size=64, max_retries=3, retry_base_delay=0.5, retry_max_delay=8.0, stream_timeout=300.0):
+        self.provider = provider
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.stream_timeout = stream_timeout
+        self._heap = []  # (priority, seq, job)
+        self._seq = itertools.count()
+        self._inflight = {}  # coalescing key -> job
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stats_lock = threading.Lock()
+
+        # Metrics
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.expired = 0
+        self.caller_timeouts = 0
+        self.retries = 0
+        self.errors = 0
+        self.completed = 0
+        self.active = 0
+        self.total_queue_wait = 0.0
+        self.tokens_used = 0
+
+    def _ensure_started(self):
+        if len(self._workers) < self.max_concurrency:
+            with self._cond:
+                while len(self._workers) < self.max_concurrency:
+                    worker = threading.Thread(target=self._run, name=f"llm-worker-{len(self._workers)}", daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    @staticmethod
+    def _key(messages, params):
+        payload = json.dumps([messages, sorted(params.items())], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def submit(self, messages, priority=PRIORITY_INTERACTIVE, timeout=None, stream=False, **params):
+        """Queue a chat completion and return a Future for the provider's response.
+
+        With ``stream=True`` the future resolves to the chunk iterator once the
+        call has started. The future fails with LLMOverloaded or LLMTimeout when
+        the request can't be served within ``timeout`` seconds. A coalesced
+        request shares its future with the others, which may resolve later than
+        ``timeout``; ``complete()`` and ``acomplete()`` stop waiting on time.
+        """
+        self._ensure_started()
+        deadline = time.monotonic() + (LLM_DEADLINE if timeout is None else timeout)
+        key = None if stream else self._key(messages, params)
+        with self._cond:
+            self._count("submitted")
+            if key is not None and key in self._inflight:
+                self._count("coalesced")
+                job = self._inflight[key]
+                # Keep the shared call going for whoever waits longest
+                job.deadline = max(job.deadline, deadline)
+                return job.future
+
+            job = _Job(messages, params, stream, priority, deadline, key)
+            # Admission: would this request even get a rate-limit slot before its deadline?
+            ahead = 1 + sum(1 for queued_priority, _, _ in self._heap if queued_priority <= priority)
+            if time.monotonic() + self.limiter.projected_wait(job.tokens * ahead, ahead) > deadline:
+                return self._reject(job, "LLM rate limit would be exceeded before the deadline")
+            if len(self._heap) >= self.queue_size:
+                # Full: make room by dropping the newest request of a lower priority, if any
+                worst = max(self._heap)
+                if worst[0] <= priority:
+                    return self._reject(job, "LLM queue is full")
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self._forget(worst[2])
+                self._reject(worst[2], "Dropped for a higher-priority request")
+
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            if key is not None:
+                self._inflight[key] = job
+            self._cond.notify()
+        return job.future
+
+    def _reject(self, job, reason):
+        self._count("rejected")
+        job.future.set_exception(LLMOverloaded(reason))
+        return job.future
+
+    def _forget(self, job):
+        if job.key is not None and self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+
+    def _timed_out(self, future=None):
+        """Count a caller giving up; a stream that starts anyway is closed to free its worker."""
+        self._count("caller_timeouts")
+        if future is not None:
+            future.add_done_callback(_close_abandoned_stream)
+        return LLMTimeout("No LLM answer within the request's timeout")
+
+    def complete(self, messages, priority=PRIORITY_INTERACTIVE, timeout=None, **params):
+        """Blocking chat completion; raises LLMUnavailable if it can't be served in time."""
+        timeout = LLM_DEADLINE if timeout is None else timeout
+        future = self.submit(messages, priority=priority, timeout=timeout, **params)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            raise self._timed_out() from None
+
+    def stream(self, messages, priority=PRIORITY_INTERACTIVE, timeout=None, **params):
+        """Start a streaming completion once scheduled; returns the chunk iterator."""
+        timeout = LLM_DEADLINE if timeout is None else timeout
+        future = self.submit(messages, priority=priority, timeout=timeout, stream=True, **params)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            raise self._timed_out(future) from None
+
+    async def acomplete(self, messages, priority=PRIORITY_INTERACTIVE, timeout=None, **params):
+        timeout = LLM_DEADLINE if timeout is None else timeout
+        future = self.submit(messages, priority=priority, timeout=timeout, **params)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out() from None
+
+    async def astream(self, messages, priority=PRIORITY_INTERACTIVE, timeout=None, **params):
+        """Async iterator over a streaming completion; chunks are read in a thread."""
+        timeout = LLM_DEADLINE if timeout is None else timeout
+        future = self.submit(messages, priority=priority, timeout=timeout, stream=True, **params)
+        try:
+            chunks = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(future) from None
+        loop = asyncio.get_running_loop()
+        done = object()
+        while True:
+            chunk = await loop.run_in_executor(_stream_executor, next, chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+
+    def _next_job(self):
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            _, _, job = heapq.heappop(self._heap)
+            return job
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            self._count("total_queue_wait", time.monotonic() - job.queued_at)
+            self._count("active")
+            finished = None
+            try:
+                response = self._call(job)
+                if job.stream:
+                    finished = response.finished
+                job.future.set_result(response)
+                del response
+            except Exception as e:
+                if isinstance(e, LLMTimeout):
+                    self._count("expired")
+                elif not isinstance(e, LLMUnavailable):
+                    print(f"Error calling the LLM: {e}")
+                    self._count("errors")
+                job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._forget(job)
+                # Without a reference from here, a dropped stream is collected and sets ``finished``
+                job = None
+                if finished is not None and not finished.wait(self.stream_timeout):
+                    print(f"LLM stream still open after {self.stream_timeout:.0f}s; freeing its slot")
+                self._count("active", -1)
+
+    def _call(self, job):
+        attempt = 0
+        waiting_since = job.queued_at
+        while True:
+            if time.monotonic() >= job.deadline:
+                raise LLMTimeout("Deadline passed before the LLM call could start")
+            if not self.limiter.acquire(job.tokens, job.deadline):
+                raise LLMTimeout("Rate limit wouldn't allow the LLM call before the deadline")
+            started = time.monotonic()
+            if job.trace is not None:
+                # Queue and rate limits, or backoff before a retry
+                job.trace.add("llm_queue", started - waiting_since)
+            try:
+                if job.stream:
+                    response = _Stream(self.provider.stream(job.messages, **job.params))
+                else:
+                    response = self.provider.complete(job.messages, **job.params)
+            except Exception as e:
+                if job.trace is not None:
+                    job.trace.add("llm", time.monotonic() - started)
+                waiting_since = time.monotonic()
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                pause = retry_after(e)
+                if pause:
+                    self.limiter.pause(pause)
+                delay = max(pause or 0.0, backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+                if time.monotonic() + delay >= job.deadline:
+                    raise LLMTimeout(f"Out of time retrying the LLM call: {e}")
+                self._count("retries")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            # Streams don't report usage up front; their estimate stands
+            usage = getattr(getattr(response, "usage", None), "total_tokens", None)
+            if usage is not None:
+                self.limiter.settle(job.tokens, usage)
+                self._count("tokens_used", usage)
+            if job.trace is not None:
+                # For streams this is the time until the response starts
+                job.trace.add("llm", time.monotonic() - started)
+                record_tokens(getattr(response, "usage", None), job.trace)
+            self._count("completed")
+            return response
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._heap)
+        with self._stats_lock:
+            served = self.completed + self.errors + self.expired
+            return {
+                "provider": type(self.provider).__name__,
+                "queued": queued,
+                "active": self.active,
+                "workers": len(self._workers),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "caller_timeouts": self.caller_timeouts,
+                "retries": self.retries,
+                "errors": self.errors,
+                "completed": self.completed,
+                "tokens_used": self.tokens_used,
+                "avg_queue_wait_ms": round(self.total_queue_wait / served * 1000, 2) if served else 0.0,
+                **self.limiter.stats(),
+            }
+
+
+# Threads that read streamed chunks for async callers
+_stream_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm-stream")
+
+
+def _build_provider():
+    if LLM_PROVIDER == "fake":
+        return FakeProvider(latency_ms=FAKE_LLM_LATENCY_MS, error_rate=FAKE_LLM_ERROR_RATE)
+    if LLM_PROVIDER == "groq":
+        return GroqProvider()
+    raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+
+
+llm_scheduler = LLMScheduler(
+    _build_provider(),
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    queue_size=LLM_QUEUE_SIZE,
+    max_retries=LLM_MAX_RETRIES,
+    retry_base_delay=LLM_RETRY_BASE_DELAY,
+    retry_max_delay=LLM_RETRY_MAX_DELAY,
+    stream_timeout=LLM_STREAM_TIMEOUT,
+)
+
+
+def get_groq_client():
+    """The Groq client owned by the scheduler (None with another provider)."""
+    provider = llm_scheduler.provider
+    return provider.client if isinstance(provider, GroqProvider) else None
@@ -0,0 +1,68 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from media.batch import BATCH_CONCURRENCY, BATCH_MAX_TOP_K, parse_batch_items, parse_top_k, run_batch
+from media.ingest import iter_ndjson
+from media.retrieval import RETRIEVAL_MODES
+
+
+class Command(BaseCommand):
+    help = "Answer many questions from an NDJSON or JSON file, writing one NDJSON result per question"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File of {\"tool_name\", \"question\", \"id\"?} items, or '-' for stdin")
+        parser.add_argument("--tool-name", help="tool_name for items that don't set one, e.g. django")
+        parser.add_argument("--format", choices=["auto", "ndjson", "json"], default="auto",
+                            help="ndjson: one item per line; json: an array (or {\"items\": [...]})")
+        parser.add_argument("--output", default="-", help="Where to write the results; default stdout")
+        parser.add_argument("--top-k", type=int, help=f"Sources per answer; default CHAT_TOP_K, at most {BATCH_MAX_TOP_K}")
+        parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Items answered at once")
+        parser.add_argument("--mode", choices=RETRIEVAL_MODES, help="Retrieval mode; default RETRIEVAL_MODE")
+
+    def handle(self, *args, **options):
+        try:
+            top_k = parse_top_k(options["top_k"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        path = options["path"]
+        file_format = options["format"]
+        if file_format == "auto":
+            file_format = "json" if path.endswith(".json") else "ndjson"
+
+        fp = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            if file_format == "json":
+                items = json.load(fp)
+                if isinstance(items, dict):
+                    items = items.get("items")
+            else:
+                items = list(iter_ndjson(fp))
+            valid, invalid = parse_batch_items(items, options["tool_name"])
+        except ValueError as e:
+            raise CommandError(f"Invalid batch file: {e}")
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+
+        search_params = {"mode": options["mode"]} if options["mode"] else {}
+        out = sys.stdout if options["output"] == "-" else open(options["output"], "w", encoding="utf-8")
+        summary = {}
+        try:
+            for result in run_batch(valid, top_k=top_k, search_params=search_params,
+                                    concurrency=options["concurrency"], invalid=invalid):
+                if "summary" in result:
+                    summary = result["summary"]
+                    continue
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        # The results may be on stdout, so the summary goes to stderr
+        self.stderr.write(self.style.SUCCESS(
+            f"Processed {summary['items']} questions in {summary['elapsed_ms'] / 1000:.1f}s: "
+            f"{summary['answered']} answered, {summary['cached']} from cache, {summary['errors']} errors"
+        ))
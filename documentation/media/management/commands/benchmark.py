@@ -0,0 +1,104 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from media.benchmark import compare_reports, run_benchmark
+from media.llm import FAKE_LLM_LATENCY_MS
+from media.retrieval import RETRIEVAL_MODES
+
+SCENARIOS = ("ingest", "retrieval", "chat")
+
+
+def int_list(value):
+    try:
+        values = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise CommandError(f"Expected comma-separated integers, got {value!r}")
+    if not values or min(values) < 1:
+        raise CommandError(f"Expected positive integers, got {value!r}")
+    return values
+
+
+def choice_list(value, choices):
+    values = [part.strip() for part in value.split(",") if part.strip()]
+    unknown = [part for part in values if part not in choices]
+    if unknown or not values:
+        raise CommandError(f"Choose from {', '.join(choices)} (got {value!r})")
+    return values
+
+
+class Command(BaseCommand):
+    help = ("Seed synthetic namespaces and measure p50/p95/p99 latency and throughput of ingestion, "
+            "query_similar_docs and chat_api (with a fake LLM) at several concurrency levels")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--namespaces", type=int, default=3, help="Synthetic namespaces (bench0-docs, ...)")
+        parser.add_argument("--docs", type=int, default=1000, help="Chunks per namespace")
+        parser.add_argument("--queries", type=int, default=200, help="Searches per mode and concurrency level")
+        parser.add_argument("--chat-queries", type=int, help="Chats per concurrency level; default --queries")
+        parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated thread counts")
+        parser.add_argument("--modes", default=",".join(RETRIEVAL_MODES), help="Retrieval modes to measure")
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Any of {', '.join(SCENARIOS)}")
+        parser.add_argument("--llm-latency-ms", type=float, default=FAKE_LLM_LATENCY_MS,
+                            help="Latency of the fake LLM used by the chat scenario")
+        parser.add_argument("--ingest-requests", type=int, default=20, help="store_documents calls per concurrency level")
+        parser.add_argument("--docs-per-request", type=int, default=32)
+        parser.add_argument("--top-k", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0, help="Same seed, same documents and questions")
+        parser.add_argument("--keep", action="store_true", help="Leave the synthetic namespaces in the database")
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument("--compare", help="A previous report to compare against")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="With --compare, fail when p95 grows or throughput drops by more than this fraction")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], "r", encoding="utf-8") as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        try:
+            report = run_benchmark(
+                namespaces=options["namespaces"],
+                docs_per_namespace=options["docs"],
+                queries=options["queries"],
+                chat_queries=options["chat_queries"],
+                concurrency_levels=int_list(options["concurrency"]),
+                modes=choice_list(options["modes"], RETRIEVAL_MODES),
+                scenarios=choice_list(options["scenarios"], SCENARIOS),
+                llm_latency_ms=options["llm_latency_ms"],
+                ingest_requests=options["ingest_requests"],
+                docs_per_request=options["docs_per_request"],
+                top_k=options["top_k"],
+                seed=options["seed"],
+                keep=options["keep"],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {len(report['results'])} results to {options['output']} in {report['seconds']}s"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if baseline is None:
+            return
+        rows = compare_reports(baseline, report, options["tolerance"])
+        self.stdout.write(f"\nCompared with {options['compare']} ({baseline.get('environment', {}).get('git_commit')}):")
+        self.stdout.write(f"{'scenario':<40}{'p95 ms':>22}{'change':>9}{'qps':>20}{'change':>9}")
+        for row in rows:
+            line = (f"{row['key']:<40}{row['p95_ms'][0]:>10.1f} -> {row['p95_ms'][1]:>8.1f}{row['p95_change']:>+9.1%}"
+                    f"{row['qps'][0]:>8.1f} -> {row['qps'][1]:>8.1f}{row['qps_change']:>+9.1%}")
+            self.stdout.write(self.style.ERROR(line) if row["regression"] else line)
+        regressions = [row["key"] for row in rows if row["regression"]]
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions beyond {options['tolerance']:.0%}: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {options['tolerance']:.0%} in {len(rows)} results"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from media.memory_index import memory_index
+
+
+class Command(BaseCommand):
+    help = "Write (or bring up to date) the memory-mapped vector snapshots used by RETRIEVAL_BACKEND=memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--namespace", action="append", help="Namespace to refresh (repeatable); default all")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            if options["namespace"]:
+                results = {namespace: memory_index.refresh(namespace) for namespace in options["namespace"]}
+            else:
+                results = memory_index.refresh_all()
+        except Exception as e:
+            raise CommandError(f"Could not build the memory index: {e}")
+        for namespace, result in sorted(results.items()):
+            snapshot = memory_index.snapshot(namespace)
+            self.stdout.write(f"  {namespace}: {result} ({len(snapshot) if snapshot else 0} rows)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {len(results)} namespaces in {time.monotonic() - started:.1f}s into {memory_index.directory}"))
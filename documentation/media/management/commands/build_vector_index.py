@@ -0,0 +1,104 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from media.db import HNSW_EF_CONSTRUCTION, HNSW_M
+from media.vector_index import build_namespace_indexes, build_vector_index, drop_namespace_indexes, recall_report
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+class Command(BaseCommand):
+    help = "Build or rebuild the pgvector embedding index and report recall versus latency against an exact scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--method", choices=["auto", "hnsw", "ivfflat"], default="auto",
+                            help="auto: HNSW when pgvector supports it, otherwise IVFFlat sized from the row count")
+        parser.add_argument("--m", type=int, default=HNSW_M, help="HNSW max connections per layer")
+        parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+        parser.add_argument("--lists", type=int, help="IVFFlat lists (default: rows/1000, or sqrt(rows) above 1M)")
+        parser.add_argument("--maintenance-work-mem", help="e.g. 1GB; speeds up HNSW builds that fit in memory")
+        parser.add_argument("--per-namespace", action="store_true",
+                            help="Also build the partial HNSW indexes of the PGVECTOR_NAMESPACE_INDEXES namespaces")
+        parser.add_argument("--index-namespace", action="append",
+                            help="Build the partial HNSW index of this namespace (repeatable); implies --per-namespace")
+        parser.add_argument("--drop-namespace-index", action="append",
+                            help="Only drop the partial HNSW index of this namespace (repeatable)")
+        parser.add_argument("--report-only", action="store_true", help="Skip the build and only run the recall report")
+        parser.add_argument("--no-report", action="store_true", help="Build without running the recall report")
+        parser.add_argument("--namespace", help="Restrict report queries to one namespace")
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--ef-search", type=_int_list, default=[10, 20, 40, 80, 160],
+                            help="Comma-separated hnsw.ef_search values to report")
+        parser.add_argument("--probes", type=_int_list, default=[1, 5, 10, 20, 40],
+                            help="Comma-separated ivfflat.probes values to report")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        output = {}
+        log = (lambda message: None) if options["json"] else self.stdout.write
+
+        if options["drop_namespace_index"]:
+            dropped = drop_namespace_indexes(options["drop_namespace_index"], log=log)
+            self.stdout.write(json.dumps({"dropped": dropped}, indent=2) if options["json"] else
+                              self.style.SUCCESS(f"Dropped {len(dropped)} namespace indexes"))
+            return
+
+        if not options["report_only"]:
+            try:
+                output["build"] = build_vector_index(
+                    method=options["method"],
+                    m=options["m"],
+                    ef_construction=options["ef_construction"],
+                    lists=options["lists"],
+                    maintenance_work_mem=options["maintenance_work_mem"],
+                    log=log,
+                )
+                if options["per_namespace"] or options["index_namespace"]:
+                    output["namespaces"] = build_namespace_indexes(
+                        namespaces=options["index_namespace"],
+                        m=options["m"],
+                        ef_construction=options["ef_construction"],
+                        log=log,
+                    )
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        if not options["no_report"]:
+            output["report"] = recall_report(
+                namespace=options["namespace"],
+                queries=options["queries"],
+                top_k=options["top_k"],
+                ef_search_values=options["ef_search"],
+                probes_values=options["probes"],
+            )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(output, indent=2))
+            return
+
+        build = output.get("build")
+        if build:
+            self.stdout.write(self.style.SUCCESS(
+                f"Built {build['method']} index ({build['options']}) over {build['rows']} rows "
+                f"in {build['build_seconds']}s, {build['size_bytes'] / 1024 / 1024:.1f} MB"
+            ))
+            if "suggested_probes" in build:
+                self.stdout.write(f"Suggested IVFFLAT_PROBES: {build['suggested_probes']}")
+
+        for namespace in output.get("namespaces", []):
+            self.stdout.write(self.style.SUCCESS(
+                f"Built {namespace['index']} ({namespace['rows']} rows) in {namespace['build_seconds']}s"
+            ))
+
+        report = output.get("report")
+        if report:
+            self.stdout.write(f"\nRecall@{report['top_k']} over {report['queries']} queries ({report['index'] or 'no'} index)")
+            self.stdout.write(f"{'setting':<16}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+            for row in report["rows"]:
+                self.stdout.write(
+                    f"{row['setting']:<16}{row['recall']:>8.3f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['mean_ms']:>10.2f}"
+                )
@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from media.ingest import INGEST_BATCH_SIZE, ingest_documents, iter_json_array, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = "Stream documentation chunks from an NDJSON or JSON file into the pgvector documents table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to load, or '-' for stdin")
+        parser.add_argument("--namespace", help="Namespace for chunks that don't set one, e.g. django-docs")
+        parser.add_argument("--doc-type", help="doc_type for chunks that don't set one, e.g. django")
+        parser.add_argument("--format", choices=["auto", "ndjson", "json"], default="auto",
+                            help="ndjson: one chunk per line; json: an array (or {\"documents\": [...]})")
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+        parser.add_argument("--sync", action="store_true",
+                            help="Treat the file as the full source: delete stored chunks of its namespaces that are not in it")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"]
+        if file_format == "auto":
+            file_format = "json" if path.endswith(".json") else "ndjson"
+
+        fp = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            documents = iter_json_array(fp) if file_format == "json" else iter_ndjson(fp)
+
+            def progress(stats):
+                self.stdout.write(
+                    f"  {stats.documents} chunks ({stats.embedded} embedded, {stats.unchanged} unchanged) in {stats.elapsed:.1f}s "
+                    f"({stats.documents / stats.elapsed:.0f}/s, encode {stats.encode_seconds:.1f}s, "
+                    f"write {stats.write_seconds:.1f}s)"
+                )
+
+            try:
+                stats = ingest_documents(
+                    documents,
+                    options["namespace"],
+                    options["doc_type"],
+                    batch_size=options["batch_size"],
+                    progress=progress,
+                    sync=options["sync"],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+
+        summary = stats.as_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {summary['count']} chunks in {', '.join(summary['namespaces']) or 'no namespace'} "
+            f"in {summary['seconds']}s ({summary['docs_per_second']}/s): {summary['embedded']} embedded, "
+            f"{summary['unchanged']} unchanged, {summary['deleted']} deleted"
+        ))
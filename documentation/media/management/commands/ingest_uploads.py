@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from media.models import DocumentationFile
+from media.upload_ingest import ingest_documentation_file
+
+
+class Command(BaseCommand):
+    help = ("Chunk and embed uploaded DocumentationFiles into their <doc_type>-docs namespaces now, "
+            "e.g. files uploaded before background ingestion or left queued by a restart")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--id", type=int, action="append", help="DocumentationFile id (repeatable)")
+        parser.add_argument("--pending", action="store_true",
+                            help="Files that were never ingested, are still queued or processing, or failed")
+        parser.add_argument("--all", action="store_true", help="Every file (unchanged chunks aren't re-embedded)")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            docs = DocumentationFile.objects.all()
+        elif options["pending"]:
+            docs = DocumentationFile.objects.exclude(ingest_status='done')
+        elif options["id"]:
+            docs = DocumentationFile.objects.filter(pk__in=options["id"])
+        else:
+            raise CommandError("Pass --id, --pending or --all")
+
+        results = {}
+        for doc_id in docs.order_by("pk").values_list("pk", flat=True):
+            status = ingest_documentation_file(doc_id, log=self.stdout.write)
+            results[status] = results.get(status, 0) + 1
+        if results.get("failed"):
+            raise CommandError(f"{results['failed']} of {sum(results.values())} files failed; see ingest_error in the admin")
+        self.stdout.write(self.style.SUCCESS(f"Ingested {results.get('done', 0)} files"))
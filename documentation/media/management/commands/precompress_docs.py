@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from media.models import DocumentationFile
+from media.precompress import available_encodings, precompress_document
+
+
+class Command(BaseCommand):
+    help = "Write gzip (and brotli, if installed) variants of every uploaded documentation file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Recompress variants that are already up to date")
+
+    def handle(self, *args, **options):
+        encodings = ", ".join(encoding for encoding, _ in available_encodings())
+        self.stdout.write(f"Compressing with: {encodings}")
+        count = 0
+        for doc in DocumentationFile.objects.all():
+            for path, written in precompress_document(doc, force=options["force"]).items():
+                if written:
+                    count += 1
+                    self.stdout.write(f"  {path}: {', '.join(written)}")
+        self.stdout.write(self.style.SUCCESS(f"Updated variants of {count} files"))
@@ -0,0 +1,76 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from media.db import EMBEDDING_STORAGES, HNSW_EF_CONSTRUCTION, HNSW_M
+from media.vector_index import convert_embedding_storage, storage_benchmark
+
+
+class Command(BaseCommand):
+    help = ("Convert stored embeddings to float32 (vector), float16 (halfvec) or binary-quantized storage, "
+            "or benchmark memory, latency and recall of each")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--storage", choices=EMBEDDING_STORAGES,
+                            help="Convert the documents table to this storage mode and rebuild its indexes")
+        parser.add_argument("--benchmark", action="store_true",
+                            help="Compare the storage modes on a sample copied into temporary tables")
+        parser.add_argument("--rows", type=int, default=10000, help="Benchmark sample size")
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--ef-search", type=int, default=40)
+        parser.add_argument("--rerank-factor", type=int, default=10,
+                            help="Binary candidates re-ranked on float16 values, per result")
+        parser.add_argument("--m", type=int, default=HNSW_M)
+        parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        if not options["storage"] and not options["benchmark"]:
+            raise CommandError("Pass --storage to convert and/or --benchmark")
+
+        log = (lambda message: None) if options["json"] else self.stdout.write
+        output = {}
+        try:
+            if options["benchmark"]:
+                output["benchmark"] = storage_benchmark(
+                    rows=options["rows"],
+                    queries=options["queries"],
+                    top_k=options["top_k"],
+                    ef_search=options["ef_search"],
+                    rerank_factor=options["rerank_factor"],
+                    m=options["m"],
+                    ef_construction=options["ef_construction"],
+                    log=log,
+                )
+            if options["storage"]:
+                output["conversion"] = convert_embedding_storage(
+                    options["storage"],
+                    m=options["m"],
+                    ef_construction=options["ef_construction"],
+                    log=log,
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(output, indent=2))
+            return
+
+        benchmark = output.get("benchmark")
+        if benchmark:
+            self.stdout.write(f"\nRecall@{benchmark['top_k']} over {benchmark['queries']} queries, {benchmark['rows']} rows")
+            self.stdout.write(f"{'storage':<20}{'table MB':>10}{'index MB':>10}{'build s':>9}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+            for row in benchmark["results"]:
+                self.stdout.write(
+                    f"{row['setting']:<20}{row['table_bytes'] / 1024 / 1024:>10.1f}{row['index_bytes'] / 1024 / 1024:>10.1f}"
+                    f"{row['build_seconds']:>9.2f}{row['recall']:>8.3f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+                )
+
+        conversion = output.get("conversion")
+        if conversion and conversion["converted"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"Converted documents from {conversion['from']} to {conversion['to']} in {conversion['convert_seconds']}s "
+                f"({conversion['size_before_bytes'] / 1024 / 1024:.1f} MB -> {conversion['size_after_bytes'] / 1024 / 1024:.1f} MB "
+                f"with indexes). Restart the app so every worker uses the new storage."
+            ))
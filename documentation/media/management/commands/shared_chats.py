@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from media.shared_chat_store import SHARED_CHATS_DIR, import_chat_files, shared_chat_store
+
+
+class Command(BaseCommand):
+    help = "Import, list or clean up shared chats"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["import", "list", "cleanup"])
+        parser.add_argument("--dir", default=SHARED_CHATS_DIR, help="Directory of JSON chat files to import")
+        parser.add_argument("--delete-files", action="store_true", help="Remove each file once it is imported")
+        parser.add_argument("--limit", type=int, default=50, help="Number of chats to list")
+        parser.add_argument("--tool", help="Only list chats of this tool")
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        if action == "import":
+            imported, skipped, failed = import_chat_files(
+                options["dir"], delete_files=options["delete_files"], log=self.stderr.write)
+            if failed:
+                raise CommandError(f"Imported {imported}, skipped {skipped}, failed {failed}")
+            self.stdout.write(self.style.SUCCESS(f"Imported {imported} chats ({skipped} already present)"))
+        elif action == "list":
+            for chat in shared_chat_store.list(limit=options["limit"], tool_name=options["tool"]):
+                expires = chat["expires_at"].isoformat() if chat["expires_at"] else "never"
+                self.stdout.write(f"{chat['chat_id']}  {chat['tool_name'] or '-'}  {chat['created_at'].isoformat()}  expires {expires}")
+        else:
+            removed = shared_chat_store.cleanup()
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired chats"))
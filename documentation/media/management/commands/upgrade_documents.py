@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from media.db import pending_upgrades, upgrade_documents_schema
+
+
+class Command(BaseCommand):
+    help = ("Upgrade an existing documents table: remove duplicate chunks and build the indexes newer "
+            "features need. Run once after deploying, outside the web workers.")
+
+    def handle(self, *args, **options):
+        applied = upgrade_documents_schema(log=self.stdout.write)
+        if pending_upgrades():
+            self.stdout.write(self.style.ERROR(f"Still pending: {', '.join(pending_upgrades())}"))
+        elif applied:
+            self.stdout.write(self.style.SUCCESS(f"Applied {', '.join(applied)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("The documents table is up to date"))
@@ -0,0 +1,396 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .db import ensure_pgvector, get_pool
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are still written atomically, just not locked across processes
+    fcntl = None
+
+# Load environment variables
+load_dotenv()
+
+# Where namespace snapshots are written; every worker process maps the same files
+MEMORY_INDEX_DIR = os.getenv(
+    "MEMORY_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_snapshots"))
+# float16 halves the memory (and page cache) a namespace takes, but every search has to
+# convert the rows back to float32, which makes it several times slower than float32
+MEMORY_INDEX_DTYPE = os.getenv("MEMORY_INDEX_DTYPE", "float32").lower()
+# Seconds between checks of a namespace against the documents table
+MEMORY_INDEX_REFRESH_INTERVAL = float(os.getenv("MEMORY_INDEX_REFRESH_INTERVAL", "10"))
+
+MEMORY_INDEX_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+# float16 rows are converted to float32 this many at a time for the matmul
+SCORE_BLOCK_ROWS = 8192
+FETCH_BATCH_SIZE = 2000
+# Namespaces whose last check is remembered, and background refreshes run at once; searches for
+# other namespaces (any tool_name a client sends) wait for a later search instead of starting one
+MAX_TRACKED_NAMESPACES = 1024
+MAX_CONCURRENT_REFRESHES = 2
+
+# vector_send() is pgvector's binary output: int16 dimensions, int16 unused, then big-endian float4s
+ROW_COLUMNS = "id, heading, path, url, content, chunk_id, total_chunks, level, vector_send(embedding::vector)"
+
+
+def _namespace_dir(directory, namespace):
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", namespace)[:60]
+    return os.path.join(directory, f"{slug}-{hashlib.sha1(namespace.encode('utf-8')).hexdigest()[:10]}")
+
+
+def _fingerprint(cursor, namespace, max_id=None):
+    """``(rows, max id, sum of content hashes)`` of a namespace, optionally only up to ``max_id``.
+
+    Re-embedding a chunk changes its content_hash, so any update or delete changes this.
+    """
+    sql = """
+        SELECT count(*), coalesce(max(id), 0), coalesce(sum(hashtext(coalesce(content_hash, id::text))), 0)
+        FROM documents WHERE namespace = %s
+    """
+    params = [namespace]
+    if max_id is not None:
+        sql += " AND id <= %s"
+        params.append(max_id)
+    cursor.execute(sql, params)
+    count, last_id, hash_sum = cursor.fetchone()
+    return [int(count), int(last_id), int(hash_sum)]
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NamespaceSnapshot:
+    """The embeddings and chunk columns of one namespace, memory-mapped read-only.
+
+    Embeddings are unit length, so a dot product is the cosine similarity.
+    Content lives in one UTF-8 file addressed by an offsets array, so worker
+    processes share it through the page cache instead of each holding a copy.
+    """
+
+    def __init__(self, directory, manifest):
+        version = manifest["version"]
+        self.directory = directory
+        self.manifest = manifest
+        self.fingerprint = manifest["fingerprint"]
+        self.embeddings = np.load(os.path.join(directory, f"embeddings.{version}.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(directory, f"ids.{version}.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, f"offsets.{version}.npy"), mmap_mode="r")
+        content_path = os.path.join(directory, f"content.{version}.bin")
+        # np.memmap can't map an empty file
+        self.content = np.memmap(content_path, dtype=np.uint8, mode="r") if os.path.getsize(content_path) else b""
+        with open(os.path.join(directory, f"meta.{version}.json"), "r") as f:
+            self.meta = json.load(f)  # [heading, path, url, chunk_id, total_chunks, level] per row
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def max_id(self):
+        return self.fingerprint[1]
+
+    def text(self, i):
+        return bytes(self.content[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def row(self, i, similarity):
+        """Row ``i`` laid out like retrieval.MATCH_COLUMNS plus similarity, for format_match."""
+        heading, path, url, chunk_id, total_chunks, level = self.meta[i]
+        return (int(self.ids[i]), heading, path, url, self.text(i), chunk_id, total_chunks, level, similarity)
+
+    def scores(self, query):
+        if self.embeddings.dtype == np.float32:
+            return self.embeddings @ query
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.embeddings[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def search(self, query, top_k):
+        """Exact top-k by cosine similarity: one matmul and an argpartition."""
+        n = len(self)
+        if n == 0 or top_k <= 0:
+            return []
+        scores = self.scores(query)
+        k = min(top_k, n)
+        top = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.row(i, float(scores[i])) for i in top]
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, "manifest.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(directory, namespace, fingerprint, dtype, rows, base=None):
+    """Write a new snapshot version: ``base``'s rows (if any) followed by ``rows``.
+
+    Files are versioned and the manifest is swapped in last, so readers never
+    see a partial snapshot; older versions are removed afterwards.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = _read_manifest(directory)
+    version = (previous["version"] + 1) if previous else 1
+
+    ids = [row[0] for row in rows]
+    meta = [[row[1], row[2], row[3], row[5], row[6], row[7]] for row in rows]
+    texts = [(row[4] or "").encode("utf-8") for row in rows]
+    vectors = np.zeros((0, 0), dtype=dtype)
+    if rows:
+        vectors = np.stack([np.frombuffer(bytes(row[8]), dtype=">f4", offset=4) for row in rows]).astype(np.float32)
+        vectors = _unit_rows(vectors).astype(dtype)
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    ids = np.asarray(ids, dtype=np.int64)
+    base_bytes = b""
+    embeddings = vectors
+    if base is not None and len(base):
+        base_bytes = bytes(base.content[:base.offsets[-1]])
+        offsets = np.concatenate([np.asarray(base.offsets), offsets[1:] + base.offsets[-1]])
+        ids = np.concatenate([np.asarray(base.ids), ids])
+        meta = base.meta + meta
+        embeddings = np.concatenate([np.asarray(base.embeddings), vectors]) if rows else np.asarray(base.embeddings)
+
+    np.save(os.path.join(directory, f"embeddings.{version}.npy"), np.ascontiguousarray(embeddings, dtype=dtype))
+    np.save(os.path.join(directory, f"ids.{version}.npy"), ids)
+    np.save(os.path.join(directory, f"offsets.{version}.npy"), offsets)
+    with open(os.path.join(directory, f"content.{version}.bin"), "wb") as f:
+        f.write(base_bytes)
+        for text in texts:
+            f.write(text)
+    with open(os.path.join(directory, f"meta.{version}.json"), "w") as f:
+        json.dump(meta, f, separators=(",", ":"))
+
+    manifest = {
+        "namespace": namespace,
+        "version": version,
+        "fingerprint": fingerprint,
+        "dtype": np.dtype(dtype).name,
+        "rows": int(len(ids)),
+        "created_at": time.time(),
+    }
+    tmp = os.path.join(directory, f"manifest.json.tmp{os.getpid()}")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(directory, "manifest.json"))
+
+    # Processes still mapping an old version keep it until they reload (on POSIX)
+    for name in os.listdir(directory):
+        parts = name.split(".")
+        if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) != version:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return manifest
+
+
+class _FileLock:
+    """Exclusive lock on ``path`` across processes (a no-op without fcntl)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, "a+")
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+
+
+class MemoryIndex:
+    """Exact in-process vector search over snapshots of the documents table.
+
+    ``search()`` never touches the database: it uses the namespace's mapped
+    snapshot and, at most every ``refresh_interval`` seconds, starts a
+    background check of the table. New rows are appended to the snapshot;
+    updated or deleted rows rebuild it. The first process to notice writes
+    the new snapshot under a file lock and the others just map it.
+    """
+
+    def __init__(self, directory=MEMORY_INDEX_DIR, dtype="float32", refresh_interval=10.0):
+        if dtype not in MEMORY_INDEX_DTYPES:
+            raise ValueError(f"MEMORY_INDEX_DTYPE must be one of: {', '.join(MEMORY_INDEX_DTYPES)}")
+        self.directory = directory
+        self.dtype = MEMORY_INDEX_DTYPES[dtype]
+        self.refresh_interval = refresh_interval
+        self._snapshots = {}  # namespace -> (NamespaceSnapshot, manifest mtime)
+        self._checked = LRUCache(max_size=MAX_TRACKED_NAMESPACES)  # namespace -> time of the last check
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._thread_lock = threading.Lock()  # serializes rebuilds within this process
+
+        # Metrics
+        self.queries = 0
+        self.misses = 0
+        self.appends = 0
+        self.rebuilds = 0
+        self.appended_rows = 0
+        self.total_search_time = 0.0
+
+    def _manifest_path(self, namespace):
+        return os.path.join(_namespace_dir(self.directory, namespace), "manifest.json")
+
+    def snapshot(self, namespace):
+        """The namespace's current snapshot, (re)mapping it when the files on disk changed."""
+        try:
+            mtime = os.stat(self._manifest_path(namespace)).st_mtime_ns
+        except OSError:
+            return None
+        loaded = self._snapshots.get(namespace)
+        if loaded is not None and loaded[1] == mtime:
+            return loaded[0]
+        directory = _namespace_dir(self.directory, namespace)
+        manifest = _read_manifest(directory)
+        if manifest is None or manifest["dtype"] != np.dtype(self.dtype).name:
+            return loaded[0] if loaded else None
+        try:
+            snapshot = NamespaceSnapshot(directory, manifest)
+        except (OSError, ValueError) as e:
+            # Files of this version were removed by a newer refresh; the next call maps that one
+            print(f"⚠️ Could not map vector snapshot of {namespace}: {e}")
+            return loaded[0] if loaded else None
+        with self._lock:
+            self._snapshots[namespace] = (snapshot, mtime)
+        return snapshot
+
+    def search(self, namespace, embedding, top_k):
+        """Top ``top_k`` rows of a namespace for ``embedding``, or None if it isn't loaded yet.
+
+        Rows are laid out like retrieval.MATCH_COLUMNS plus similarity.
+        """
+        started = time.perf_counter()
+        self._maybe_refresh(namespace)
+        snapshot = self.snapshot(namespace)
+        if snapshot is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        rows = snapshot.search(query / norm if norm else query, top_k)
+        with self._lock:
+            self.queries += 1
+            self.total_search_time += time.perf_counter() - started
+        return rows
+
+    def _maybe_refresh(self, namespace):
+        now = time.monotonic()
+        with self._lock:
+            if namespace in self._refreshing or now - self._checked.get(namespace, 0.0) < self.refresh_interval:
+                return
+            if len(self._refreshing) >= MAX_CONCURRENT_REFRESHES:
+                return
+            self._refreshing.add(namespace)
+            self._checked.set(namespace, now)
+        threading.Thread(target=self._refresh_in_background, args=(namespace,),
+                         name="memory-index-refresh", daemon=True).start()
+
+    def _refresh_in_background(self, namespace):
+        try:
+            self.refresh(namespace)
+        except Exception as e:
+            print(f"❌ ERROR refreshing vector snapshot of {namespace}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(namespace)
+
+    def mark_stale(self, namespace):
+        """Check the namespace against the table on its next search (e.g. after an ingest)."""
+        self._checked.delete(namespace)
+
+    def refresh(self, namespace):
+        """Bring the namespace's snapshot up to date with the table; returns what was done.
+
+        A namespace with no rows and no snapshot yet is left alone ("empty"),
+        so searching an unknown namespace writes nothing to disk.
+        """
+        ensure_pgvector()
+        if self.snapshot(namespace) is None:
+            with get_pool().connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1 FROM documents WHERE namespace = %s LIMIT 1", (namespace,))
+                    if cursor.fetchone() is None:
+                        return "empty"
+        directory = _namespace_dir(self.directory, namespace)
+        os.makedirs(directory, exist_ok=True)
+        with self._thread_lock, _FileLock(os.path.join(directory, ".lock")):
+            current = self.snapshot(namespace)
+            if current is not None and current.manifest["dtype"] != np.dtype(self.dtype).name:
+                current = None
+            with get_pool().connection() as conn:
+                with conn.cursor() as cursor:
+                    # One consistent view, so the rows match the fingerprint stored with them
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    fingerprint = _fingerprint(cursor, namespace)
+                    if current is not None and current.fingerprint == fingerprint:
+                        return "current"
+                    # Only new rows since the snapshot? Then append instead of rebuilding
+                    append = current is not None and _fingerprint(cursor, namespace, current.max_id) == current.fingerprint
+                rows = self._fetch_rows(conn, namespace, current.max_id if append else 0)
+            _write_snapshot(directory, namespace, fingerprint, self.dtype, rows, base=current if append else None)
+        with self._lock:
+            if append:
+                self.appends += 1
+                self.appended_rows += len(rows)
+            else:
+                self.rebuilds += 1
+        self.snapshot(namespace)
+        return "appended" if append else "rebuilt"
+
+    @staticmethod
+    def _fetch_rows(conn, namespace, since_id):
+        # A server-side cursor streams the rows instead of loading the result at once
+        with conn.cursor(name="memory_index_rows") as cursor:
+            cursor.itersize = FETCH_BATCH_SIZE
+            cursor.execute(f"SELECT {ROW_COLUMNS} FROM documents WHERE namespace = %s AND id > %s ORDER BY id",
+                           (namespace, since_id))
+            return list(cursor)
+
+    def refresh_all(self):
+        """Refresh every namespace in the table; returns ``{namespace: result}``."""
+        ensure_pgvector()
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT DISTINCT namespace FROM documents")
+                namespaces = [row[0] for row in cursor.fetchall()]
+        return {namespace: self.refresh(namespace) for namespace in namespaces}
+
+    def stats(self):
+        with self._lock:
+            loaded = {namespace: len(snapshot) for namespace, (snapshot, _) in self._snapshots.items()}
+            return {
+                "dtype": np.dtype(self.dtype).name,
+                "namespaces": loaded,
+                "queries": self.queries,
+                "misses": self.misses,
+                "appends": self.appends,
+                "appended_rows": self.appended_rows,
+                "rebuilds": self.rebuilds,
+                "avg_search_ms": round(self.total_search_time / self.queries * 1000, 3) if self.queries else 0.0,
+            }
+
+
+memory_index = MemoryIndex(dtype=MEMORY_INDEX_DTYPE, refresh_interval=MEMORY_INDEX_REFRESH_INTERVAL)
@@ -0,0 +1,324 @@
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+from django.http import StreamingHttpResponse
+
+# Load environment variables
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Fraction of chat requests that are traced; the rest skip all span bookkeeping
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+# Add a Server-Timing header to traced responses (browser dev tools show it per request)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+# /metrics wants "Authorization: Bearer <token>"; without a token it is only served when DEBUG is on
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Seconds; wide enough for a cached answer (~ms) and a slow Groq call (~10s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A Prometheus counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """A Prometheus histogram with fixed buckets, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = sorted((label_values, (list(counts), total, count))
+                            for label_values, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, [le])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.register(Histogram(
+    "chat_request_seconds", "Traced chat requests, from the view being called to the last byte.", ("route", "status")))
+stage_seconds = registry.register(Histogram(
+    "chat_stage_seconds", "Time spent in each stage of traced chat requests.", ("route", "stage")))
+tokens_total = registry.register(Counter(
+    "chat_llm_tokens_total", "LLM tokens used by traced chat requests, as reported by the provider.", ("route", "kind")))
+cache_lookups_total = registry.register(Counter(
+    "chat_cache_lookups_total", "Embedding and answer cache lookups made by traced chat requests.", ("route", "cache", "result")))
+traced_requests_total = registry.register(Counter(
+    "chat_traced_requests_total", "Chat requests picked for tracing (see METRICS_SAMPLE_RATE).", ("route",)))
+
+
+class Trace:
+    """Timings and counts gathered while serving one sampled request."""
+
+    __slots__ = ("route", "started", "spans", "tokens", "caches")
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.spans = []  # (stage, seconds); a stage may appear more than once
+        self.tokens = {}
+        self.caches = {}
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def durations(self):
+        """Total seconds per stage, in the order the stages first ran."""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def server_timing(self):
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.durations().items()]
+        parts += [f'{cache}-cache;desc="{result}"' for cache, result in self.caches.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def finish(self, status):
+        for stage, seconds in self.spans:
+            stage_seconds.observe(seconds, self.route, stage)
+        for kind, count in self.tokens.items():
+            tokens_total.inc(self.route, kind, amount=count)
+        for cache, result in self.caches.items():
+            cache_lookups_total.inc(self.route, cache, result)
+        request_seconds.observe(time.perf_counter() - self.started, self.route, str(status))
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "started")
+
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(stage):
+    """Context manager timing ``stage`` of the current request; free when it isn't traced."""
+    trace = _current_trace.get()
+    return _no_span if trace is None else _Span(trace, stage)
+
+
+def timed(stage):
+    """Decorator form of ``span`` for sync and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(stage):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, hit):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.caches[cache] = "hit" if hit else "miss"
+
+
+def record_tokens(usage, trace=None):
+    """Add a provider ``usage`` object (prompt/completion tokens) to a trace."""
+    trace = trace or _current_trace.get()
+    if trace is None or usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        count = getattr(usage, f"{kind}_tokens", None)
+        if count:
+            trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+
+
+def _sampled():
+    return METRICS_ENABLED and (METRICS_SAMPLE_RATE >= 1.0 or random.random() < METRICS_SAMPLE_RATE)
+
+
+def _traced_stream(trace, content, status):
+    """Re-enter the trace for every chunk, so spans in the response generator count too."""
+    iterator = iter(content)
+    try:
+        while True:
+            token = _current_trace.set(trace)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_trace.reset(token)
+            yield chunk
+    finally:
+        trace.finish(status)
+
+
+async def _traced_async_stream(trace, content, status):
+    iterator = content.__aiter__()
+    try:
+        while True:
+            token = _current_trace.set(trace)
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _current_trace.reset(token)
+            yield chunk
+    finally:
+        trace.finish(status)
+
+
+def _finish_response(trace, response):
+    if SERVER_TIMING_ENABLED:
+        # For streams this covers what happened before the first byte (the LLM comes later)
+        response["Server-Timing"] = trace.server_timing()
+    if isinstance(response, StreamingHttpResponse):
+        if response.is_async:
+            response.streaming_content = _traced_async_stream(trace, response.streaming_content, response.status_code)
+        else:
+            response.streaming_content = _traced_stream(trace, response.streaming_content, response.status_code)
+    else:
+        trace.finish(response.status_code)
+    return response
+
+
+def traced(route):
+    """Decorator for sync or async views: time a sample of requests as ``route``."""
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not _sampled():
+                    return await view(request, *args, **kwargs)
+                trace = Trace(route)
+                traced_requests_total.inc(route)
+                token = _current_trace.set(trace)
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    _current_trace.reset(token)
+                return _finish_response(trace, response)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not _sampled():
+                    return view(request, *args, **kwargs)
+                trace = Trace(route)
+                traced_requests_total.inc(route)
+                token = _current_trace.set(trace)
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    _current_trace.reset(token)
+                return _finish_response(trace, response)
+        return wrapper
+    return decorator
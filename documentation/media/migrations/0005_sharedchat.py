@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0004_alter_documentationfile_doc_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedChat',
+            fields=[
+                ('chat_id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('tool_name', models.CharField(max_length=50)),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+    ]
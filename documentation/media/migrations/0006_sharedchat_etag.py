@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0005_sharedchat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sharedchat',
+            name='etag',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
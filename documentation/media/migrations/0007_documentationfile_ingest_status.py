@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0006_sharedchat_etag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentationfile',
+            name='ingest_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='documentationfile',
+            name='ingest_progress',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='documentationfile',
+            name='ingest_status',
+            field=models.CharField(blank=True, choices=[('', 'Not ingested'), ('queued', 'Queued'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='documentationfile',
+            name='ingest_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='documentationfile',
+            name='ingested_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentationfile',
+            name='ingested_path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
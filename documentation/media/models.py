@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import os
 
 class DocumentationFile(models.Model):
@@ -37,6 +38,24 @@ class DocumentationFile(models.Model):
     upload_date = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     
+    # Chunking and embedding of documentation_file into the "<doc_type>-docs" namespace,
+    # done in the background after each save (see media/upload_ingest.py)
+    INGEST_STATUSES = [
+        ('', 'Not ingested'),
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    ingest_status = models.CharField(max_length=20, choices=INGEST_STATUSES, default='', blank=True, editable=False)
+    ingest_progress = models.PositiveIntegerField(default=0, editable=False)  # chunks written so far
+    ingest_total = models.PositiveIntegerField(default=0, editable=False)  # chunks in the file
+    ingest_error = models.TextField(blank=True, editable=False)
+    ingested_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Chunk path last written, so its chunks can be removed when the file is replaced or deleted
+    ingested_path = models.CharField(max_length=255, blank=True, editable=False)
+    
     def __str__(self):
         return f"{self.get_doc_type_display()} - {self.name}"
     
@@ -47,3 +66,20 @@ class DocumentationFile(models.Model):
         if self.ai_documentation_file:
             return os.path.basename(self.ai_documentation_file.name)
         return "No AI file uploaded"
+
+
+class SharedChat(models.Model):
+    """A shared chat conversation, frozen when it is shared.
+
+    ``payload`` is the zlib-compressed JSON response body, with each AI message
+    already rendered to HTML; ``etag`` validates it.
+    """
+    chat_id = models.CharField(max_length=32, primary_key=True)
+    tool_name = models.CharField(max_length=50)
+    payload = models.BinaryField()
+    etag = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.tool_name} - {self.chat_id}"
@@ -0,0 +1,83 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; files then only get a gzip variant
+    brotli = None
+
+# Files smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 256
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def available_encodings():
+    return [(encoding, suffix) for encoding, suffix in ENCODINGS if encoding != "br" or brotli is not None]
+
+
+def variant_is_fresh(path, suffix):
+    """True when ``path + suffix`` exists and is at least as new as ``path``."""
+    try:
+        return os.stat(path + suffix).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def precompress(path, force=False):
+    """Write .br and .gz variants next to ``path``; returns the encodings written.
+
+    Variants that are already up to date are left alone (unless ``force``), and
+    a variant that wouldn't be smaller than the original is removed instead.
+    """
+    if not path or not os.path.isfile(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+
+    written = []
+    for encoding, suffix in available_encodings():
+        target = path + suffix
+        if len(data) < MIN_COMPRESS_SIZE:
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        if not force and variant_is_fresh(path, suffix):
+            continue
+        compressed = _compress(data, encoding)
+        if len(compressed) >= len(data):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        # Write then rename so a request never sees a half-written variant
+        tmp = f"{target}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, target)
+        written.append(encoding)
+    return written
+
+
+def precompress_document(doc, force=False):
+    """Precompress the documentation and AI summary files of a DocumentationFile."""
+    written = {}
+    for field in (doc.documentation_file, doc.ai_documentation_file):
+        if not field:
+            continue
+        try:
+            path = field.path
+        except Exception as e:
+            print(f"❌ ERROR: {str(e)}")
+            continue
+        try:
+            written[path] = precompress(path, force=force)
+        except OSError as e:
+            print(f"❌ ERROR precompressing {path}: {e}")
+    return written
@@ -0,0 +1,56 @@
+from .context import build_context, context_sources, format_section
+from .metrics import timed
+
+# Chat model settings shared by the JSON, streaming and batch responses
+CHAT_MODEL = "llama3-8b-8192"
+CHAT_TEMPERATURE = 0.1
+CHAT_MAX_TOKENS = 1200
+CHAT_TOP_K = 4  # documentation chunks in the prompt
+
+
+@timed("prompt")
+def build_chat_messages(tool_name, question, matches):
+    """Build the Groq system and user messages from the retrieved matches.
+
+    Returns ``(messages, sources)``, where ``sources`` are the paths whose text
+    fit in the context budget, so the answer only cites what the LLM saw.
+    """
+    # Prepare context for Groq: neighbouring chunks merged, repeats dropped, trimmed to the token budget
+    sections = build_context(matches)
+    contexts = [format_section(section) for section in sections]
+    
+    # Join contexts
+    context = "\n\n" + "=" * 40 + "\n\n".join(contexts) + "\n\n" + "=" * 40 + "\n\n"
+    
+    system_prompt = f"""You are an expert {tool_name.capitalize()} documentation assistant. Your task is to provide high-quality answers by:
+    1. SUMMARIZING the relevant information from the provided documentation context
+    2. EXTRACTING and HIGHLIGHTING any code examples that directly answer the question
+    3. STRUCTURING your answer in a clear format with proper sections
+    4. FOCUSING only on the parts of the context most relevant to the question
+    
+    FORMAT your response as follows:
+    - Start with a direct, concise answer to the question
+    - Include code examples in properly formatted markdown code blocks
+    - Cite the specific documentation sections you used
+    
+    If the provided context doesn't contain sufficient information, acknowledge this limitation clearly."""
+    
+    user_prompt = f"Question: {question}\n\nDocumentation context:\n{context}"
+    
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    return messages, context_sources(sections)
+
+
+def no_docs_answer(tool_name):
+    return f"I don't have enough information about {tool_name} to answer your question. We'll add more documentation soon."
+
+
+def still_learning_answer(tool_name):
+    return f"I'm still learning about {tool_name}. The documentation will be available soon."
+
+
+def busy_answer(tool_name):
+    return f"Lots of people are asking about {tool_name} right now, so I couldn't answer in time. Please try again in a moment."
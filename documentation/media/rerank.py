@@ -0,0 +1,164 @@
+import hashlib
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .context import CONTEXT_TOKEN_BUDGET
+from .embeddings import get_torch_device, normalize_question
+from .metrics import timed
+from .tokens import count_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Cross-encoder reranking of the vector search candidates before they go into the prompt
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() in ("1", "true", "yes")
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))  # chunks fetched from pgvector
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL = int(os.getenv("RERANK_CACHE_TTL", "3600"))  # seconds
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_rerank_model():
+    """Return the CrossEncoder, loading it on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                started = time.monotonic()
+                _model = CrossEncoder(RERANK_MODEL_NAME, device=get_torch_device())
+                print(f"✅ Loaded {RERANK_MODEL_NAME} on {get_torch_device()} in {time.monotonic() - started:.1f}s")
+    return _model
+
+
+def rerank_model_loaded():
+    return _model is not None
+
+
+def candidate_count(top_k):
+    """How many chunks to fetch from pgvector for ``top_k`` prompt chunks."""
+    return max(RERANK_CANDIDATES, top_k) if RERANK_ENABLED else top_k
+
+
+def match_text(match):
+    metadata = match["metadata"]
+    return f"{metadata.get('heading') or ''}\n{metadata.get('content') or ''}"
+
+
+class Reranker:
+    """Scores (question, chunk) pairs with a cross-encoder and keeps the best chunks.
+
+    Scores are cached per (question hash, chunk id, chunk text hash), so a repeat
+    question or a follow-up that retrieves overlapping chunks only scores the new
+    pairs. Uncached pairs are scored in one batched forward pass.
+    """
+
+    def __init__(self, batch_size=32, cache_size=20000, cache_ttl=3600):
+        self.batch_size = batch_size
+        self.scores = LRUCache(max_size=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self.reranks = 0
+        self.pairs_scored = 0
+        self.failures = 0
+        self.total_ms = 0.0
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def score(self, question, matches):
+        """Cross-encoder relevance score of each match, in the order given."""
+        question = normalize_question(question)
+        question_hash = self._digest(question)
+        keys, texts = [], []
+        for match in matches:
+            text = match_text(match)
+            keys.append(f"{question_hash}:{match['id']}:{self._digest(text)}")
+            texts.append(text)
+
+        scores = [self.scores.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = get_rerank_model().predict(
+                [(question, texts[i]) for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                self.scores.set(keys[i], scores[i])
+            with self._lock:
+                self.pairs_scored += len(missing)
+        return scores
+
+    def rerank(self, question, matches, top_k=4, token_budget=1500):
+        """Return the best ``top_k`` matches that fit in ``token_budget`` tokens.
+
+        The best match is always kept even if it alone is over budget. If the
+        model can't be used, the vector search order is kept.
+        """
+        if not matches:
+            return []
+        started = time.perf_counter()
+        try:
+            scores = self.score(question, matches)
+            ranked = sorted(zip(scores, matches), key=lambda pair: pair[0], reverse=True)
+            selected, tokens = [], 0
+            for score, match in ranked:
+                if len(selected) >= top_k:
+                    break
+                length = count_tokens(match_text(match))
+                if selected and tokens + length > token_budget:
+                    continue
+                selected.append({**match, "rerank_score": score})
+                tokens += length
+        except Exception as e:
+            print(f"Error reranking matches: {e}")
+            with self._lock:
+                self.failures += 1
+            return matches[:top_k]
+
+        with self._lock:
+            self.reranks += 1
+            self.total_ms += (time.perf_counter() - started) * 1000
+        return selected
+
+    def stats(self):
+        score_stats = self.scores.stats()
+        with self._lock:
+            return {
+                "enabled": RERANK_ENABLED,
+                "model": RERANK_MODEL_NAME,
+                "model_loaded": rerank_model_loaded(),
+                "candidates": RERANK_CANDIDATES,
+                "token_budget": CONTEXT_TOKEN_BUDGET,
+                "reranks": self.reranks,
+                "failures": self.failures,
+                "pairs_scored": self.pairs_scored,
+                "avg_ms": round(self.total_ms / self.reranks, 3) if self.reranks else 0.0,
+                "score_cache_entries": score_stats["size"],
+                "score_cache_hit_rate": score_stats["hit_rate"],
+            }
+
+
+reranker = Reranker(
+    batch_size=RERANK_BATCH_SIZE,
+    cache_size=RERANK_CACHE_SIZE,
+    cache_ttl=RERANK_CACHE_TTL,
+)
+
+
+@timed("rerank")
+def rerank_matches(question, matches, top_k, token_budget=None):
+    """Rerank vector search matches for the prompt; a plain slice when reranking is off."""
+    if not RERANK_ENABLED:
+        return matches[:top_k]
+    return reranker.rerank(question, matches, top_k, CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget)
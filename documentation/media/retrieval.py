@@ -0,0 +1,321 @@
+import os
+
+from dotenv import load_dotenv
+
+from .db import TEXT_SEARCH_CONFIG, VECTOR_DIMENSION, embedding_storage, ensure_pgvector, get_pool, pending_upgrades
+from .memory_index import memory_index
+from .metrics import timed
+
+# Load environment variables
+load_dotenv()
+
+# Default ANN search parameters; both can be overridden per request
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+
+# Upper bounds for per-request overrides so one request can't force a full scan
+MAX_EF_SEARCH = 1000
+MAX_PROBES = 1000
+
+# "vector" searches embeddings only; "hybrid" also runs a full-text search and
+# fuses both rankings, which helps questions with exact identifiers in them
+RETRIEVAL_MODES = ("vector", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+# Candidates taken from each side before fusion, and the reciprocal-rank fusion constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Binary-quantized storage: chunks fetched by Hamming distance per result, which
+# are then re-ranked on the float16 embeddings (set BINARY_RERANK=false to skip that)
+BINARY_RERANK = os.getenv("BINARY_RERANK", "true").lower() in ("1", "true", "yes")
+BINARY_RERANK_FACTOR = int(os.getenv("BINARY_RERANK_FACTOR", "10"))
+
+# "pgvector" runs every search in PostgreSQL; "memory" answers vector-mode searches from
+# memory-mapped snapshots of each namespace (see memory_index.py). Hybrid searches and
+# namespaces without a snapshot yet still go to PostgreSQL.
+RETRIEVAL_BACKENDS = ("pgvector", "memory")
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pgvector").lower()
+if RETRIEVAL_BACKEND not in RETRIEVAL_BACKENDS:
+    raise ValueError(f"RETRIEVAL_BACKEND must be one of: {', '.join(RETRIEVAL_BACKENDS)}")
+
+MATCH_COLUMNS = "id, heading, path, url, content, chunk_id, total_chunks, level"
+
+
+# The SQL builders below take driver placeholders (e.g. "%(embedding)s" or "$1::text")
+# for their arguments, so psycopg2 and asyncpg share the same queries
+def query_vector_sql(embedding):
+    """The question embedding cast to the column type of the current storage mode."""
+    if embedding_storage() == "vector":
+        return f"{embedding}::vector"
+    return f"{embedding}::vector::halfvec"
+
+
+def nearest_sql(embedding, namespace, limit):
+    """Subquery for the ``limit`` chunks of a namespace nearest to ``embedding``.
+
+    Yields MATCH_COLUMNS plus ``similarity`` (cosine) and ``distance``, the value
+    the chunks were ranked by.
+    """
+    query = query_vector_sql(embedding)
+    cosine = f"embedding <=> {query}"
+    if embedding_storage() != "binary":
+        return f"""
+            SELECT {MATCH_COLUMNS}, 1 - ({cosine}) AS similarity, {cosine} AS distance
+            FROM documents
+            WHERE namespace = {namespace}
+            ORDER BY {cosine}
+            LIMIT {limit}
+        """
+    hamming = f"binary_quantize(embedding)::bit({VECTOR_DIMENSION}) <~> binary_quantize({query})"
+    if not BINARY_RERANK:
+        return f"""
+            SELECT {MATCH_COLUMNS}, 1 - ({cosine}) AS similarity, {hamming} AS distance
+            FROM documents
+            WHERE namespace = {namespace}
+            ORDER BY {hamming}
+            LIMIT {limit}
+        """
+    return f"""
+        SELECT {MATCH_COLUMNS}, 1 - ({cosine}) AS similarity, {cosine} AS distance
+        FROM (
+            SELECT {MATCH_COLUMNS}, embedding
+            FROM documents
+            WHERE namespace = {namespace}
+            ORDER BY {hamming}
+            LIMIT {limit} * {BINARY_RERANK_FACTOR}
+        ) candidates
+        ORDER BY distance
+        LIMIT {limit}
+    """
+
+
+def vector_query_sql(embedding, namespace, top_k):
+    return f"""
+        SELECT {MATCH_COLUMNS}, similarity
+        FROM ({nearest_sql(embedding, namespace, top_k)}) nearest
+        ORDER BY distance
+    """
+
+
+def hybrid_query_sql(embedding, namespace, question, candidates, rrf_k, top_k):
+    """Vector and full-text candidates, ranked and fused in a single query.
+
+    Reciprocal-rank fusion: every chunk scores 1 / (rrf_k + rank) for each list it
+    appears in. The text query ORs the question's terms (plainto_tsquery ANDs them,
+    which almost never matches a whole question).
+    """
+    return f"""
+        WITH semantic AS (
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank
+            FROM ({nearest_sql(embedding, namespace, candidates)}) nearest
+        ),
+        lexical AS (
+            SELECT id, row_number() OVER (ORDER BY ts_rank_cd(search_vector, query) DESC) AS rank
+            FROM documents,
+                CAST(replace(plainto_tsquery('{TEXT_SEARCH_CONFIG}', {question})::text, ' & ', ' | ') AS tsquery) query
+            WHERE namespace = {namespace}
+            AND search_vector @@ query
+            ORDER BY ts_rank_cd(search_vector, query) DESC
+            LIMIT {candidates}
+        ),
+        fused AS (
+            SELECT id, SUM(1.0 / ({rrf_k} + rank)) AS rrf_score
+            FROM (SELECT * FROM semantic UNION ALL SELECT * FROM lexical) ranked
+            GROUP BY id
+        )
+        SELECT
+            d.id,
+            d.heading,
+            d.path,
+            d.url,
+            d.content,
+            d.chunk_id,
+            d.total_chunks,
+            d.level,
+            1 - (d.embedding <=> {query_vector_sql(embedding)}) as similarity,
+            fused.rrf_score
+        FROM
+            fused
+            JOIN documents d ON d.id = fused.id
+        ORDER BY
+            fused.rrf_score DESC
+        LIMIT {top_k}
+    """
+
+
+def batch_query_sql(mode, embeddings, namespace, questions, candidates, rrf_k, top_k):
+    """Search for many questions of one namespace in a single statement.
+
+    ``embeddings`` and ``questions`` are parallel arrays; each element is searched
+    by a LATERAL subquery, and rows come back tagged with the 1-based position of
+    their question in ``ord``. ``embeddings`` should be a vector array: a text
+    array would re-parse the literal for every row it is compared with.
+    """
+    if mode == "hybrid":
+        search = hybrid_query_sql("q.embedding", namespace, "q.question", candidates, rrf_k, top_k)
+        columns = "similarity, rrf_score"
+    else:
+        search = vector_query_sql("q.embedding", namespace, top_k)
+        columns = "similarity"
+    columns = ", ".join(f"m.{column.strip()}" for column in f"{MATCH_COLUMNS}, {columns}".split(","))
+    return f"""
+        SELECT q.ord, {columns}
+        FROM unnest({embeddings}, {questions}) WITH ORDINALITY AS q(embedding, question, ord)
+        CROSS JOIN LATERAL (
+            SELECT s.*, row_number() OVER () AS position FROM ({search}) s
+        ) m
+        ORDER BY q.ord, m.position
+    """
+
+
+def resolve_search_params(top_k, ef_search=None, probes=None):
+    """Clamp per-request ANN parameters and fill in the defaults.
+
+    HNSW can't return more than ``ef_search`` rows, so it is raised to ``top_k`` if needed.
+    """
+    ef_search = HNSW_EF_SEARCH if ef_search is None else int(ef_search)
+    probes = IVFFLAT_PROBES if probes is None else int(probes)
+    ef_search = min(max(ef_search, top_k, 1), MAX_EF_SEARCH)
+    probes = min(max(probes, 1), MAX_PROBES)
+    return ef_search, probes
+
+
+def resolve_mode(mode=None, question=None):
+    """Pick the retrieval mode; hybrid needs the question text and the full-text column."""
+    mode = (mode or RETRIEVAL_MODE).lower()
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(RETRIEVAL_MODES)}")
+    if mode == "hybrid" and (not question or "search_vector" in pending_upgrades()):
+        return "vector"
+    return mode
+
+
+def hybrid_candidates(top_k):
+    return max(HYBRID_CANDIDATES, top_k)
+
+
+def ann_limit(top_k, mode):
+    """How many rows the ANN index has to produce, which ef_search must cover."""
+    limit = hybrid_candidates(top_k) if mode == "hybrid" else top_k
+    if embedding_storage() == "binary" and BINARY_RERANK:
+        limit *= BINARY_RERANK_FACTOR
+    return limit
+
+
+def search_settings_sql(ef_search, probes):
+    """SET LOCAL statements for the ANN indexes; values are validated ints."""
+    return f"SET LOCAL hnsw.ef_search = {int(ef_search)}; SET LOCAL ivfflat.probes = {int(probes)};"
+
+
+def format_match(row):
+    """Format a documents row as a structure similar to Pinecone results."""
+    match = {
+        "id": str(row[0]),
+        "metadata": {
+            "heading": row[1],
+            "path": row[2],
+            "url": row[3],
+            "content": row[4],
+            "chunk_id": row[5],
+            "total_chunks": row[6],
+            "level": row[7],
+        },
+        "score": float(row[8])  # similarity score
+    }
+    if len(row) > 9:
+        match["rrf_score"] = float(row[9])
+    return match
+
+
+def search_memory_index(question_embedding, namespace, top_k, mode):
+    """Matches from the in-process index, or None when PostgreSQL has to answer."""
+    if RETRIEVAL_BACKEND != "memory" or mode != "vector":
+        return None
+    try:
+        rows = memory_index.search(namespace, question_embedding, top_k)
+    except Exception as e:
+        print(f"Error searching the memory index: {e}")
+        return None
+    return None if rows is None else {"matches": [format_match(row) for row in rows]}
+
+
+# Function to query documents from pgvector
+@timed("retrieve")
+def query_similar_docs(question_embedding, namespace, top_k=5, ef_search=None, probes=None, mode=None, question=None):
+    mode = resolve_mode(mode, question)
+    results = search_memory_index(question_embedding, namespace, top_k, mode)
+    if results is not None:
+        return results
+    ensure_pgvector()
+    ef_search, probes = resolve_search_params(ann_limit(top_k, mode), ef_search, probes)
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            # Search parameters and the query go out in one round trip;
+            # SET LOCAL only lasts until the connection goes back to the pool
+            if mode == "hybrid":
+                cursor.execute(search_settings_sql(ef_search, probes) + hybrid_query_sql(
+                    "%(embedding)s", "%(namespace)s", "%(question)s", "%(candidates)s", "%(rrf_k)s", "%(top_k)s",
+                ), {
+                    "embedding": question_embedding,
+                    "namespace": namespace,
+                    "question": question,
+                    "candidates": hybrid_candidates(top_k),
+                    "rrf_k": RRF_K,
+                    "top_k": top_k,
+                })
+            else:
+                cursor.execute(
+                    search_settings_sql(ef_search, probes) + vector_query_sql("%(embedding)s", "%(namespace)s", "%(top_k)s"),
+                    {"embedding": question_embedding, "namespace": namespace, "top_k": top_k}
+                )
+
+            return {"matches": [format_match(row) for row in cursor.fetchall()]}
+
+    except Exception as e:
+        print(f"Error querying PostgreSQL: {e}")
+        return {"matches": []}
+    finally:
+        pool.putconn(conn)
+
+
+def query_similar_docs_batch(question_embeddings, namespace, questions, top_k=5, ef_search=None, probes=None, mode=None):
+    """``query_similar_docs`` for many questions of one namespace, in one round trip.
+
+    Returns one ``{"matches": [...]}`` per question, in order.
+    """
+    # Hybrid needs the text of every question
+    mode = resolve_mode(mode, questions[0] if questions and all(questions) else None)
+    if RETRIEVAL_BACKEND == "memory" and mode == "vector":
+        results = [search_memory_index(embedding, namespace, top_k, mode) for embedding in question_embeddings]
+        if all(result is not None for result in results):
+            return results
+    if not question_embeddings:
+        return []
+    ensure_pgvector()
+    ef_search, probes = resolve_search_params(ann_limit(top_k, mode), ef_search, probes)
+    results = [{"matches": []} for _ in question_embeddings]
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(search_settings_sql(ef_search, probes) + batch_query_sql(
+                mode, "%(embeddings)s::vector[]", "%(namespace)s", "%(questions)s::text[]",
+                "%(candidates)s", "%(rrf_k)s", "%(top_k)s",
+            ), {
+                "embeddings": ["[" + ",".join(map(str, embedding)) + "]" for embedding in question_embeddings],
+                "namespace": namespace,
+                "questions": [question or "" for question in questions],
+                "candidates": hybrid_candidates(top_k),
+                "rrf_k": RRF_K,
+                "top_k": top_k,
+            })
+            for row in cursor.fetchall():
+                results[row[0] - 1]["matches"].append(format_match(row[1:]))
+        return results
+    except Exception as e:
+        print(f"Error querying PostgreSQL (batch): {e}")
+        return results
+    finally:
+        pool.putconn(conn)
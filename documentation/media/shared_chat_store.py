@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .chat_render import render_chat
+from .models import SharedChat
+
+# Load environment variables
+load_dotenv()
+
+# "db" stores shared chats in the SharedChat table, "files" keeps the old one-JSON-file-per-chat layout
+SHARED_CHAT_BACKEND = os.getenv("SHARED_CHAT_BACKEND", "db").lower()
+# Days a shared chat stays available; 0 keeps them forever
+SHARED_CHAT_TTL_DAYS = int(os.getenv("SHARED_CHAT_TTL_DAYS", "0"))
+SHARED_CHAT_CACHE_SIZE = int(os.getenv("SHARED_CHAT_CACHE_SIZE", "1000"))
+SHARED_CHAT_CACHE_TTL = int(os.getenv("SHARED_CHAT_CACHE_TTL", "3600"))  # seconds
+
+SHARED_CHATS_DIR = os.path.join(settings.BASE_DIR, 'media', 'shared_chats')
+
+
+def new_chat_id():
+    return str(uuid.uuid4())[:8]
+
+
+def build_snapshot(chat_data):
+    """Render the chat's AI messages to HTML and serialize it once.
+
+    Returns ``(body, etag)``: the JSON response body as bytes and its strong ETag.
+    """
+    body = json.dumps(render_chat(chat_data), separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def compress_body(body):
+    return zlib.compress(body, 6)
+
+
+def decompress_body(payload):
+    return zlib.decompress(bytes(payload))
+
+
+def _expires_at(created_at=None):
+    if not SHARED_CHAT_TTL_DAYS:
+        return None
+    return (created_at or timezone.now()) + timedelta(days=SHARED_CHAT_TTL_DAYS)
+
+
+class DatabaseSharedChatStore:
+    """Shared chats in the SharedChat table: one primary-key lookup per read.
+
+    Listing and expiry go through the created_at / expires_at indexes.
+    """
+
+    def create(self, chat_data):
+        """Store a new chat and return ``(chat_id, snapshot)``.
+
+        A snapshot is ``(body, etag, expires_at)``; chats never change after this.
+        """
+        for _ in range(5):
+            chat_id = new_chat_id()
+            body, etag = build_snapshot({'chat_id': chat_id, **chat_data})
+            expires_at = _expires_at()
+            try:
+                SharedChat.objects.create(
+                    chat_id=chat_id,
+                    tool_name=chat_data.get('tool_name', 'generic'),
+                    payload=compress_body(body),
+                    etag=etag,
+                    expires_at=expires_at,
+                )
+            except IntegrityError:
+                continue  # 8-character ids can collide; pick another
+            return chat_id, (body, etag, expires_at)
+        raise RuntimeError("Could not allocate a shared chat id")
+
+    def snapshot(self, chat_id):
+        """Return ``(body, etag, expires_at)`` for a chat, or None if it's missing or expired."""
+        chat = SharedChat.objects.filter(chat_id=chat_id).only('payload', 'etag', 'expires_at').first()
+        if chat is None or (chat.expires_at and chat.expires_at <= timezone.now()):
+            return None
+        body, etag = decompress_body(chat.payload), chat.etag
+        if not etag:
+            # Stored before chats were pre-rendered; render it once and keep the result.
+            # Only a still-unrendered row is written, so concurrent first views don't race
+            body, etag = build_snapshot(json.loads(body))
+            SharedChat.objects.filter(chat_id=chat_id, etag='').update(payload=compress_body(body), etag=etag)
+        return body, etag, chat.expires_at
+
+    def delete(self, chat_id):
+        return SharedChat.objects.filter(chat_id=chat_id).delete()[0] > 0
+
+    def list(self, limit=50, before=None, tool_name=None):
+        """Newest chats first as ``{chat_id, tool_name, created_at, expires_at}`` dicts.
+
+        Pass the last ``created_at`` as ``before`` to get the next page.
+        """
+        chats = SharedChat.objects.order_by('-created_at')
+        if before:
+            chats = chats.filter(created_at__lt=before)
+        if tool_name:
+            chats = chats.filter(tool_name=tool_name)
+        return list(chats.values('chat_id', 'tool_name', 'created_at', 'expires_at')[:limit])
+
+    def cleanup(self, now=None):
+        """Delete expired chats; returns how many were removed."""
+        return SharedChat.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
+
+    def import_chat(self, chat_data, created_at=None):
+        """Insert an existing chat under its own id; returns False if the id is taken."""
+        created_at = created_at or timezone.now()
+        body, etag = build_snapshot(chat_data)
+        _, created = SharedChat.objects.get_or_create(
+            chat_id=chat_data['chat_id'],
+            defaults={
+                'tool_name': chat_data.get('tool_name', 'generic'),
+                'payload': compress_body(body),
+                'etag': etag,
+                'created_at': created_at,
+                'expires_at': _expires_at(created_at),
+            },
+        )
+        return created
+
+
+class FileSharedChatStore:
+    """The original layout: one JSON file per chat in ``directory``.
+
+    Kept for setups without a database migration; listing and cleanup have to
+    scan the directory, which the database store avoids.
+    """
+
+    def __init__(self, directory=SHARED_CHATS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id):
+        return os.path.join(self.directory, f'{os.path.basename(chat_id)}.json')
+
+    def create(self, chat_data):
+        chat_id = new_chat_id()
+        body, etag = build_snapshot({'chat_id': chat_id, **chat_data})
+        with open(self._path(chat_id), 'wb') as f:
+            f.write(body)
+        return chat_id, (body, etag, _expires_at())
+
+    def snapshot(self, chat_id):
+        path = self._path(chat_id)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        if SHARED_CHAT_TTL_DAYS and mtime < time.time() - SHARED_CHAT_TTL_DAYS * 86400:
+            return None
+        chat_data = json.loads(body)
+        if any('html' not in message for message in chat_data.get('messages', []) if message.get('sender') != 'user'):
+            # Written before chats were pre-rendered
+            body, etag = build_snapshot(chat_data)
+            with open(path, 'wb') as f:
+                f.write(body)
+        else:
+            etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        return body, etag, _expires_at(datetime.fromtimestamp(mtime, tz=dt_timezone.utc))
+
+    def delete(self, chat_id):
+        try:
+            os.remove(self._path(chat_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, limit=50, before=None, tool_name=None):
+        chats = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            created_at = datetime.fromtimestamp(entry.stat().st_mtime, tz=dt_timezone.utc)
+            if before and created_at >= before:
+                continue
+            chats.append({'chat_id': entry.name[:-5], 'tool_name': None, 'created_at': created_at, 'expires_at': None})
+        chats.sort(key=lambda chat: chat['created_at'], reverse=True)
+        return chats[:limit]
+
+    def cleanup(self, now=None):
+        if not SHARED_CHAT_TTL_DAYS:
+            return 0
+        cutoff = (now or timezone.now()).timestamp() - SHARED_CHAT_TTL_DAYS * 86400
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+
+class CachedSharedChatStore:
+    """Read-through LRU cache of snapshots in front of a store. Shared chats never
+    change, so entries only leave the cache on eviction, TTL, expiry or delete."""
+
+    def __init__(self, store, max_size=1000, ttl=3600):
+        self.store = store
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def create(self, chat_data):
+        """Store a new chat and return its chat_id."""
+        chat_id, snapshot = self.store.create(chat_data)
+        self.cache.set(chat_id, snapshot)
+        return chat_id
+
+    def snapshot(self, chat_id):
+        """``(body, etag, expires_at)`` of a chat, or None; a cache hit is a dict lookup."""
+        snapshot = self.cache.get(chat_id)
+        if snapshot is None:
+            snapshot = self.store.snapshot(chat_id)
+            if snapshot is None:
+                return None
+            self.cache.set(chat_id, snapshot)
+        expires_at = snapshot[2]
+        if expires_at and expires_at <= timezone.now():
+            self.cache.delete(chat_id)
+            return None
+        return snapshot
+
+    def get(self, chat_id):
+        """The chat as a dict, AI messages including their ``html``."""
+        snapshot = self.snapshot(chat_id)
+        return json.loads(snapshot[0]) if snapshot else None
+
+    def delete(self, chat_id):
+        self.cache.delete(chat_id)
+        return self.store.delete(chat_id)
+
+    def list(self, *args, **kwargs):
+        return self.store.list(*args, **kwargs)
+
+    def cleanup(self, now=None):
+        removed = self.store.cleanup(now)
+        if removed:
+            self.cache.clear()
+        return removed
+
+    def stats(self):
+        return {"backend": SHARED_CHAT_BACKEND, **self.cache.stats()}
+
+
+def import_chat_files(directory=SHARED_CHATS_DIR, delete_files=False, log=print):
+    """Copy the JSON files of the file store into the database store.
+
+    Chats keep their ids (so existing share links still work) and their
+    created_at. Returns ``(imported, skipped, failed)`` counts.
+    """
+    store = DatabaseSharedChatStore()
+    imported = skipped = failed = 0
+    if not os.path.isdir(directory):
+        return imported, skipped, failed
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                chat_data = json.load(f)
+            chat_data.setdefault('chat_id', entry.name[:-5])
+            created_at = parse_datetime(str(chat_data.get('created_at', ''))) or datetime.fromtimestamp(
+                entry.stat().st_mtime, tz=dt_timezone.utc)
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at, dt_timezone.utc)
+            if store.import_chat(chat_data, created_at):
+                imported += 1
+            else:
+                skipped += 1
+            if delete_files:
+                os.remove(entry.path)
+        except (OSError, ValueError) as e:
+            log(f"❌ ERROR importing {entry.name}: {e}")
+            failed += 1
+    return imported, skipped, failed
+
+
+def _build_store():
+    if SHARED_CHAT_BACKEND == "files":
+        store = FileSharedChatStore()
+    elif SHARED_CHAT_BACKEND == "db":
+        store = DatabaseSharedChatStore()
+    else:
+        raise ValueError(f"Unknown SHARED_CHAT_BACKEND: {SHARED_CHAT_BACKEND}")
+    return CachedSharedChatStore(store, max_size=SHARED_CHAT_CACHE_SIZE, ttl=SHARED_CHAT_CACHE_TTL)
+
+
+shared_chat_store = _build_store()
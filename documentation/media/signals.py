@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .doc_text import doc_text_cache
+from .models import DocumentationFile
+from .upload_ingest import UPLOAD_INGEST_ENABLED, upload_ingest_queue
+
+
+@receiver(post_save, sender=DocumentationFile)
+@receiver(post_delete, sender=DocumentationFile)
+def invalidate_doc_text_cache(sender, instance, **kwargs):
+    # A rename or re-upload changes which file a name points to
+    doc_text_cache.invalidate()
+
+
+@receiver(post_save, sender=DocumentationFile)
+def precompress_documentation_files(sender, instance, raw=False, **kwargs):
+    # Brotli at quality 11 takes seconds on a large file, so it runs on the background queue;
+    # until then the file is served uncompressed (a variant older than its file is never used)
+    if raw or not (instance.documentation_file or instance.ai_documentation_file):
+        return
+    transaction.on_commit(lambda: upload_ingest_queue.enqueue_precompress(instance.pk))
+
+
+@receiver(post_save, sender=DocumentationFile)
+def queue_documentation_ingest(sender, instance, raw=False, **kwargs):
+    # Chunk and embed the file in the background; the admin request returns right away
+    if raw or not UPLOAD_INGEST_ENABLED:
+        return
+    if not instance.documentation_file and not instance.ingested_path:
+        return
+    DocumentationFile.objects.filter(pk=instance.pk).update(ingest_status='queued', ingest_error='')
+    # After the commit, so the worker reads the saved row
+    transaction.on_commit(lambda: upload_ingest_queue.enqueue(instance.pk))
+
+
+@receiver(post_delete, sender=DocumentationFile)
+def queue_documentation_removal(sender, instance, **kwargs):
+    if UPLOAD_INGEST_ENABLED and instance.ingested_path:
+        transaction.on_commit(lambda: upload_ingest_queue.enqueue_removal(instance.ingested_path))
@@ -24,27 +24,27 @@ document.addEventListener('DOMContentLoaded', function() {
   });
   
   function copyText(type, name, element) {
+    // The raw file comes precompressed and cacheable; the JSON endpoints cover missing files
+    const fileUrl = `/files/${type}/${encodeURIComponent(name)}/`;
     const url = type === 'doc' ? 
       `/copy_doc_text/?name=${encodeURIComponent(name)}` : 
       `/copy_ai_summary/?name=${encodeURIComponent(name)}`;
     
-    console.log(`Copying ${type} for ${name} from ${url}`);
+    console.log(`Copying ${type} for ${name} from ${fileUrl}`);
     
-    fetch(url)
-      .then(response => response.json())
-      .then(data => {
-        // Get content from the response
-        let content;
-        if (data.text) {
-          content = data.text;
-        } else if (data.summary) {
-          content = data.summary;
-        } else if (data.error) {
-          content = `No content available for ${name}`;
-        } else {
-          content = `No content available for ${name}`;
-        }
-        
+    fetch(fileUrl)
+      .then(response => response.ok ? response.text() : fetch(url)
+        .then(response => response.json())
+        .then(data => {
+          // Get content from the response
+          if (data.text) {
+            return data.text;
+          } else if (data.summary) {
+            return data.summary;
+          }
+          return `No content available for ${name}`;
+        }))
+      .then(content => {
         // Copy to clipboard
         navigator.clipboard.writeText(content)
           .then(() => {
@@ -230,12 +230,20 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Restore each message
         messages.forEach(msg => {
+            if (msg.html && msg.sender !== 'user') {
+                // Shared chats come with their answers already rendered on the server
+                const messageBubble = createMessageBubble(msg.sender);
+                messageBubble.style.whiteSpace = 'normal';
+                messageBubble.innerHTML = msg.html;
+                finishMessageBubble(messageBubble);
+                return;
+            }
             // Use the original function to avoid recursively adding to history
             originalAppendMessage(msg.sender, msg.content);
         });
         
-        // Set current chat history
-        chatHistory = messages;
+        // Set current chat history (the rendered HTML is only needed for display)
+        chatHistory = messages.map(({ html, ...msg }) => msg);
     }
 
     // Show banner for shared chat
@@ -328,17 +336,22 @@ document.addEventListener('DOMContentLoaded', () => {
                 },
                 body: JSON.stringify({
                     question: userQuestion,
-                    tool_name: toolName
+                    tool_name: toolName,
+                    stream: true
                 })
             });
             
-            // Remove typing indicator
-            removeTypingIndicator(typingIndicatorId);
+            const contentType = response.headers.get('Content-Type') || '';
             
-            if (response.ok) {
+            if (response.ok && contentType.includes('text/event-stream') && response.body) {
+                // Render the answer as tokens arrive; the indicator goes away with the first token
+                await readStreamingAnswer(response, typingIndicatorId);
+            } else if (response.ok) {
+                removeTypingIndicator(typingIndicatorId);
                 const data = await response.json();
                 appendMessage('ai', data.answer);
             } else {
+                removeTypingIndicator(typingIndicatorId);
                 appendMessage('ai', 'Sorry, I encountered an error while processing your request.');
             }
         } catch (error) {
@@ -348,9 +361,85 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
-    // Helper function to add a message to the chat
-    function appendMessage(sender, content) {
-        const messageId = `msg-${Date.now()}`;
+    // Read a server-sent events chat response and render it incrementally
+    async function readStreamingAnswer(response, typingIndicatorId) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let messageBubble = null;
+        let frameId = null;
+        
+        const render = () => {
+            frameId = null;
+            messageBubble.innerHTML = formatMarkdown(answer);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        };
+        
+        const handleEvent = (eventName, data) => {
+            if (eventName !== 'token' || !data.text) return;
+            
+            if (!messageBubble) {
+                removeTypingIndicator(typingIndicatorId);
+                messageBubble = createMessageBubble('ai');
+            }
+            answer += data.text;
+            
+            // Re-render at most once per frame
+            if (frameId === null) {
+                frameId = requestAnimationFrame(render);
+            }
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+                
+                if (dataLines.length) {
+                    try {
+                        handleEvent(eventName, JSON.parse(dataLines.join('\n')));
+                    } catch (e) {
+                        console.error('Error parsing stream event:', e);
+                    }
+                }
+            }
+        }
+        
+        removeTypingIndicator(typingIndicatorId);
+        
+        if (!messageBubble) {
+            appendMessage('ai', 'Sorry, I encountered an error while processing your request.');
+            return;
+        }
+        
+        // Final render with code highlighting, then save the full answer
+        if (frameId !== null) {
+            cancelAnimationFrame(frameId);
+        }
+        render();
+        finishMessageBubble(messageBubble);
+        saveToHistory('ai', answer);
+    }
+    
+    // Create an empty message bubble and add it to the chat
+    function createMessageBubble(sender) {
         const isUser = sender === 'user';
         
         const messageDiv = document.createElement('div');
@@ -366,24 +455,38 @@ document.addEventListener('DOMContentLoaded', () => {
             : 'bg-blue-50 border border-blue-100 rounded-2xl py-3 px-4 message-bubble ai-message max-w-3xl';
         messageBubble.style.whiteSpace = 'pre-wrap';
         
-        if (isUser) {
+        messageDiv.appendChild(messageBubble);
+        chatMessages.appendChild(messageDiv);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+        
+        return messageBubble;
+    }
+    
+    // Add syntax highlighting and copy buttons to the code blocks of an AI message
+    function finishMessageBubble(messageBubble) {
+        setTimeout(() => {
+            const codeBlocks = messageBubble.querySelectorAll('pre code');
+            codeBlocks.forEach(block => {
+                addCopyButton(block);
+                highlightCode(block);
+            });
+        }, 0);
+    }
+    
+    // Helper function to add a message to the chat
+    function appendMessage(sender, content) {
+        const messageBubble = createMessageBubble(sender);
+        
+        if (sender === 'user') {
             messageBubble.textContent = content;
         } else {
             // Process markdown for AI responses
             messageBubble.innerHTML = formatMarkdown(content);
             
             // Add syntax highlighting to code blocks
-            setTimeout(() => {
-                const codeBlocks = messageBubble.querySelectorAll('pre code');
-                codeBlocks.forEach(block => {
-                    addCopyButton(block);
-                    highlightCode(block);
-                });
-            }, 0);
+            finishMessageBubble(messageBubble);
         }
         
-        messageDiv.appendChild(messageBubble);
-        chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
     }
     
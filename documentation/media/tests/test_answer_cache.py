@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from media.answer_cache import SemanticAnswerCache
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+    def test_returns_the_closest_question_above_the_threshold(self):
+        cache = SemanticAnswerCache(threshold=0.9)
+        cache.set("django-docs", [1.0, 0.0], {"answer": "a"})
+        cache.set("django-docs", [0.0, 1.0], {"answer": "b"})
+
+        payload, similarity = cache.get("django-docs", [2.0, 0.1])
+        self.assertEqual(payload, {"answer": "a"})
+        self.assertGreater(similarity, 0.99)
+        self.assertIsNone(cache.get("django-docs", [1.0, 1.0]))
+        self.assertIsNone(cache.get("flask-docs", [1.0, 0.0]))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_keeps_max_size_entries_per_namespace(self):
+        cache = SemanticAnswerCache(threshold=0.99, max_size=2)
+        for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+            cache.set("django-docs", vector, {"answer": i})
+        self.assertIsNone(cache.get("django-docs", [1.0, 0.0, 0.0]))
+        self.assertEqual(cache.get("django-docs", [0.0, 0.0, 1.0])[0], {"answer": 2})
+
+    def test_entries_expire(self):
+        cache = SemanticAnswerCache(ttl=-1)
+        cache.set("django-docs", [1.0, 0.0], {"answer": "a"})
+        self.assertIsNone(cache.get("django-docs", [1.0, 0.0]))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_forgets_the_least_recently_used_namespace(self):
+        cache = SemanticAnswerCache(max_namespaces=2)
+        cache.set("a-docs", [1.0, 0.0], {"answer": "a"})
+        cache.set("b-docs", [1.0, 0.0], {"answer": "b"})
+        cache.get("a-docs", [1.0, 0.0])
+        cache.set("c-docs", [1.0, 0.0], {"answer": "c"})
+
+        self.assertIsNotNone(cache.get("a-docs", [1.0, 0.0]))
+        self.assertIsNone(cache.get("b-docs", [1.0, 0.0]))
+        self.assertEqual(cache.stats()["namespaces"], 2)
+
+    def test_invalidate_one_namespace_or_all(self):
+        cache = SemanticAnswerCache()
+        cache.set("a-docs", [1.0, 0.0], {"answer": "a"})
+        cache.set("b-docs", [1.0, 0.0], {"answer": "b"})
+        cache.invalidate("a-docs")
+        self.assertIsNone(cache.get("a-docs", [1.0, 0.0]))
+        self.assertIsNotNone(cache.get("b-docs", [1.0, 0.0]))
+        cache.invalidate()
+        self.assertIsNone(cache.get("b-docs", [1.0, 0.0]))
+
+
+class AnswerCacheSyncTests(SimpleTestCase):
+    def setUp(self):
+        # sync() is called directly; no background thread is started without a set() on a syncing cache
+        self.cache = SemanticAnswerCache(sync_interval=None)
+        self.cache.set("a-docs", [1.0, 0.0], {"answer": "a"})
+        self.cache.set("b-docs", [1.0, 0.0], {"answer": "b"})
+        self.generations = {"a-docs": 1, "b-docs": 1, "*": 0}
+        patcher = mock.patch("media.answer_cache.read_generations",
+                             side_effect=lambda names: {name: self.generations.get(name, 0) for name in [*names, "*"]})
+        self.read_generations = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache.sync()
+
+    def test_drops_a_namespace_bumped_by_another_process(self):
+        self.generations["a-docs"] = 2
+        self.cache.sync()
+        self.assertIsNone(self.cache.get("a-docs", [1.0, 0.0]))
+        self.assertIsNotNone(self.cache.get("b-docs", [1.0, 0.0]))
+
+    def test_drops_everything_when_all_namespaces_are_bumped(self):
+        self.generations["*"] = 1
+        self.cache.sync()
+        self.assertEqual(self.cache.stats()["namespaces"], 0)
+
+    def test_only_reads_cached_namespaces(self):
+        self.assertEqual(sorted(self.read_generations.call_args.args[0]), ["a-docs", "b-docs"])
+
+    def test_lookups_do_not_read_the_database(self):
+        self.read_generations.reset_mock()
+        self.cache.get("a-docs", [1.0, 0.0])
+        self.cache.get("unknown-docs", [1.0, 0.0])
+        self.read_generations.assert_not_called()
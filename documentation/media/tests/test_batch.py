@@ -0,0 +1,59 @@
+import json
+
+from django.test import RequestFactory, SimpleTestCase
+
+from media.batch import BATCH_MAX_TOP_K, parse_batch_items, parse_top_k
+from media.views import batch_chat_api
+
+
+class ParseTopKTests(SimpleTestCase):
+    def test_unset_means_the_default(self):
+        self.assertIsNone(parse_top_k(None))
+        self.assertIsNone(parse_top_k(""))
+
+    def test_accepts_integers_and_numeric_strings(self):
+        self.assertEqual(parse_top_k(3), 3)
+        self.assertEqual(parse_top_k("3"), 3)
+
+    def test_clamps_to_the_batch_maximum(self):
+        self.assertEqual(parse_top_k(BATCH_MAX_TOP_K + 100), BATCH_MAX_TOP_K)
+
+    def test_rejects_anything_but_a_positive_integer(self):
+        for value in (0, -1, "ten", [5], {"k": 5}):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_top_k(value)
+
+
+class ParseBatchItemsTests(SimpleTestCase):
+    def test_invalid_items_become_errors_in_place(self):
+        valid, errors = parse_batch_items([
+            {"question": "How do I migrate?", "id": "a"},
+            {"tool_name": "flask", "question": ""},
+            "not an object",
+            {"tool_name": "flask", "question": "What is a blueprint?"},
+        ], default_tool_name="django")
+
+        self.assertEqual([(item["index"], item["tool_name"]) for item in valid], [(0, "django"), (3, "flask")])
+        self.assertEqual(valid[0]["id"], "a")
+        self.assertEqual([error["index"] for error in errors], [1, 2])
+
+    def test_items_must_be_a_list(self):
+        with self.assertRaises(ValueError):
+            parse_batch_items({"question": "How do I migrate?"})
+
+
+class BatchChatApiValidationTests(SimpleTestCase):
+    def post(self, body):
+        request = RequestFactory().post("/api/chat/batch/", json.dumps(body), content_type="application/json")
+        return batch_chat_api(request)
+
+    def test_non_integer_top_k_is_a_bad_request(self):
+        for top_k in ([5], {"k": 5}, "many", 0):
+            with self.subTest(top_k=top_k):
+                response = self.post({"items": [{"tool_name": "django", "question": "Hi?"}], "top_k": top_k})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("top_k", json.loads(response.content)["error"])
+
+    def test_body_must_be_an_object_with_items(self):
+        self.assertEqual(self.post(["not", "an", "object"]).status_code, 400)
+        self.assertEqual(self.post({"items": "nope"}).status_code, 400)
@@ -0,0 +1,114 @@
+from django.test import SimpleTestCase
+
+from media.benchmark import compare_reports, fake_llm, summarize, synthetic_documents
+from media.llm import FakeProvider, llm_scheduler
+
+
+def report(*results):
+    return {"results": list(results)}
+
+
+def result(scenario, concurrency, p95_ms, qps, count=100, **extra):
+    return {"scenario": scenario, "concurrency": concurrency, "p95_ms": p95_ms, "qps": qps, "count": count, **extra}
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_percentiles_in_milliseconds(self):
+        row = summarize([i / 1000 for i in range(1, 101)], wall_seconds=2.0, errors=3)
+        self.assertEqual(row["count"], 100)
+        self.assertEqual(row["errors"], 3)
+        self.assertEqual(row["qps"], 50.0)
+        self.assertAlmostEqual(row["p50_ms"], 50.5)
+        self.assertAlmostEqual(row["p95_ms"], 95.05)
+        self.assertAlmostEqual(row["p99_ms"], 99.01)
+        self.assertAlmostEqual(row["mean_ms"], 50.5)
+        self.assertAlmostEqual(row["max_ms"], 100.0)
+
+    def test_no_latencies(self):
+        row = summarize([], wall_seconds=0, errors=2)
+        self.assertEqual(row, {"count": 0, "errors": 2, "seconds": 0, "qps": 0.0})
+
+
+class CompareReportsTests(SimpleTestCase):
+    def test_flags_slower_p95_and_lower_throughput(self):
+        baseline = report(
+            result("retrieval", 1, p95_ms=10.0, qps=100.0, mode="vector"),
+            result("retrieval", 4, p95_ms=10.0, qps=100.0, mode="vector"),
+            result("chat", 1, p95_ms=300.0, qps=3.0),
+        )
+        current = report(
+            result("retrieval", 1, p95_ms=13.0, qps=100.0, mode="vector"),
+            result("retrieval", 4, p95_ms=10.0, qps=70.0, mode="vector"),
+            result("chat", 1, p95_ms=330.0, qps=2.9),
+        )
+        rows = {row["key"]: row for row in compare_reports(baseline, current, tolerance=0.2)}
+
+        self.assertEqual(set(rows), {"retrieval vector x1", "retrieval vector x4", "chat x1"})
+        self.assertTrue(rows["retrieval vector x1"]["regression"])
+        self.assertEqual(rows["retrieval vector x1"]["p95_change"], 0.3)
+        self.assertTrue(rows["retrieval vector x4"]["regression"])
+        self.assertEqual(rows["retrieval vector x4"]["qps_change"], -0.3)
+        self.assertFalse(rows["chat x1"]["regression"])
+        self.assertEqual(rows["chat x1"]["p95_ms"], (300.0, 330.0))
+
+    def test_tolerance_is_configurable(self):
+        baseline = report(result("chat", 1, p95_ms=100.0, qps=10.0))
+        current = report(result("chat", 1, p95_ms=115.0, qps=10.0))
+        self.assertFalse(compare_reports(baseline, current, tolerance=0.2)[0]["regression"])
+        self.assertTrue(compare_reports(baseline, current, tolerance=0.1)[0]["regression"])
+
+    def test_skips_results_missing_from_either_report_or_empty(self):
+        baseline = report(
+            result("retrieval", 1, p95_ms=10.0, qps=100.0, mode="vector"),
+            result("chat", 1, p95_ms=300.0, qps=3.0, count=0),
+        )
+        current = report(
+            result("retrieval", 1, p95_ms=10.0, qps=100.0, mode="hybrid"),
+            result("chat", 1, p95_ms=900.0, qps=1.0),
+        )
+        self.assertEqual(compare_reports(baseline, current), [])
+
+    def test_namespace_rows_match_by_namespace(self):
+        baseline = report(result("seed", 1, p95_ms=50.0, qps=20.0, namespace="bench0-docs"))
+        current = report(
+            result("seed", 1, p95_ms=50.0, qps=20.0, namespace="bench0-docs"),
+            result("seed", 1, p95_ms=500.0, qps=2.0, namespace="bench1-docs"),
+        )
+        rows = compare_reports(baseline, current)
+        self.assertEqual([row["key"] for row in rows], ["seed bench0-docs x1"])
+        self.assertFalse(rows[0]["regression"])
+
+
+class SyntheticDocumentsTests(SimpleTestCase):
+    def test_same_seed_same_documents(self):
+        self.assertEqual(list(synthetic_documents("bench0-docs", 12, seed=7)),
+                         list(synthetic_documents("bench0-docs", 12, seed=7)))
+
+    def test_seed_and_namespace_change_the_content(self):
+        docs = [doc["content"] for doc in synthetic_documents("bench0-docs", 12, seed=7)]
+        self.assertNotEqual(docs, [doc["content"] for doc in synthetic_documents("bench0-docs", 12, seed=8)])
+        self.assertNotEqual(docs, [doc["content"] for doc in synthetic_documents("bench1-docs", 12, seed=7)])
+
+    def test_chunk_keys_are_unique(self):
+        docs = list(synthetic_documents("bench0-docs", 10))
+        self.assertEqual(len({(doc["path"], doc["chunk_id"]) for doc in docs}), 10)
+        self.assertEqual(docs[5]["path"], "bench/bench0-docs/page-1.md")
+        self.assertEqual(docs[5]["chunk_id"], 1)
+
+
+class FakeLLMTests(SimpleTestCase):
+    def test_swaps_and_restores_the_scheduler(self):
+        provider, limiter = llm_scheduler.provider, llm_scheduler.limiter
+        with fake_llm(latency_ms=5):
+            self.assertIsInstance(llm_scheduler.provider, FakeProvider)
+            self.assertIsNot(llm_scheduler.limiter, limiter)
+        self.assertIs(llm_scheduler.provider, provider)
+        self.assertIs(llm_scheduler.limiter, limiter)
+
+    def test_restores_after_an_error(self):
+        provider, limiter = llm_scheduler.provider, llm_scheduler.limiter
+        with self.assertRaises(RuntimeError):
+            with fake_llm(latency_ms=5):
+                raise RuntimeError("benchmark failed")
+        self.assertIs(llm_scheduler.provider, provider)
+        self.assertIs(llm_scheduler.limiter, limiter)
@@ -0,0 +1,48 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from media.cache import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_the_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = LRUCache(ttl=10)
+        now = time.monotonic()
+        with mock.patch("media.cache.time.monotonic", return_value=now):
+            cache.set("a", 1)
+            cache.set("forever", 2, ttl=0)
+        with mock.patch("media.cache.time.monotonic", return_value=now + 11):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("forever"), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_cached_falsy_values_are_hits(self):
+        cache = LRUCache()
+        cache.set("empty", [])
+        self.assertEqual(cache.get("empty", "default"), [])
+        self.assertEqual(cache.get("missing", "default"), "default")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_delete_and_clear(self):
+        cache = LRUCache()
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.delete("a")
+        cache.delete("missing")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,75 @@
+import json
+import zlib
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from media.chat_render import render_chat, render_message
+from media.models import SharedChat
+from media.shared_chat_store import DatabaseSharedChatStore, build_snapshot
+
+
+class RenderMessageTests(SimpleTestCase):
+    def test_raw_html_is_escaped(self):
+        html = render_message('<script>alert(1)</script> and <b onclick="x()">bold</b>')
+        self.assertNotIn("<script>", html)
+        self.assertNotIn("<b ", html)
+        self.assertIn("&lt;script&gt;", html)
+
+    def test_unsafe_links_point_nowhere(self):
+        for href in ("javascript:alert(1)", "JAVASCRIPT:alert(1)", "data:text/html,hi", "//evil.example", "/\\evil.example"):
+            with self.subTest(href=href):
+                self.assertIn('href="#"', render_message(f"[click]({href})"))
+
+    def test_safe_links_are_kept_and_open_in_a_new_tab(self):
+        for href in ("https://docs.djangoproject.com/", "mailto:help@example.com", "/files/doc/guide/", "#setup"):
+            with self.subTest(href=href):
+                html = render_message(f"[link]({href})")
+                self.assertIn(f'href="{href}"', html)
+                self.assertIn('target="_blank"', html)
+
+    def test_images_become_their_alt_text(self):
+        html = render_message("![diagram](https://example.com/track.png)")
+        self.assertNotIn("<img", html)
+        self.assertIn("<span>diagram</span>", html)
+
+    def test_code_blocks_are_escaped_and_styled(self):
+        html = render_message("```\n<div>{{ x }}</div>\n```")
+        self.assertIn('class="language-python block text-left"', html)
+        self.assertIn("&lt;div&gt;", html)
+
+    def test_citations_become_escaped_search_links(self):
+        html = render_message("Answer.\n\nCited documentation sections:\nSection: <Views>\n", "flask")
+        self.assertIn("flask.palletsprojects.com/en/latest/search/?q=%3CViews%3E", html)
+        self.assertIn("&lt;Views&gt;</a>", html)
+
+    def test_render_chat_leaves_user_messages_as_text(self):
+        chat = render_chat({"messages": [{"sender": "user", "content": "<i>hi</i>", "html": "<b>forged</b>"},
+                                         {"sender": "ai", "content": "*hello*"}]})
+        self.assertNotIn("html", chat["messages"][0])
+        self.assertIn("<em>hello</em>", chat["messages"][1]["html"])
+
+
+class LegacySharedChatTests(TestCase):
+    def setUp(self):
+        chat = {"chat_id": "legacy01", "tool_name": "django", "messages": [{"sender": "ai", "content": "**hi**"}]}
+        SharedChat.objects.create(chat_id="legacy01", tool_name="django",
+                                  payload=zlib.compress(json.dumps(chat).encode("utf-8")), etag="")
+
+    def test_unrendered_chat_is_rendered_once(self):
+        store = DatabaseSharedChatStore()
+        body, etag, _ = store.snapshot("legacy01")
+        self.assertIn("<strong>hi</strong>", json.loads(body)["messages"][0]["html"])
+        self.assertEqual(SharedChat.objects.get(chat_id="legacy01").etag, etag)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(store.snapshot("legacy01"), (body, etag, None))
+
+    def test_a_row_rendered_meanwhile_is_not_overwritten(self):
+        def render_after_another_worker(chat_data):
+            SharedChat.objects.filter(chat_id="legacy01").update(etag='"other-worker"')
+            return build_snapshot(chat_data)
+
+        with mock.patch("media.shared_chat_store.build_snapshot", render_after_another_worker):
+            DatabaseSharedChatStore().snapshot("legacy01")
+        self.assertEqual(SharedChat.objects.get(chat_id="legacy01").etag, '"other-worker"')
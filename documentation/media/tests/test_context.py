@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from media.context import build_context, strip_overlap
+from media.prompts import build_chat_messages
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def first_words(text, max_tokens):
+    return " ".join(text.split()[:max(max_tokens, 0)])
+
+
+def match(path, content, chunk_id=0, heading=""):
+    return {"id": f"{path}#{chunk_id}",
+            "metadata": {"path": path, "chunk_id": chunk_id, "heading": heading, "content": content}}
+
+
+class StripOverlapTests(SimpleTestCase):
+    def test_drops_the_repeated_start(self):
+        shared = "the shared sentence between two chunks"
+        self.assertEqual(strip_overlap("First chunk ends with " + shared, shared + " and goes on"), "and goes on")
+
+    def test_short_overlaps_are_kept(self):
+        self.assertEqual(strip_overlap("ends with the", "the next chunk"), "the next chunk")
+
+
+# Budgets are counted in words here, so the tests don't need the embedding model's tokenizer
+@mock.patch("media.context.count_tokens", count_words)
+@mock.patch("media.context.truncate_to_tokens", first_words)
+class BuildContextTests(SimpleTestCase):
+    def test_consecutive_chunks_become_one_section(self):
+        overlap = "this sentence is repeated at the chunk border"
+        matches = [match("a.md", "opening words " + overlap, chunk_id=3),
+                   match("b.md", "other file"),
+                   match("a.md", overlap + " closing words", chunk_id=4)]
+        sections = build_context(matches, token_budget=1000)
+
+        self.assertEqual([(s["path"], s["chunk_ids"]) for s in sections], [("a.md", [3, 4]), ("b.md", [0])])
+        self.assertEqual(sections[0]["content"].count(overlap), 1)
+        self.assertIn("closing words", sections[0]["content"])
+
+    def test_sections_rank_by_their_best_chunk(self):
+        matches = [match("b.md", "best"), match("a.md", "second", chunk_id=1), match("b.md", "third", chunk_id=7)]
+        self.assertEqual([s["path"] for s in build_context(matches, token_budget=1000)], ["b.md", "a.md", "b.md"])
+
+    def test_repeated_paragraphs_are_sent_once(self):
+        paragraph = "A paragraph long enough to be worth de-duplicating across files."
+        matches = [match("a.md", f"Intro.\n\n{paragraph}"), match("b.md", f"{paragraph}\n\nOnly in b.")]
+        sections = build_context(matches, token_budget=1000)
+        self.assertEqual(sum(s["content"].count(paragraph) for s in sections), 1)
+        self.assertEqual(sections[1]["content"], "Only in b.")
+
+    def test_last_section_is_cut_to_the_budget(self):
+        matches = [match("a.md", "alpha " * 100), match("b.md", "```\n" + "beta " * 200)]
+        sections = build_context(matches, token_budget=250)
+
+        self.assertEqual(len(sections), 2)
+        self.assertLessEqual(sum(s["tokens"] for s in sections), 250)
+        self.assertTrue(sections[1]["content"].endswith("```\n…"))
+
+    def test_too_little_room_skips_the_rest(self):
+        matches = [match("a.md", "alpha " * 100), match("b.md", "beta " * 100)]
+        self.assertEqual([s["path"] for s in build_context(matches, token_budget=130)], ["a.md"])
+
+
+# Budgets are counted in words here, so the tests don't need the embedding model's tokenizer
+@mock.patch("media.context.count_tokens", count_words)
+@mock.patch("media.context.truncate_to_tokens", first_words)
+class PromptSourcesTests(SimpleTestCase):
+    def test_sources_are_the_paths_that_fit_in_the_budget(self):
+        matches = [match("a.md", "alpha " * 100), match("b.md", "beta " * 100), match("c.md", "gamma " * 100)]
+        with mock.patch("media.context.CONTEXT_TOKEN_BUDGET", 250):
+            messages, sources = build_chat_messages("django", "What is alpha?", matches)
+
+        self.assertEqual(sources, ["a.md", "b.md"])
+        self.assertIn("beta", messages[1]["content"])
+        self.assertNotIn("gamma", messages[1]["content"])
+
+    def test_each_path_is_listed_once(self):
+        matches = [match("a.md", "first " * 10, chunk_id=0), match("b.md", "other " * 10),
+                   match("a.md", "later " * 10, chunk_id=5)]
+        _, sources = build_chat_messages("django", "What is first?", matches)
+        self.assertEqual(sources, ["a.md", "b.md"])
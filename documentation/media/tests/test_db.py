@@ -0,0 +1,125 @@
+import socket
+import threading
+import time
+
+import psycopg2
+from django.test import SimpleTestCase
+
+from media.db import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection; the socket's peer plays the server."""
+
+    def __init__(self):
+        self._socket, self.server = socket.socketpair()
+        self.closed = 0
+        self.rollbacks = 0
+        self.fail_rollback = False
+        self.on_rollback = None
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def cursor(self):
+        # Only the pool's ping of a long-idle connection asks for one; it finds the server gone
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def rollback(self):
+        if self.on_rollback is not None:
+            self.on_rollback()
+        if self.fail_rollback:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+        self._socket.close()
+        self.server.close()
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def pool(self, **options):
+        options.setdefault("min_size", 0)
+        options.setdefault("max_size", 2)
+        pool = ConnectionPool(connect=FakeConnection, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuses_returned_connections(self):
+        pool = self.pool()
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(first.rollbacks, 2)
+        self.assertEqual(pool.stats()["connections_created"], 1)
+
+    def test_times_out_when_every_connection_is_borrowed(self):
+        pool = self.pool(max_size=1)
+        pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(timeout=0.05)
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_waiting_borrower_gets_the_returned_connection(self):
+        pool = self.pool(max_size=1)
+        conn = pool.getconn()
+        threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+        self.assertIs(pool.getconn(timeout=5), conn)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_connection_closed_by_the_server_is_replaced_on_checkout(self):
+        pool = self.pool()
+        with pool.connection() as conn:
+            pass
+        conn.server.close()
+
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()["connections_discarded"], 1)
+
+    def test_rolls_back_outside_the_pool_lock(self):
+        pool = self.pool()
+        acquired = []
+
+        def take_lock_from_another_thread():
+            def take():
+                acquired.append(pool._lock.acquire(timeout=0.5))
+                if acquired[-1]:
+                    pool._lock.release()
+            thread = threading.Thread(target=take)
+            thread.start()
+            thread.join()
+
+        conn = pool.getconn()
+        conn.on_rollback = take_lock_from_another_thread
+        pool.putconn(conn)
+        self.assertEqual(acquired, [True])
+
+    def test_connection_that_fails_to_roll_back_is_discarded(self):
+        pool = self.pool()
+        conn = pool.getconn()
+        conn.fail_rollback = True
+        pool.putconn(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()["idle"], 0)
+
+    def test_connection_broken_during_use_is_discarded(self):
+        pool = self.pool()
+        with self.assertRaises(psycopg2.OperationalError):
+            with pool.connection() as conn:
+                raise psycopg2.OperationalError("terminating connection")
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()["in_use"], 0)
+
+    def test_pings_connections_idle_longer_than_max_idle(self):
+        pool = self.pool(max_idle=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        time.sleep(0.01)
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertTrue(conn.closed)
@@ -0,0 +1,106 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase
+
+from media.upload_ingest import UploadIngestQueue
+from media.views import doc_file, parse_byte_range
+
+
+class ParseByteRangeTests(SimpleTestCase):
+    def test_single_ranges(self):
+        self.assertEqual(parse_byte_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_byte_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_byte_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_byte_range("bytes=50-500", 100), (50, 99))
+        self.assertEqual(parse_byte_range("bytes=-500", 100), (0, 99))
+
+    def test_ignored_ranges_get_the_whole_file(self):
+        for header in ("bytes=0-1,5-6", "items=0-9", "bytes=9-0", "bytes=a-b", "bytes=5"):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_byte_range(header, 100))
+
+    def test_unsatisfiable_ranges(self):
+        self.assertIs(parse_byte_range("bytes=100-", 100), False)
+        self.assertIs(parse_byte_range("bytes=-0", 100), False)
+        self.assertIs(parse_byte_range("bytes=-5", 0), False)
+
+
+class DocFileTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "guide.md")
+        self.body = b"# Guide\n\n" + b"All about views. " * 100
+        with open(self.path, "wb") as f:
+            f.write(self.body)
+        cache = mock.Mock()
+        cache.document.return_value = {"documentation_path": self.path, "ai_documentation_path": None}
+        patcher = mock.patch("media.views.doc_text_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        return doc_file(RequestFactory().get("/files/doc/guide/", **headers), "doc", "guide")
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.body)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_byte_range_is_partial_content(self):
+        response = self.get(HTTP_RANGE="bytes=2-6")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), self.body[2:7])
+        self.assertEqual(response["Content-Range"], f"bytes 2-6/{len(self.body)}")
+
+    def test_range_past_the_end_is_not_satisfiable(self):
+        response = self.get(HTTP_RANGE=f"bytes={len(self.body)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.body)}")
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        response = self.get(HTTP_RANGE="bytes=2-6", HTTP_IF_RANGE='"old-etag"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.body)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_fresh_gzip_variant_is_served(self):
+        with open(self.path + ".gz", "wb") as f:
+            f.write(gzip.compress(self.body))
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(self.content(response)), self.body)
+
+    def test_variant_older_than_the_file_is_not_served(self):
+        with open(self.path + ".gz", "wb") as f:
+            f.write(gzip.compress(b"an earlier upload"))
+        stat = os.stat(self.path)
+        os.utime(self.path + ".gz", ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(self.content(response), self.body)
+
+    def test_unknown_document_is_not_found(self):
+        with mock.patch("media.views.doc_text_cache.document", return_value=None):
+            self.assertEqual(self.get().status_code, 404)
+
+
+class PrecompressQueueTests(SimpleTestCase):
+    def test_repeated_saves_queue_one_precompress_job(self):
+        queue = UploadIngestQueue()
+        with mock.patch.object(queue, "_ensure_started"):
+            queue.enqueue_precompress(1)
+            queue.enqueue_precompress(1)
+            queue.enqueue(1)
+        self.assertEqual(queue.stats()["queued"], 2)
@@ -0,0 +1,41 @@
+import io
+import json
+
+from django.test import SimpleTestCase
+
+from media.ingest import iter_json_array, iter_ndjson
+
+DOCUMENTS = [{"path": "a.md", "content": "Models " * 50}, {"path": "b.md", "content": 'Quotes " and ] brackets'}]
+
+
+class IterNdjsonTests(SimpleTestCase):
+    def test_skips_blank_lines_and_decodes_bytes(self):
+        lines = [b'{"path": "a.md"}\n', b"\n", '{"path": "b.md"}\n']
+        self.assertEqual([doc["path"] for doc in iter_ndjson(lines)], ["a.md", "b.md"])
+
+    def test_reports_the_bad_line(self):
+        with self.assertRaisesRegex(ValueError, "line 2"):
+            list(iter_ndjson(['{"path": "a.md"}', "{not json"]))
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    def test_bare_array(self):
+        self.assertEqual(list(iter_json_array(io.StringIO(json.dumps(DOCUMENTS)))), DOCUMENTS)
+
+    def test_array_inside_an_object(self):
+        fp = io.BytesIO(json.dumps({"documents": DOCUMENTS}).encode("utf-8"))
+        self.assertEqual(list(iter_json_array(fp)), DOCUMENTS)
+
+    def test_objects_split_across_reads(self):
+        fp = io.StringIO(json.dumps(DOCUMENTS, indent=2))
+        self.assertEqual(list(iter_json_array(fp, chunk_size=7)), DOCUMENTS)
+
+    def test_empty_array_and_no_array(self):
+        self.assertEqual(list(iter_json_array(io.StringIO("[ ]"))), [])
+        self.assertEqual(list(iter_json_array(io.StringIO('{"documents": null}'))), [])
+
+    def test_truncated_file_is_an_error(self):
+        text = json.dumps(DOCUMENTS)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO(text[:-20]), chunk_size=16))
+
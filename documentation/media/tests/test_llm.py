@@ -0,0 +1,192 @@
+import asyncio
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from media.llm import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, FakeProvider, LLMOverloaded, LLMScheduler, LLMTimeout,
+)
+
+
+class GatedProvider(FakeProvider):
+    """FakeProvider that records the questions it answers and holds "block" calls until released."""
+
+    def __init__(self):
+        super().__init__(latency_ms=0)
+        self.answered = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def complete(self, messages, **params):
+        question = messages[-1]["content"]
+        if question == "block":
+            self.started.set()
+            self.release.wait(5)
+        with self._lock:
+            self.answered.append(question)
+        return super().complete(messages, **params)
+
+
+def ask(question):
+    return [{"role": "user", "content": question}]
+
+
+class LLMSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = GatedProvider()
+        self.addCleanup(self.provider.release.set)
+
+    def scheduler(self, **options):
+        options.setdefault("max_concurrency", 1)
+        # Rate limits are covered by the scheduler's admission check, not by these tests
+        return LLMScheduler(self.provider, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9, **options)
+
+    def occupy(self, scheduler):
+        """Keep the scheduler's only worker busy until ``self.provider.release`` is set."""
+        future = scheduler.submit(ask("block"))
+        self.assertTrue(self.provider.started.wait(5))
+        return future
+
+    def test_interactive_requests_run_before_batch_requests(self):
+        scheduler = self.scheduler()
+        blocker = self.occupy(scheduler)
+        futures = [
+            scheduler.submit(ask("batch 1"), priority=PRIORITY_BATCH),
+            scheduler.submit(ask("interactive 1"), priority=PRIORITY_INTERACTIVE),
+            scheduler.submit(ask("batch 2"), priority=PRIORITY_BATCH),
+            scheduler.submit(ask("interactive 2"), priority=PRIORITY_INTERACTIVE),
+        ]
+        self.provider.release.set()
+        for future in [blocker] + futures:
+            future.result(5)
+
+        self.assertEqual(self.provider.answered, ["block", "interactive 1", "interactive 2", "batch 1", "batch 2"])
+
+    def test_full_queue_rejects_requests(self):
+        scheduler = self.scheduler(queue_size=2)
+        self.occupy(scheduler)
+        queued = [scheduler.submit(ask(f"queued {i}")) for i in range(2)]
+
+        with self.assertRaises(LLMOverloaded):
+            scheduler.submit(ask("one too many")).result(1)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+        self.assertFalse(any(future.done() for future in queued))
+
+    def test_full_queue_drops_newest_lower_priority_request(self):
+        scheduler = self.scheduler(queue_size=2)
+        self.occupy(scheduler)
+        older = scheduler.submit(ask("batch 1"), priority=PRIORITY_BATCH)
+        newer = scheduler.submit(ask("batch 2"), priority=PRIORITY_BATCH)
+        interactive = scheduler.submit(ask("interactive"), priority=PRIORITY_INTERACTIVE)
+
+        with self.assertRaises(LLMOverloaded):
+            newer.result(1)
+        self.provider.release.set()
+        interactive.result(5)
+        older.result(5)
+        self.assertEqual(self.provider.answered, ["block", "interactive", "batch 1"])
+
+    def test_identical_requests_share_one_call(self):
+        scheduler = self.scheduler()
+        self.occupy(scheduler)
+        first = scheduler.submit(ask("same question"), max_tokens=100)
+        second = scheduler.submit(ask("same question"), max_tokens=100)
+        different = scheduler.submit(ask("same question"), max_tokens=200)
+        self.provider.release.set()
+
+        self.assertIs(first.result(5), second.result(5))
+        different.result(5)
+        self.assertEqual(self.provider.answered.count("same question"), 2)
+        self.assertEqual(scheduler.stats()["coalesced"], 1)
+
+    def test_request_expires_in_the_queue(self):
+        scheduler = self.scheduler()
+        self.occupy(scheduler)
+        late = scheduler.submit(ask("too late"), timeout=0.05)
+        time.sleep(0.1)
+        self.provider.release.set()
+
+        with self.assertRaises(LLMTimeout):
+            late.result(5)
+        self.assertNotIn("too late", self.provider.answered)
+        self.assertEqual(scheduler.stats()["expired"], 1)
+
+    def test_coalesced_callers_keep_their_own_timeouts(self):
+        scheduler = self.scheduler()
+        self.occupy(scheduler)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            patient = executor.submit(scheduler.complete, ask("shared"), timeout=5)
+            time.sleep(0.05)  # so the patient caller leads and the impatient one joins its call
+            started = time.monotonic()
+            with self.assertRaises(LLMTimeout):
+                scheduler.complete(ask("shared"), timeout=0.1)
+            self.assertLess(time.monotonic() - started, 1)
+
+            self.provider.release.set()
+            self.assertIn("shared", patient.result(5).choices[0].message.content)
+        self.assertEqual(scheduler.stats()["coalesced"], 1)
+
+    def test_shared_call_outlives_an_impatient_leader(self):
+        scheduler = self.scheduler()
+        self.occupy(scheduler)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            impatient = executor.submit(scheduler.complete, ask("shared"), timeout=0.1)
+            time.sleep(0.05)
+            patient = scheduler.submit(ask("shared"), timeout=5)
+            with self.assertRaises(LLMTimeout):
+                impatient.result(5)
+        self.provider.release.set()
+
+        self.assertIn("shared", patient.result(5).choices[0].message.content)
+
+    def test_stream_callers_keep_their_own_timeouts(self):
+        scheduler = self.scheduler()
+        self.occupy(scheduler)
+
+        async def read_stream():
+            return [chunk async for chunk in scheduler.astream(ask("async stream"), timeout=0.1)]
+
+        for start in (lambda: scheduler.stream(ask("stream"), timeout=0.1), lambda: asyncio.run(read_stream())):
+            started = time.monotonic()
+            with self.assertRaises(LLMTimeout):
+                start()
+            self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(scheduler.stats()["caller_timeouts"], 2)
+
+    def test_stream_started_after_its_caller_gave_up_is_closed(self):
+        scheduler = self.scheduler()
+        blocker = self.occupy(scheduler)
+        with self.assertRaises(LLMTimeout):
+            scheduler.stream(ask("abandoned"), timeout=0.1)
+        with scheduler._cond:
+            # As if the worker picked it up just in time: it starts although nobody reads it
+            scheduler._heap[0][2].deadline += 5
+        self.provider.release.set()
+        blocker.result(5)
+
+        scheduler.complete(ask("after the stream"), timeout=5)
+        self.assertEqual(scheduler.stats()["active"], 0)
+
+    def test_stream_holds_its_slot_until_read(self):
+        scheduler = self.scheduler()
+        stream = scheduler.stream(ask("streamed"))
+        waiting = scheduler.submit(ask("after the stream"))
+
+        time.sleep(0.1)
+        self.assertFalse(waiting.done())
+        self.assertTrue("".join(chunk.choices[0].delta.content for chunk in stream))
+        waiting.result(5)
+        self.assertEqual(scheduler.stats()["active"], 0)
+
+    def test_dropped_stream_frees_its_slot(self):
+        scheduler = self.scheduler()
+        stream = scheduler.stream(ask("abandoned"))
+        next(stream)
+        waiting = scheduler.submit(ask("after the stream"))
+
+        del stream
+        gc.collect()
+        waiting.result(5)
@@ -0,0 +1,33 @@
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from media.views import metrics
+
+
+class MetricsViewTests(SimpleTestCase):
+    def get(self, **headers):
+        return metrics(RequestFactory().get("/metrics", **headers))
+
+    @override_settings(DEBUG=False)
+    def test_needs_a_token_outside_debug(self):
+        with mock.patch("media.views.METRICS_TOKEN", ""):
+            self.assertEqual(self.get().status_code, 403)
+
+    @override_settings(DEBUG=True)
+    def test_open_in_debug_without_a_token(self):
+        with mock.patch("media.views.METRICS_TOKEN", ""):
+            self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(DEBUG=False)
+    def test_checks_the_bearer_token(self):
+        with mock.patch("media.views.METRICS_TOKEN", "secret"):
+            self.assertEqual(self.get().status_code, 401)
+            self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+            response = self.get(HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+    def test_disabled_metrics_are_not_found(self):
+        with mock.patch("media.views.METRICS_ENABLED", False):
+            self.assertEqual(self.get().status_code, 404)
@@ -0,0 +1,45 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from media.rerank import Reranker
+
+
+def match(id, words, score):
+    return {"id": id, "score": score, "metadata": {"path": f"docs/{id}.md", "heading": "", "content": "word " * words}}
+
+
+class ScoredReranker(Reranker):
+    """Uses each match's ``score`` as its cross-encoder score, so no model is loaded."""
+
+    def score(self, question, matches):
+        return [match["score"] for match in matches]
+
+
+# Budgets are counted in words here, so the tests don't need the embedding model's tokenizer
+@mock.patch("media.rerank.count_tokens", lambda text: len(text.split()))
+class RerankerTests(SimpleTestCase):
+    def test_keeps_the_best_top_k(self):
+        matches = [match("a", 10, 0.1), match("b", 10, 0.9), match("c", 10, 0.5)]
+        kept = ScoredReranker().rerank("question", matches, top_k=2, token_budget=1000)
+        self.assertEqual([m["id"] for m in kept], ["b", "c"])
+        self.assertEqual(kept[0]["rerank_score"], 0.9)
+
+    def test_skips_chunks_over_the_token_budget(self):
+        matches = [match("best", 40, 0.9), match("long", 400, 0.8), match("short", 40, 0.7)]
+        kept = ScoredReranker().rerank("question", matches, top_k=3, token_budget=200)
+        self.assertEqual([m["id"] for m in kept], ["best", "short"])
+
+    def test_best_chunk_is_kept_even_over_budget(self):
+        kept = ScoredReranker().rerank("question", [match("long", 400, 0.9)], top_k=3, token_budget=10)
+        self.assertEqual([m["id"] for m in kept], ["long"])
+
+    def test_falls_back_to_vector_order_when_scoring_fails(self):
+        class BrokenReranker(Reranker):
+            def score(self, question, matches):
+                raise RuntimeError("model unavailable")
+
+        reranker = BrokenReranker()
+        matches = [match("a", 10, 0.1), match("b", 10, 0.9), match("c", 10, 0.5)]
+        self.assertEqual([m["id"] for m in reranker.rerank("question", matches, top_k=2)], ["a", "b"])
+        self.assertEqual(reranker.stats()["failures"], 1)
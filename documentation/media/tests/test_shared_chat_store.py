@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from media.models import SharedChat
+from media.shared_chat_store import (
+    CachedSharedChatStore, DatabaseSharedChatStore, FileSharedChatStore, import_chat_files,
+)
+
+CHAT = {"tool_name": "django", "messages": [{"sender": "user", "content": "Hi?"}, {"sender": "ai", "content": "*Hello*"}]}
+
+
+def temp_dir(test):
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    return directory
+
+
+class DatabaseSharedChatStoreTests(TestCase):
+    def setUp(self):
+        self.store = DatabaseSharedChatStore()
+
+    def test_create_stores_the_rendered_snapshot(self):
+        chat_id, (body, etag, expires_at) = self.store.create(CHAT)
+
+        self.assertEqual(self.store.snapshot(chat_id), (body, etag, None))
+        chat = json.loads(body)
+        self.assertEqual(chat["chat_id"], chat_id)
+        self.assertIn("<em>Hello</em>", chat["messages"][1]["html"])
+        self.assertIsNone(self.store.snapshot("missing"))
+
+    def test_expired_chats_are_gone_and_cleaned_up(self):
+        with mock.patch("media.shared_chat_store.SHARED_CHAT_TTL_DAYS", 7):
+            chat_id, _ = self.store.create(CHAT)
+            kept_id, _ = self.store.create(CHAT)
+        SharedChat.objects.filter(chat_id=chat_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(self.store.snapshot(chat_id))
+        self.assertEqual(self.store.cleanup(), 1)
+        self.assertEqual(list(SharedChat.objects.values_list("chat_id", flat=True)), [kept_id])
+
+    def test_list_pages_newest_first(self):
+        now = timezone.now()
+        for age, tool_name in enumerate(("django", "flask", "django")):
+            self.store.import_chat({**CHAT, "chat_id": f"chat{age}", "tool_name": tool_name}, now - timedelta(hours=age))
+
+        first = self.store.list(limit=2)
+        self.assertEqual([chat["chat_id"] for chat in first], ["chat0", "chat1"])
+        self.assertEqual([chat["chat_id"] for chat in self.store.list(before=first[-1]["created_at"])], ["chat2"])
+        self.assertEqual([chat["chat_id"] for chat in self.store.list(tool_name="django")], ["chat0", "chat2"])
+
+    def test_import_keeps_the_id_and_skips_taken_ids(self):
+        self.assertTrue(self.store.import_chat({**CHAT, "chat_id": "old12345"}))
+        self.assertFalse(self.store.import_chat({**CHAT, "chat_id": "old12345"}))
+        self.assertIsNotNone(self.store.snapshot("old12345"))
+        self.assertTrue(self.store.delete("old12345"))
+        self.assertFalse(self.store.delete("old12345"))
+
+
+class ImportChatFilesTests(TestCase):
+    def test_imports_files_with_their_ids_and_dates(self):
+        directory = temp_dir(self)
+        with open(os.path.join(directory, "abc12345.json"), "w") as f:
+            json.dump({**CHAT, "created_at": "2024-05-01T12:00:00"}, f)
+        with open(os.path.join(directory, "broken.json"), "w") as f:
+            f.write("{not json")
+        with open(os.path.join(directory, "notes.txt"), "w") as f:
+            f.write("ignored")
+
+        counts = import_chat_files(directory, delete_files=True, log=lambda message: None)
+
+        self.assertEqual(counts, (1, 0, 1))
+        chat = SharedChat.objects.get(chat_id="abc12345")
+        self.assertEqual(chat.created_at.year, 2024)
+        self.assertEqual(sorted(os.listdir(directory)), ["broken.json", "notes.txt"])
+        self.assertEqual(import_chat_files(os.path.join(directory, "missing")), (0, 0, 0))
+
+
+class FileSharedChatStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = FileSharedChatStore(temp_dir(self))
+
+    def test_create_and_read_back(self):
+        chat_id, (body, etag, _) = self.store.create(CHAT)
+        self.assertEqual(self.store.snapshot(chat_id)[:2], (body, etag))
+        self.assertEqual([chat["chat_id"] for chat in self.store.list()], [chat_id])
+        self.assertTrue(self.store.delete(chat_id))
+        self.assertIsNone(self.store.snapshot(chat_id))
+
+    def test_old_files_are_rendered_on_read(self):
+        with open(os.path.join(self.store.directory, "legacy01.json"), "w") as f:
+            json.dump(CHAT, f)
+        body, _, _ = self.store.snapshot("legacy01")
+        self.assertIn("html", json.loads(body)["messages"][1])
+
+    def test_ids_cannot_leave_the_directory(self):
+        self.assertIsNone(self.store.snapshot("../../settings"))
+
+
+class CachedSharedChatStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = mock.Mock()
+        self.store = CachedSharedChatStore(self.backend)
+
+    def test_snapshots_are_read_once(self):
+        self.backend.snapshot.return_value = (b'{"messages": []}', '"etag"', None)
+        self.assertEqual(self.store.get("abc"), {"messages": []})
+        self.store.snapshot("abc")
+        self.backend.snapshot.assert_called_once_with("abc")
+
+    def test_created_chats_are_cached(self):
+        self.backend.create.return_value = ("abc", (b"{}", '"etag"', None))
+        self.assertEqual(self.store.create(CHAT), "abc")
+        self.assertEqual(self.store.snapshot("abc"), (b"{}", '"etag"', None))
+        self.backend.snapshot.assert_not_called()
+
+    def test_expired_and_deleted_chats_leave_the_cache(self):
+        self.backend.snapshot.return_value = (b"{}", '"etag"', timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(self.store.snapshot("old"))
+        self.backend.snapshot.return_value = (b"{}", '"etag"', None)
+        self.store.snapshot("abc")
+        self.store.delete("abc")
+        self.store.snapshot("abc")
+        self.assertEqual(self.backend.snapshot.call_count, 3)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from media.upload_ingest import chunk_markdown, split_markdown_sections
+
+DOCUMENT = """Intro before any heading.
+
+# Models
+
+Fields and managers.
+
+## Fields
+
+```python
+# not a heading
+name = models.CharField()
+```
+
+## Managers
+
+### Custom managers
+
+Text.
+
+# Views
+
+Function views.
+"""
+
+
+class SplitMarkdownSectionsTests(SimpleTestCase):
+    def test_sections_carry_their_heading_trail(self):
+        sections = [(level, headings) for level, headings, _ in split_markdown_sections(DOCUMENT)]
+        self.assertEqual(sections, [
+            (0, []),
+            (1, ["Models"]),
+            (2, ["Models", "Fields"]),
+            (2, ["Models", "Managers"]),
+            (3, ["Models", "Managers", "Custom managers"]),
+            (1, ["Views"]),
+        ])
+
+    def test_hashes_in_code_blocks_are_not_headings(self):
+        bodies = {tuple(headings): body for _, headings, body in split_markdown_sections(DOCUMENT)}
+        self.assertIn("# not a heading", bodies[("Models", "Fields")])
+
+    def test_closing_hashes_are_dropped(self):
+        self.assertEqual(list(split_markdown_sections("## Setup ##\nText"))[-1][1], ["Setup"])
+
+
+# Token limits are counted in words here, so the tests don't need the embedding model's tokenizer
+@mock.patch("media.upload_ingest.count_tokens", lambda text: len(text.split()))
+class ChunkMarkdownTests(SimpleTestCase):
+    def test_one_chunk_per_section_with_text(self):
+        chunks = chunk_markdown(DOCUMENT, "models.md", url="/files/doc/models/")
+
+        self.assertEqual([chunk["heading"] for chunk in chunks], [
+            "", "Models", "Models > Fields", "Models > Managers > Custom managers", "Views"])
+        self.assertEqual([chunk["chunk_id"] for chunk in chunks], list(range(5)))
+        self.assertEqual({chunk["total_chunks"] for chunk in chunks}, {5})
+        self.assertEqual(chunks[0]["level"], 1)
+        self.assertEqual(chunks[3]["level"], 3)
+        self.assertEqual(chunks[0]["url"], "/files/doc/models/")
+
+    def test_long_sections_are_split_at_paragraphs(self):
+        paragraphs = [" ".join([f"p{n}"] * 30) for n in range(4)]
+        chunks = chunk_markdown("# Long\n\n" + "\n\n".join(paragraphs), "long.md", max_tokens=70)
+
+        self.assertEqual([chunk["content"] for chunk in chunks],
+                         ["\n\n".join(paragraphs[:2]), "\n\n".join(paragraphs[2:])])
+        self.assertEqual({chunk["heading"] for chunk in chunks}, {"Long"})
+
+    def test_long_paragraphs_are_split_at_words(self):
+        chunks = chunk_markdown("word " * 25, "words.md", max_tokens=10)
+        self.assertEqual([len(chunk["content"].split()) for chunk in chunks], [10, 10, 5])
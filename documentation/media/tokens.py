@@ -0,0 +1,59 @@
+import hashlib
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from .cache import LRUCache
+from .embeddings import get_ml_model
+
+# Load environment variables
+load_dotenv()
+
+# Hugging Face tokenizer used to measure prompt context; empty reuses the embedding model's
+# tokenizer, which is already in memory. Set it to the chat model's tokenizer for exact counts.
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+# Token counts of chunk texts, keyed by a hash of the text
+_counts = LRUCache(max_size=50000)
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                if CONTEXT_TOKENIZER:
+                    from transformers import AutoTokenizer
+                    _tokenizer = AutoTokenizer.from_pretrained(CONTEXT_TOKENIZER)
+                else:
+                    _tokenizer = get_ml_model().tokenizer
+    return _tokenizer
+
+
+def count_tokens(text):
+    key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    count = _counts.get(key)
+    if count is None:
+        count = len(get_tokenizer().encode(text, add_special_tokens=False))
+        _counts.set(key, count)
+    return count
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut ``text`` after its first ``max_tokens`` tokens, keeping the original characters."""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    try:
+        offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    except NotImplementedError:
+        # Slow (pure Python) tokenizers have no offsets; round-trip through the ids instead
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        return text if len(ids) <= max_tokens else tokenizer.decode(ids[:max_tokens])
+    if len(offsets) <= max_tokens:
+        return text
+    return text[:offsets[max_tokens - 1][1]]
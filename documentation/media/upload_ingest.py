@@ -0,0 +1,274 @@
+import os
+import queue
+import re
+import threading
+import time
+
+from django.db import close_old_connections
+from django.urls import reverse
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from .answer_cache import answer_cache
+from .db import ensure_pgvector, get_pool
+from .ingest import ingest_documents
+from .memory_index import memory_index
+from .models import DocumentationFile
+from .precompress import precompress_document
+from .tokens import count_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Chunk and embed documentation files in the background whenever they are saved
+UPLOAD_INGEST_ENABLED = os.getenv("UPLOAD_INGEST_ENABLED", "true").lower() in ("1", "true", "yes")
+# Chunks encoded and written per transaction; progress is recorded after each batch
+UPLOAD_INGEST_BATCH_SIZE = int(os.getenv("UPLOAD_INGEST_BATCH_SIZE", "64"))
+# all-mpnet-base-v2 reads 384 tokens, so longer sections are split to keep their ends searchable
+UPLOAD_CHUNK_MAX_TOKENS = int(os.getenv("UPLOAD_CHUNK_MAX_TOKENS", "350"))
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+def split_markdown_sections(text):
+    """Yield ``(level, headings, body)`` for each heading of a markdown document.
+
+    ``headings`` is the trail of headings down to this one. Text before the
+    first heading is a level-0 section with no headings, and ``#`` lines inside
+    fenced code blocks are not headings.
+    """
+    trail = []
+    level, body = 0, []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING.match(line)
+        if match:
+            yield level, [heading for _, heading in trail], "\n".join(body).strip()
+            level = len(match.group(1))
+            trail = [(heading_level, heading) for heading_level, heading in trail if heading_level < level]
+            trail.append((level, match.group(2)))
+            body = []
+        else:
+            body.append(line)
+    yield level, [heading for _, heading in trail], "\n".join(body).strip()
+
+
+def _split_long(text, max_tokens):
+    """Split a section body into pieces of at most ``max_tokens``, at blank lines, then lines, then words."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    for separator in ("\n\n", "\n", " "):
+        parts = text.split(separator)
+        if len(parts) > 1:
+            break
+    else:
+        return [text]  # one enormous word; the model will truncate it
+
+    pieces, current = [], []
+    for part in parts:
+        candidate = separator.join(current + [part])
+        if current and count_tokens(candidate) > max_tokens:
+            pieces.append(separator.join(current))
+            current = [part]
+        else:
+            current.append(part)
+    if current:
+        pieces.append(separator.join(current))
+    # A single part may still be too long for this separator
+    return [small for piece in pieces for small in _split_long(piece, max_tokens) if small.strip()]
+
+
+def chunk_markdown(text, path, url="", max_tokens=UPLOAD_CHUNK_MAX_TOKENS):
+    """Chunks of a markdown document, one per heading (split further when a section is long)."""
+    chunks = []
+    for level, headings, body in split_markdown_sections(text):
+        if not body:
+            continue
+        heading = " > ".join(headings)
+        for piece in _split_long(body, max_tokens):
+            chunks.append({
+                "path": path,
+                "chunk_id": len(chunks),
+                "heading": heading,
+                "url": url,
+                "content": piece,
+                "level": max(level, 1),
+            })
+    for chunk in chunks:
+        chunk["total_chunks"] = len(chunks)
+    return chunks
+
+
+def _delete_chunks(where, params):
+    """Delete matching chunks and refresh the caches of their namespaces; returns those namespaces."""
+    ensure_pgvector()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM documents WHERE {where} RETURNING namespace", params)
+            namespaces = {row[0] for row in cursor.fetchall()}
+        conn.commit()
+    for changed in namespaces:
+        answer_cache.invalidate(changed)
+        memory_index.mark_stale(changed)
+    return namespaces
+
+
+def remove_stale_chunks(namespace, path, total, old_path=None):
+    """Delete chunks the file no longer has: chunks of ``path`` in another namespace
+    (the doc_type changed) or past ``total`` (the file got shorter), and chunks of a
+    previous file name.
+    """
+    return _delete_chunks("""
+        (path = %(path)s AND (namespace <> %(namespace)s OR chunk_id >= %(total)s))
+        OR (path = %(old_path)s AND path <> %(path)s)
+    """, {"path": path, "namespace": namespace, "total": total, "old_path": old_path or None})
+
+
+def remove_file_chunks(path):
+    """Delete every chunk of a documentation file."""
+    return _delete_chunks("path = %(path)s", {"path": path}) if path else set()
+
+
+def ingest_documentation_file(doc_id, log=print):
+    """Chunk, embed and upsert one DocumentationFile, recording status and progress on its row.
+
+    Unchanged chunks are not re-embedded, so saving a file again is cheap.
+    Returns the final status.
+    """
+    doc = DocumentationFile.objects.filter(pk=doc_id).first()
+    if doc is None:
+        return None
+    rows = DocumentationFile.objects.filter(pk=doc_id)  # update() doesn't fire post_save again
+
+    if not doc.documentation_file:
+        if doc.ingested_path:
+            remove_file_chunks(doc.ingested_path)
+        rows.update(ingest_status="", ingest_progress=0, ingest_total=0, ingest_error="", ingested_path="")
+        return ""
+
+    namespace = f"{doc.doc_type}-docs"
+    path = doc.documentation_file.name
+    rows.update(ingest_status="processing", ingest_progress=0, ingest_error="")
+    started = time.monotonic()
+    try:
+        with doc.documentation_file.open("rb") as f:
+            text = f.read().decode("utf-8", errors="replace")
+        chunks = chunk_markdown(text, path, url=reverse("doc_file", args=["doc", doc.name]))
+        rows.update(ingest_total=len(chunks))
+
+        stats = ingest_documents(
+            chunks, namespace, doc.doc_type,
+            batch_size=UPLOAD_INGEST_BATCH_SIZE,
+            progress=lambda stats: rows.update(ingest_progress=stats.documents),
+        )
+        remove_stale_chunks(namespace, path, len(chunks), doc.ingested_path)
+    except Exception as e:
+        log(f"❌ Error ingesting {doc}: {e}")
+        rows.update(ingest_status="failed", ingest_error=str(e))
+        return "failed"
+
+    rows.update(ingest_status="done", ingest_progress=len(chunks), ingested_at=timezone.now(), ingested_path=path)
+    log(f"✅ Ingested {doc} into {namespace}: {len(chunks)} chunks ({stats.embedded} embedded) "
+        f"in {time.monotonic() - started:.1f}s")
+    return "done"
+
+
+class UploadIngestQueue:
+    """Works through saved DocumentationFiles one at a time on a background thread.
+
+    Besides ingestion, it writes the files' .br/.gz variants, which takes too
+    long at the highest compression levels to do in the admin's save request.
+    The queue is in memory, so jobs queued when the process stops are lost;
+    their rows stay "queued" or "processing" until ``manage.py ingest_uploads
+    --pending`` (or another save) picks them up, and ``manage.py
+    precompress_docs`` writes any missing variants.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._queued = set()  # (action, doc id) waiting, so repeated saves queue one job
+        self._lock = threading.Lock()
+        self._thread = None
+        self.current = None
+        self.processed = 0
+        self.failed = 0
+        self.removed = 0
+        self.precompressed = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="upload-ingest", daemon=True)
+                self._thread.start()
+
+    def _enqueue_document(self, action, doc_id):
+        with self._lock:
+            if (action, doc_id) in self._queued:
+                return
+            self._queued.add((action, doc_id))
+        self._queue.put((action, doc_id))
+        self._ensure_started()
+
+    def enqueue(self, doc_id):
+        self._enqueue_document("ingest", doc_id)
+
+    def enqueue_precompress(self, doc_id):
+        """Write the .br/.gz variants of a saved DocumentationFile's files."""
+        self._enqueue_document("precompress", doc_id)
+
+    def enqueue_removal(self, path):
+        """Remove the chunks of a deleted DocumentationFile."""
+        self._queue.put(("remove", path))
+        self._ensure_started()
+
+    def _run(self):
+        while True:
+            action, target = self._queue.get()
+            with self._lock:
+                # A save from now on queues a new job instead of joining this one
+                self._queued.discard((action, target))
+                self.current = (action, target)
+            try:
+                if action == "ingest":
+                    status = ingest_documentation_file(target)
+                    with self._lock:
+                        if status == "failed":
+                            self.failed += 1
+                        self.processed += 1
+                elif action == "precompress":
+                    doc = DocumentationFile.objects.filter(pk=target).first()
+                    if doc is not None:
+                        precompress_document(doc)
+                    with self._lock:
+                        self.precompressed += 1
+                else:
+                    remove_file_chunks(target)
+                    with self._lock:
+                        self.removed += 1
+            except Exception as e:
+                print(f"❌ Upload ingestion error ({action} {target}): {e}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self.current = None
+                # This thread's Django connection isn't managed by a request cycle
+                close_old_connections()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": UPLOAD_INGEST_ENABLED,
+                "queued": self._queue.qsize(),
+                "current": self.current,
+                "processed": self.processed,
+                "failed": self.failed,
+                "removed": self.removed,
+                "precompressed": self.precompressed,
+            }
+
+
+upload_ingest_queue = UploadIngestQueue()
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -5,11 +6,24 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('ai-chat/<str:tool_name>/', views.ai_chat, name='ai_chat'),
     path('ai-chat/', views.ai_chat, name='ai_chat_default'),
-    path('chat-api/', views.chat_api, name='chat_api'),
+    # CHAT_API_ASYNC=true serves /chat-api/ with the async view (run under an ASGI server)
+    path('chat-api/', views.chat_api_async if settings.CHAT_API_ASYNC else views.chat_api, name='chat_api'),
+    path('chat-api/async/', views.chat_api_async, name='chat_api_async'),
+    # Many questions at once (offline evaluation, bulk Q&A), answered as NDJSON
+    path('api/chat/batch/', views.batch_chat_api, name='batch_chat_api'),
     path('docs/<int:doc_id>/', views.docs, name='docs'),
     path('copy_doc_text/', views.copy_doc_text, name='copy_doc_text'),
     path('copy_ai_summary/', views.copy_ai_summary, name='copy_ai_summary'),
+    # Raw documentation files (kind is "doc" or "ai"), precompressed and range-capable
+    path('files/<str:kind>/<str:name>/', views.doc_file, name='doc_file'),
     path('debug_db/', views.debug_db, name='debug_db'),
+    path('healthz/live/', views.liveness, name='liveness'),
+    path('healthz/ready/', views.readiness_probe, name='readiness'),
+    # Prometheus scrape endpoint for the chat latency histograms (Prometheus' default path, no slash)
+    path('metrics', views.metrics, name='metrics'),
+    # Document ingestion into pgvector
+    path('api/documents/', views.store_documents, name='store_documents'),
+    path('api/documents/stream/', views.store_documents_stream, name='store_documents_stream'),
     # API endpoints for shared chats
     path('api/shared-chats/', views.create_shared_chat, name='create_shared_chat'),
     path('api/shared-chats/<str:chat_id>/', views.get_shared_chat, name='get_shared_chat'),
@@ -0,0 +1,510 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+from .db import (
+    EMBEDDING_STORAGES, HNSW_EF_CONSTRUCTION, HNSW_M, VECTOR_DIMENSION, detect_embedding_storage,
+    embedding_column_type, embedding_index_sql, embedding_storage, ensure_pgvector, get_db_connection,
+    get_pool, pgvector_supports_halfvec, pgvector_supports_hnsw, use_embedding_storage,
+)
+from .retrieval import ann_limit, nearest_sql, query_vector_sql, search_settings_sql
+
+# Load environment variables
+load_dotenv()
+
+INDEX_NAME = "documents_embedding_idx"
+
+# Namespaces (comma-separated) that get their own partial HNSW index, so a search only walks that
+# tool's vectors; other namespaces use the global index. Rows of a listed namespace are in both.
+PGVECTOR_NAMESPACE_INDEXES = [
+    namespace.strip() for namespace in os.getenv("PGVECTOR_NAMESPACE_INDEXES", "").split(",") if namespace.strip()
+]
+
+_known_namespace_indexes = set()
+_namespace_index_lock = threading.Lock()
+
+
+def ivfflat_lists(rows):
+    """pgvector's sizing guideline: rows / 1000 up to 1M rows, sqrt(rows) beyond."""
+    if rows <= 1_000_000:
+        return max(rows // 1000, 1)
+    return int(math.sqrt(rows))
+
+
+def ivfflat_probes(lists):
+    return max(int(math.sqrt(lists)), 1)
+
+
+def current_index_method(cursor):
+    """Return 'hnsw', 'ivfflat' or None for the embedding index on documents."""
+    cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = 'documents' AND indexname = %s", (INDEX_NAME,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    definition = row[0].lower()
+    for method in ("hnsw", "ivfflat"):
+        if f"using {method}" in definition:
+            return method
+    return None
+
+
+def build_vector_index(method="auto", m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, lists=None,
+                       maintenance_work_mem=None, log=print):
+    """Build or rebuild the embedding index without blocking reads or writes.
+
+    ``method`` is 'hnsw', 'ivfflat' or 'auto' (HNSW when the installed pgvector
+    supports it, otherwise IVFFlat with ``lists`` sized from the row count).
+    The new index is built concurrently under a temporary name and swapped in.
+    """
+    ensure_pgvector()
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM documents;")
+            rows = cursor.fetchone()[0]
+
+            if method == "auto":
+                method = "hnsw" if pgvector_supports_hnsw(cursor) else "ivfflat"
+            if method == "hnsw" and not pgvector_supports_hnsw(cursor):
+                raise ValueError("The installed pgvector does not support HNSW (needs 0.5.0+)")
+            if method == "ivfflat":
+                if rows == 0:
+                    raise ValueError("IVFFlat centroids are trained on existing rows; load documents first")
+                lists = lists or ivfflat_lists(rows)
+                options = f"lists = {int(lists)}"
+            elif method == "hnsw":
+                options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+            else:
+                raise ValueError(f"Unknown index method: {method}")
+
+            if maintenance_work_mem:
+                cursor.execute("SELECT set_config('maintenance_work_mem', %s, false);", (maintenance_work_mem,))
+
+            # Leftover from an interrupted build
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}_new;")
+
+            log(f"Building {method} index ({options}) over {rows} rows...")
+            started = time.monotonic()
+            cursor.execute(f"""
+                CREATE INDEX CONCURRENTLY {INDEX_NAME}_new
+                ON documents
+                USING {method} ({embedding_index_sql(embedding_storage())})
+                WITH ({options});
+            """)
+            build_seconds = time.monotonic() - started
+
+            # Swap the new index in
+            cursor.execute("BEGIN;")
+            cursor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME};")
+            cursor.execute(f"ALTER INDEX {INDEX_NAME}_new RENAME TO {INDEX_NAME};")
+            cursor.execute("COMMIT;")
+
+            cursor.execute("SELECT pg_relation_size(%s);", (INDEX_NAME,))
+            size_bytes = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    result = {
+        "method": method,
+        "options": options,
+        "rows": rows,
+        "build_seconds": round(build_seconds, 2),
+        "size_bytes": size_bytes,
+    }
+    if method == "ivfflat":
+        result["suggested_probes"] = ivfflat_probes(lists)
+    return result
+
+
+def namespace_index_name(namespace):
+    """Index name for a namespace; a hash suffix keeps it unique and under 63 characters."""
+    slug = re.sub(r"[^a-z0-9]+", "_", namespace.lower()).strip("_")[:30]
+    digest = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:8]
+    return f"documents_embedding_{slug}_{digest}_idx"
+
+
+def _create_namespace_index(cursor, namespace, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, name=None):
+    cursor.execute(sql.SQL("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+        ON documents
+        USING hnsw ({column})
+        WITH (m = {m}, ef_construction = {ef_construction})
+        WHERE namespace = {namespace};
+    """).format(
+        name=sql.Identifier(name or namespace_index_name(namespace)),
+        column=sql.SQL(embedding_index_sql(embedding_storage())),
+        m=sql.Literal(int(m)),
+        ef_construction=sql.Literal(int(ef_construction)),
+        namespace=sql.Literal(namespace),
+    ))
+
+
+def ensure_namespace_index(namespace):
+    """Create the partial HNSW index for ``namespace`` if it's configured and doesn't exist yet.
+
+    Called before the first write to a namespace, so the index is empty when
+    created and HNSW keeps it up to date as rows are inserted. Checked once per
+    namespace per process. Namespaces not in PGVECTOR_NAMESPACE_INDEXES are
+    skipped, so clients writing to new namespaces can't add indexes.
+    """
+    if namespace not in PGVECTOR_NAMESPACE_INDEXES or namespace in _known_namespace_indexes:
+        return
+    with _namespace_index_lock:
+        if namespace in _known_namespace_indexes:
+            return
+        conn = get_db_connection()
+        conn.autocommit = True  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        try:
+            with conn.cursor() as cursor:
+                if not pgvector_supports_hnsw(cursor):
+                    # Partial IVFFlat indexes would be trained on no rows; stay on the global index
+                    _known_namespace_indexes.add(namespace)
+                    return
+                name = namespace_index_name(namespace)
+                cursor.execute("SELECT 1 FROM pg_indexes WHERE tablename = 'documents' AND indexname = %s", (name,))
+                if not cursor.fetchone():
+                    print(f"Creating vector index {name} for namespace '{namespace}'")
+                    _create_namespace_index(cursor, namespace, name=name)
+        finally:
+            conn.close()
+        _known_namespace_indexes.add(namespace)
+
+
+def build_namespace_indexes(namespaces=None, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, log=print):
+    """Build or rebuild the partial HNSW index of ``namespaces`` (default PGVECTOR_NAMESPACE_INDEXES).
+
+    Namespaces with no rows in the documents table are skipped.
+    """
+    namespaces = list(PGVECTOR_NAMESPACE_INDEXES if namespaces is None else namespaces)
+    ensure_pgvector()
+    conn = get_db_connection()
+    conn.autocommit = True
+    results = []
+    try:
+        with conn.cursor() as cursor:
+            if not pgvector_supports_hnsw(cursor):
+                raise ValueError("Per-namespace indexes need HNSW (pgvector 0.5.0+)")
+            cursor.execute("""
+                SELECT namespace, COUNT(*) FROM documents WHERE namespace = ANY(%s)
+                GROUP BY namespace ORDER BY namespace;
+            """, (namespaces,))
+            for namespace, rows in cursor.fetchall():
+                name = namespace_index_name(namespace)
+                log(f"Building {name} for '{namespace}' ({rows} rows)...")
+                started = time.monotonic()
+                cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(name + "_new")))
+                _create_namespace_index(cursor, namespace, m, ef_construction, name=name + "_new")
+                cursor.execute("BEGIN;")
+                cursor.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(name)))
+                cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(sql.Identifier(name + "_new"), sql.Identifier(name)))
+                cursor.execute("COMMIT;")
+                _known_namespace_indexes.add(namespace)
+                results.append({
+                    "namespace": namespace,
+                    "index": name,
+                    "rows": rows,
+                    "build_seconds": round(time.monotonic() - started, 2),
+                })
+    finally:
+        conn.close()
+    return results
+
+
+def drop_namespace_indexes(namespaces, log=print):
+    """Drop the partial HNSW indexes of ``namespaces``; returns the names of the indexes dropped."""
+    ensure_pgvector()
+    conn = get_db_connection()
+    conn.autocommit = True  # DROP INDEX CONCURRENTLY can't run inside a transaction
+    dropped = []
+    try:
+        with conn.cursor() as cursor:
+            for namespace in namespaces:
+                name = namespace_index_name(namespace)
+                cursor.execute("SELECT 1 FROM pg_indexes WHERE tablename = 'documents' AND indexname = %s", (name,))
+                if cursor.fetchone():
+                    log(f"Dropping {name} for '{namespace}'...")
+                    cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(name)))
+                    dropped.append(name)
+                _known_namespace_indexes.discard(namespace)
+    finally:
+        conn.close()
+    return dropped
+
+
+def convert_embedding_storage(storage, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, log=print):
+    """Convert the documents table to another embedding storage mode and rebuild its indexes.
+
+    Switching between float32 and float16 rewrites the table under an exclusive
+    lock, so searches wait until it's done. Other processes pick up the new
+    storage mode when they restart.
+    """
+    if storage not in EMBEDDING_STORAGES:
+        raise ValueError(f"storage must be one of: {', '.join(EMBEDDING_STORAGES)}")
+    ensure_pgvector()
+    conn = get_db_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            if storage != "vector" and not pgvector_supports_halfvec(cursor):
+                raise ValueError(f"{storage} storage needs pgvector 0.7.0+")
+            current = detect_embedding_storage(cursor)
+            if current == storage:
+                log(f"documents already uses {storage} storage")
+                return {"from": current, "to": storage, "converted": False}
+
+            cursor.execute("SELECT pg_total_relation_size('documents');")
+            size_before = cursor.fetchone()[0]
+
+            # The indexes are tied to the old column type or opclass
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'documents' AND indexname LIKE 'documents\\_embedding\\_%';")
+            for (name,) in cursor.fetchall():
+                log(f"Dropping {name}...")
+                cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(name)))
+
+            started = time.monotonic()
+            if embedding_column_type(current) != embedding_column_type(storage):
+                column_type = embedding_column_type(storage)
+                log(f"Converting embeddings to {column_type}...")
+                cursor.execute(f"ALTER TABLE documents ALTER COLUMN embedding TYPE {column_type} USING embedding::{column_type};")
+                cursor.execute("ANALYZE documents;")
+            convert_seconds = time.monotonic() - started
+    finally:
+        conn.close()
+
+    use_embedding_storage(storage)
+    _known_namespace_indexes.clear()
+    result = {
+        "from": current,
+        "to": storage,
+        "converted": True,
+        "convert_seconds": round(convert_seconds, 2),
+        "build": build_vector_index("hnsw", m=m, ef_construction=ef_construction, log=log),
+    }
+    if PGVECTOR_NAMESPACE_INDEXES:
+        result["namespaces"] = build_namespace_indexes(m=m, ef_construction=ef_construction, log=log)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_total_relation_size('documents');")
+            result["size_before_bytes"] = size_before
+            result["size_after_bytes"] = cursor.fetchone()[0]
+    finally:
+        conn.close()
+    return result
+
+
+# Variants compared by the storage benchmark: table column type, index expression, query expression
+_BENCHMARK_VARIANTS = {
+    "vector": ("vector", "embedding vector_cosine_ops", "embedding <=> %(q)s::vector"),
+    "halfvec": ("halfvec", "embedding halfvec_cosine_ops", "embedding <=> %(q)s::vector::halfvec"),
+    "binary": (
+        "halfvec",
+        f"(binary_quantize(embedding)::bit({VECTOR_DIMENSION})) bit_hamming_ops",
+        f"binary_quantize(embedding)::bit({VECTOR_DIMENSION}) <~> binary_quantize(%(q)s::vector::halfvec)",
+    ),
+}
+
+
+def storage_benchmark(rows=10000, queries=50, top_k=10, ef_search=40, rerank_factor=10,
+                      m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, noise=0.05, seed=0, log=print):
+    """Compare index size, build time, latency and recall of each storage mode.
+
+    A random sample of ``rows`` stored embeddings is copied into temporary tables,
+    one per storage mode, so the live table is never touched. Recall is measured
+    against an exact float32 scan of the same sample; binary is reported with and
+    without re-ranking ``top_k * rerank_factor`` candidates on the float16 values.
+    """
+    ensure_pgvector()
+    rng = np.random.default_rng(seed)
+    conn = get_db_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            variants = ["vector"]
+            if pgvector_supports_halfvec(cursor):
+                variants += ["halfvec", "binary"]
+            else:
+                log("pgvector < 0.7 has no halfvec or binary_quantize; benchmarking vector only")
+
+            cursor.execute("SELECT setseed(%s);", (seed / 1000.0,))
+            cursor.execute(f"""
+                CREATE TEMP TABLE bench_sample AS
+                SELECT id, embedding::vector({VECTOR_DIMENSION}) AS embedding
+                FROM documents ORDER BY random() LIMIT %s;
+            """, (rows,))
+            cursor.execute("SELECT COUNT(*) FROM bench_sample;")
+            sample_rows = cursor.fetchone()[0]
+            if not sample_rows:
+                return {"rows": 0, "queries": 0, "top_k": top_k, "results": []}
+
+            cursor.execute("SELECT embedding::text FROM bench_sample ORDER BY random() LIMIT %s;", (queries,))
+            samples = []
+            for (text,) in cursor.fetchall():
+                vector = _parse_vector(text)
+                vector = vector + rng.normal(0, noise, vector.shape).astype(np.float32)
+                samples.append((vector / np.linalg.norm(vector)).tolist())
+
+            # Ground truth from a float32 sequential scan
+            truth = []
+            for vector in samples:
+                cursor.execute("SELECT id FROM bench_sample ORDER BY embedding <=> %(q)s::vector LIMIT %(k)s;",
+                               {"q": vector, "k": top_k})
+                truth.append({row[0] for row in cursor.fetchall()})
+
+            results = []
+            for variant in variants:
+                column_type, index_sql, order_sql = _BENCHMARK_VARIANTS[variant]
+                table = f"bench_{variant}"
+                cursor.execute(f"""
+                    CREATE TEMP TABLE {table} AS
+                    SELECT id, embedding::{column_type}({VECTOR_DIMENSION}) AS embedding FROM bench_sample;
+                """)
+                log(f"Building {variant} index over {sample_rows} rows...")
+                started = time.monotonic()
+                cursor.execute(f"""
+                    CREATE INDEX {table}_idx ON {table}
+                    USING hnsw ({index_sql}) WITH (m = {int(m)}, ef_construction = {int(ef_construction)});
+                """)
+                build_seconds = time.monotonic() - started
+                cursor.execute("SELECT pg_table_size(%s), pg_relation_size(%s);", (table, f"{table}_idx"))
+                table_bytes, index_bytes = cursor.fetchone()
+
+                searches = [(variant, f"SELECT id FROM {table} ORDER BY {order_sql} LIMIT %(k)s", top_k)]
+                if variant == "binary":
+                    searches.append((f"binary+rerank x{rerank_factor}", f"""
+                        SELECT id FROM (
+                            SELECT id, embedding FROM {table} ORDER BY {order_sql} LIMIT %(k)s * {int(rerank_factor)}
+                        ) candidates
+                        ORDER BY embedding <=> %(q)s::vector::halfvec LIMIT %(k)s
+                    """, top_k * rerank_factor))
+
+                for label, query, limit in searches:
+                    cursor.execute("BEGIN;")
+                    cursor.execute(search_settings_sql(max(ef_search, limit), 1))
+                    recalls, latencies = [], []
+                    for vector, expected in zip(samples, truth):
+                        started = time.perf_counter()
+                        cursor.execute(query, {"q": vector, "k": top_k})
+                        ids = {row[0] for row in cursor.fetchall()}
+                        latencies.append((time.perf_counter() - started) * 1000)
+                        recalls.append(len(expected & ids) / len(expected))
+                    cursor.execute("COMMIT;")
+                    row = _summarize(label, recalls, latencies)
+                    row.update({
+                        "table_bytes": table_bytes,
+                        "index_bytes": index_bytes,
+                        "build_seconds": round(build_seconds, 2),
+                    })
+                    results.append(row)
+    finally:
+        # Closing the session drops the temporary tables
+        conn.close()
+
+    return {"rows": sample_rows, "queries": len(samples), "top_k": top_k, "results": results}
+
+
+def _parse_vector(text):
+    return np.array([float(x) for x in text.strip("[]").split(",")], dtype=np.float32)
+
+
+def _search(cursor, settings_sql, embedding, namespace, top_k):
+    started = time.perf_counter()
+    cursor.execute(
+        settings_sql + f"SELECT id FROM ({nearest_sql('%(embedding)s', '%(namespace)s', '%(top_k)s')}) nearest",
+        {"embedding": embedding, "namespace": namespace, "top_k": top_k}
+    )
+    ids = [row[0] for row in cursor.fetchall()]
+    return ids, (time.perf_counter() - started) * 1000
+
+
+def _exact_search(cursor, embedding, namespace, top_k):
+    started = time.perf_counter()
+    cursor.execute(f"""
+        SET LOCAL enable_indexscan = off; SET LOCAL enable_bitmapscan = off;
+        SELECT id FROM documents
+        WHERE namespace = %(namespace)s
+        ORDER BY embedding <=> {query_vector_sql('%(embedding)s')}
+        LIMIT %(top_k)s
+    """, {"embedding": embedding, "namespace": namespace, "top_k": top_k})
+    ids = [row[0] for row in cursor.fetchall()]
+    return ids, (time.perf_counter() - started) * 1000
+
+
+def _summarize(label, recalls, latencies):
+    return {
+        "setting": label,
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "mean_ms": round(float(np.mean(latencies)), 3),
+    }
+
+
+def recall_report(namespace=None, queries=50, top_k=10, ef_search_values=(10, 20, 40, 80, 160),
+                  probes_values=(1, 5, 10, 20, 40), noise=0.05, seed=0):
+    """Compare ANN results against an exact scan for a sample of queries.
+
+    Query vectors are stored embeddings with a little Gaussian noise added, so
+    they look like real questions that land near (but not exactly on) a chunk.
+    Returns one row per search setting with recall@k and latency percentiles.
+    """
+    ensure_pgvector()
+    rng = np.random.default_rng(seed)
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            method = current_index_method(cursor)
+            cursor.execute("SELECT setseed(%s);", (seed / 1000.0,))
+            if namespace:
+                cursor.execute("SELECT namespace, embedding::text FROM documents WHERE namespace = %s ORDER BY random() LIMIT %s",
+                               (namespace, queries))
+            else:
+                cursor.execute("SELECT namespace, embedding::text FROM documents ORDER BY random() LIMIT %s", (queries,))
+            samples = []
+            for sample_namespace, text in cursor.fetchall():
+                vector = _parse_vector(text)
+                vector = vector + rng.normal(0, noise, vector.shape).astype(np.float32)
+                samples.append((sample_namespace, (vector / np.linalg.norm(vector)).tolist()))
+            conn.commit()
+            if not samples:
+                return {"index": method, "queries": 0, "top_k": top_k, "rows": []}
+
+            # Ground truth from a sequential scan
+            exact, exact_latencies = [], []
+            for sample_namespace, vector in samples:
+                ids, latency = _exact_search(cursor, vector, sample_namespace, top_k)
+                conn.commit()
+                exact.append(set(ids))
+                exact_latencies.append(latency)
+            rows = [_summarize("exact", [1.0] * len(samples), exact_latencies)]
+
+            if method == "hnsw":
+                settings = [(f"ef_search={value}", search_settings_sql(max(value, ann_limit(top_k, "vector")), 1))
+                            for value in ef_search_values]
+            elif method == "ivfflat":
+                settings = [(f"probes={value}", search_settings_sql(top_k, value)) for value in probes_values]
+            else:
+                settings = []
+
+            for label, settings_sql in settings:
+                recalls, latencies = [], []
+                for (sample_namespace, vector), truth in zip(samples, exact):
+                    ids, latency = _search(cursor, settings_sql, vector, sample_namespace, top_k)
+                    conn.commit()
+                    recalls.append(len(truth & set(ids)) / len(truth) if truth else 1.0)
+                    latencies.append(latency)
+                rows.append(_summarize(label, recalls, latencies))
+    finally:
+        pool.putconn(conn)
+
+    return {"index": method, "queries": len(samples), "top_k": top_k, "rows": rows}
@@ -1,186 +1,68 @@
 import os
 import json
-import psycopg2
-from psycopg2.extras import execute_values
+import hmac
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponseNotFound
+from django.http import FileResponse, HttpResponse, JsonResponse, HttpResponseNotFound, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.conf import settings
-from sentence_transformers import SentenceTransformer
-from groq import Groq
 from dotenv import load_dotenv
 from .models import DocumentationFile
-import uuid
+from .db import ensure_pgvector, get_pool
+from .retrieval import RETRIEVAL_BACKEND, query_similar_docs, resolve_mode
+from .memory_index import memory_index
+from .embeddings import embedding_cache, embedding_batcher, encode_question
+from .answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from .ingest import INGEST_BATCH_SIZE, ingest_documents, iter_ndjson
+from .warmup import readiness, start_background_warmup
+from .aio import async_encode_question, async_query_similar_docs
+from .llm import LLMUnavailable, llm_scheduler
+from .rerank import candidate_count, rerank_matches, reranker
+from .doc_text import doc_text_cache, text_etag
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+from .precompress import ENCODINGS, variant_is_fresh
+from .shared_chat_store import shared_chat_store
+from .upload_ingest import upload_ingest_queue
+from .batch import ndjson_lines, parse_batch_items, parse_top_k, run_batch
+from .metrics import METRICS_ENABLED, METRICS_TOKEN, record_cache, registry, traced
+from .prompts import (
+    CHAT_MAX_TOKENS, CHAT_MODEL, CHAT_TEMPERATURE, CHAT_TOP_K, build_chat_messages, busy_answer, no_docs_answer,
+    still_learning_answer,
+)
+import mimetypes
+from asgiref.sync import sync_to_async
 import time
 
 # Load environment variables
 load_dotenv()
 
-# Initialize clients
-# CHANGE THIS LINE - Use the same model as in pgvector.ipynb
-model = SentenceTransformer("all-mpnet-base-v2")  # Previously was all-MiniLM-L6-v2
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-# PostgreSQL connection settings
-PG_HOST = os.getenv("PG_HOST", "127.0.0.1")
-PG_PORT = os.getenv("PG_PORT", "5432")
-PG_USER = os.getenv("PG_USER", "avi")
-PG_PASSWORD = os.getenv("PG_PASSWORD", "root")
-PG_DATABASE = os.getenv("PG_DATABASE", "documents")
-# Update dimension to match the all-mpnet-base-v2 model
-VECTOR_DIMENSION = 768  # Changed from 384 to match all-mpnet-base-v2 dimensions
-
-# Directory to store shared chats
-SHARED_CHATS_DIR = os.path.join(settings.BASE_DIR, 'media', 'shared_chats')
-
-# Create directory if it doesn't exist
-if not os.path.exists(SHARED_CHATS_DIR):
-    os.makedirs(SHARED_CHATS_DIR)
-
-# Helper function for PostgreSQL connection
-def get_db_connection():
-    """Create and return a connection to the PostgreSQL database."""
-    try:
-        conn = psycopg2.connect(
-            host=PG_HOST,
-            port=PG_PORT,
-            user=PG_USER,
-            password=PG_PASSWORD,
-            dbname=PG_DATABASE
-        )
-        return conn
-    except Exception as e:
-        print(f"Error connecting to PostgreSQL database: {e}")
-        raise
-
-# Setup pgvector and required tables
-def setup_pgvector():
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            # Create extension if it doesn't exist
-            cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            conn.commit()
-            
-            # Check if the documents table exists
-            cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public'
-                AND table_name = 'documents'
-            );
-            """)
-            table_exists = cursor.fetchone()[0]
-            
-            if not table_exists:
-                # Create documents table with the correct schema
-                cursor.execute(f"""
-                CREATE TABLE documents (
-                    id SERIAL PRIMARY KEY,
-                    namespace TEXT NOT NULL,
-                    doc_type TEXT NOT NULL,
-                    heading TEXT,
-                    path TEXT,
-                    url TEXT,
-                    content TEXT NOT NULL,
-                    chunk_id INTEGER,
-                    total_chunks INTEGER,
-                    level INTEGER,
-                    embedding VECTOR({VECTOR_DIMENSION}) NOT NULL
-                );
-                """)
-                conn.commit()
-                
-                # Create indices after table is created
-                cursor.execute("""
-                CREATE INDEX IF NOT EXISTS documents_embedding_idx 
-                ON documents 
-                USING ivfflat (embedding vector_cosine_ops) 
-                WITH (lists = 100);
-                """)
-                conn.commit()
-                
-                cursor.execute("CREATE INDEX IF NOT EXISTS documents_namespace_idx ON documents (namespace);")
-                conn.commit()
-                
-                print("Database table created with proper schema")
-            else:
-                print("Using existing documents table")
-                
-    except Exception as e:
-        conn.rollback()
-        print(f"Error setting up database: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
-    finally:
-        conn.close()
-
-# Try to setup pgvector on module import
-try:
-    setup_pgvector()
-    print("✅ pgvector setup complete")
-except Exception as e:
-    print(f"⚠️ pgvector setup failed: {e}")
-
-# Function to query documents from pgvector
-def query_similar_docs(question_embedding, namespace, top_k=5):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            # Use vector similarity search with cosine distance
-            cursor.execute("""
-                SELECT 
-                    id, 
-                    heading, 
-                    path, 
-                    url, 
-                    content, 
-                    chunk_id, 
-                    total_chunks, 
-                    level,
-                    1 - (embedding <=> %s::vector) as similarity
-                FROM 
-                    documents
-                WHERE 
-                    namespace = %s
-                ORDER BY 
-                    embedding <=> %s::vector
-                LIMIT %s
-            """, (question_embedding, namespace, question_embedding, top_k))
-            
-            # Fetch results
-            results = cursor.fetchall()
-            
-            # Format as a structure similar to Pinecone results
-            matches = []
-            for row in results:
-                matches.append({
-                    "id": str(row[0]),
-                    "metadata": {
-                        "heading": row[1],
-                        "path": row[2],
-                        "url": row[3],
-                        "content": row[4],
-                        "chunk_id": row[5],
-                        "total_chunks": row[6],
-                        "level": row[7],
-                    },
-                    "score": float(row[8])  # similarity score
-                })
-            
-            return {"matches": matches}
-            
-    except Exception as e:
-        print(f"Error querying PostgreSQL: {e}")
-        return {"matches": []}
-    finally:
-        conn.close()
-
 def index(request):
     return render(request, 'index.html')
 
+def liveness(request):
+    return JsonResponse({"status": "ok"})
+
+def readiness_probe(request):
+    """503 until the embedding model is loaded and pgvector is set up."""
+    ready, status = readiness()
+    if not ready:
+        # Make sure a worker started without the WSGI/ASGI hook still warms up
+        start_background_warmup()
+    return JsonResponse({"ready": ready, **status}, status=200 if ready else 503)
+
+def metrics(request):
+    """Chat latency histograms and counters in the Prometheus text format (per process)."""
+    if not METRICS_ENABLED:
+        return HttpResponseNotFound("Metrics are disabled")
+    if not METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponse("Set METRICS_TOKEN to expose metrics", status=403)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        return HttpResponse("Unauthorized", status=401)
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def ai_chat(request, tool_name=None):
     # If tool_name is not provided in URL, check query parameter or use default
     if tool_name is None:
@@ -225,62 +107,191 @@ def ai_chat(request, tool_name=None):
         'doc_type_name': display_name
     })
 
+def cached_text_response(request, key, text, etag, last_modified=None):
+    """JsonResponse ``{key: text}`` with validators, or a 304 when the client's copy is current."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse({key: text})
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    # Let browsers and CDNs keep the text but check back, so a re-upload shows up right away
+    response["Cache-Control"] = "no-cache"
+    return response
+
 def copy_doc_text(request):
     name = request.GET.get('name', '').lower()
     print(f"🔍 DEBUG - copy_doc_text requested for: {name}")
     
+    doc = doc_text_cache.document(name)
+    if doc is None:
+        print(f"❌ ERROR - Documentation not found for: {name}")
+        text = f"No documentation found for {name}"
+        return cached_text_response(request, 'text', text, text_etag(text))
+    
+    # Try to get the real content if available
     try:
-        doc = DocumentationFile.objects.get(name__iexact=name)
-        print(f"🔎 Found document: {doc.name}, type: {doc.doc_type}")
-        
-        # Create dummy content for when file doesn't exist
-        dummy_content = f"# Documentation for {doc.name}\n\nThis is placeholder text for {doc.name} documentation."
-        
-        # Try to get the real content if available
-        if doc.documentation_file:
-            try:
-                file_path = doc.documentation_file.path
-                import os
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        return JsonResponse({'text': f.read()})
-            except Exception as e:
-                print(f"❌ ERROR: {str(e)}")
-        
-        # Return dummy content if we couldn't get the real file
-        return JsonResponse({'text': dummy_content})
+        entry = doc_text_cache.read(doc["documentation_path"])
+        if entry is not None:
+            text, etag, mtime = entry
+            return cached_text_response(request, 'text', text, etag, mtime)
+    except Exception as e:
+        print(f"❌ ERROR: {str(e)}")
     
-    except DocumentationFile.DoesNotExist:
-        print(f"❌ ERROR - Documentation not found for: {name}")
-        return JsonResponse({'text': f"No documentation found for {name}"})
+    # Return dummy content if we couldn't get the real file
+    dummy_content = f"# Documentation for {doc['name']}\n\nThis is placeholder text for {doc['name']} documentation."
+    return cached_text_response(request, 'text', dummy_content, text_etag(dummy_content))
 
 def copy_ai_summary(request):
     name = request.GET.get('name', '').lower()
     print(f"🔍 DEBUG - copy_ai_summary requested for: {name}")
     
+    doc = doc_text_cache.document(name)
+    if doc is None:
+        print(f"❌ ERROR - Documentation not found for: {name}")
+        summary = f"No AI summary found for {name}"
+        return cached_text_response(request, 'summary', summary, text_etag(summary))
+    
+    # Try to get the real content if available
     try:
-        doc = DocumentationFile.objects.get(name__iexact=name)
-        
-        # Create dummy AI summary
-        dummy_summary = f"# AI Summary for {doc.name}\n\nThis is a placeholder AI summary for {doc.name}."
-        
-        # Try to get the real content if available
-        if doc.ai_documentation_file:
-            try:
-                file_path = doc.ai_documentation_file.path
-                import os
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        return JsonResponse({'summary': f.read()})
-            except Exception as e:
-                print(f"❌ ERROR: {str(e)}")
-        
-        # Return dummy content if we couldn't get the real file
-        return JsonResponse({'summary': dummy_summary})
+        entry = doc_text_cache.read(doc["ai_documentation_path"])
+        if entry is not None:
+            summary, etag, mtime = entry
+            return cached_text_response(request, 'summary', summary, etag, mtime)
+    except Exception as e:
+        print(f"❌ ERROR: {str(e)}")
     
-    except DocumentationFile.DoesNotExist:
-        print(f"❌ ERROR - Documentation not found for: {name}")
-        return JsonResponse({'summary': f"No AI summary found for {name}"})
+    # Return dummy content if we couldn't get the real file
+    dummy_summary = f"# AI Summary for {doc['name']}\n\nThis is a placeholder AI summary for {doc['name']}."
+    return cached_text_response(request, 'summary', dummy_summary, text_etag(dummy_summary))
+
+DOC_FILE_KINDS = {'doc': 'documentation_path', 'ai': 'ai_documentation_path'}
+
+def parse_accept_encoding(header):
+    """Content codings the client accepts (q > 0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def parse_byte_range(header, size):
+    """Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+    
+    Returns None when the header should be ignored (multiple or malformed
+    ranges get the full file) and False when the range can't be satisfied.
+    """
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(end, size - 1)
+
+def if_range_passes(request, etag, last_modified):
+    """A Range only applies if If-Range (when sent) still matches the current file."""
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+def read_file_range(f, length, block_size=65536):
+    try:
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+@require_http_methods(["GET", "HEAD"])
+def doc_file(request, kind, name):
+    """Serve a documentation or AI summary file as-is.
+    
+    Uses the .br/.gz variant written on upload when Accept-Encoding allows it,
+    answers conditional requests with 304 and single byte ranges with 206
+    (ranges are served from the uncompressed file).
+    """
+    if kind not in DOC_FILE_KINDS:
+        return HttpResponseNotFound()
+    doc = doc_text_cache.document(name)
+    path = doc[DOC_FILE_KINDS[kind]] if doc else None
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+    if stat is None:
+        return JsonResponse({"error": f"No file found for {name}"}, status=404)
+    
+    last_modified = int(stat.st_mtime)
+    content_type = 'text/markdown' if path.endswith('.md') else (mimetypes.guess_type(path)[0] or 'text/plain')
+    if content_type.startswith('text/'):
+        content_type += '; charset=utf-8'
+    
+    range_header = request.headers.get('Range')
+    encoding, serve_path = None, path
+    if not range_header:
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        for candidate, suffix in ENCODINGS:
+            if (candidate in accepted or '*' in accepted) and variant_is_fresh(path, suffix):
+                encoding, serve_path = candidate, path + suffix
+                break
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = parse_byte_range(range_header, stat.st_size) if range_header and if_range_passes(request, etag, last_modified) else None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            f = open(serve_path, 'rb')
+            f.seek(start)
+            response = StreamingHttpResponse(read_file_range(f, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            # FileResponse hands the file to the server's sendfile (wsgi.file_wrapper) when it can
+            response = FileResponse(open(serve_path, 'rb'), content_type=content_type, filename=os.path.basename(path))
+            if encoding:
+                response['Content-Encoding'] = encoding
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Vary'] = 'Accept-Encoding'
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 def debug_db(request):
     from django.http import HttpResponse
@@ -317,35 +328,184 @@ def debug_db(request):
     output += "</table>"
     
     # Add pgvector database info
-    conn = get_db_connection()
+    pool = get_pool()
     try:
-        with conn.cursor() as cursor:
-            # Check if the documents table exists
-            cursor.execute("SELECT COUNT(*) FROM documents;")
-            doc_count = cursor.fetchone()[0]
-            output += f"<h2>pgvector Database</h2><p>Total vectors: {doc_count}</p>"
+        # It borrows a connection of its own, so call it before taking one here
+        ensure_pgvector()
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                # Check if the documents table exists
+                cursor.execute("SELECT COUNT(*) FROM documents;")
+                doc_count = cursor.fetchone()[0]
+                output += f"<h2>pgvector Database</h2><p>Total vectors: {doc_count}</p>"
             
-            # Get namespace stats
-            cursor.execute("SELECT namespace, COUNT(*) FROM documents GROUP BY namespace;")
-            namespaces = cursor.fetchall()
+                # Get namespace stats
+                cursor.execute("SELECT namespace, COUNT(*) FROM documents GROUP BY namespace;")
+                namespaces = cursor.fetchall()
             
-            if namespaces:
-                output += "<table border='1'><tr><th>Namespace</th><th>Document Count</th></tr>"
-                for ns in namespaces:
-                    output += f"<tr><td>{ns[0]}</td><td>{ns[1]}</td></tr>"
-                output += "</table>"
+                if namespaces:
+                    output += "<table border='1'><tr><th>Namespace</th><th>Document Count</th></tr>"
+                    for ns in namespaces:
+                        output += f"<tr><td>{ns[0]}</td><td>{ns[1]}</td></tr>"
+                    output += "</table>"
     except Exception as e:
         output += f"<p>Error querying pgvector: {str(e)}</p>"
-    finally:
-        conn.close()
-        
+
+    # Connection pool stats
+    output += "<h2>Connection Pool</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in pool.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # Question embedding cache stats
+    output += "<h2>Embedding Cache</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in embedding_cache.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # Embedding micro-batcher stats
+    output += "<h2>Embedding Batcher</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in embedding_batcher.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # Semantic answer cache stats
+    output += "<h2>Answer Cache</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in answer_cache.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # Documentation text cache stats
+    output += "<h2>Document Text Cache</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in doc_text_cache.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # Shared chat read-through cache stats
+    output += "<h2>Shared Chat Cache</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in shared_chat_store.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # In-process vector index stats
+    if RETRIEVAL_BACKEND == "memory":
+        output += "<h2>Memory Index</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+        for key, value in memory_index.stats().items():
+            output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+        output += "</table>"
+
+    # Background ingestion of uploaded documentation files
+    output += "<h2>Upload Ingestion</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in upload_ingest_queue.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # LLM scheduler stats
+    output += "<h2>LLM Scheduler</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in llm_scheduler.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
+    # Cross-encoder reranking stats
+    output += "<h2>Reranker</h2><table border='1'><tr><th>Stat</th><th>Value</th></tr>"
+    for key, value in reranker.stats().items():
+        output += f"<tr><td>{key}</td><td>{value}</td></tr>"
+    output += "</table>"
+
     return HttpResponse(output)
 
 def docs(request, doc_id):
     # Simple view that renders a placeholder
     return render(request, 'docs.html', {'doc_id': doc_id})
 
+def retrieve_matches(question, question_embedding, namespace, search_params=None):
+    """Fetch reranking candidates from pgvector and keep the best chunks for the prompt."""
+    results = query_similar_docs(question_embedding, namespace, top_k=candidate_count(CHAT_TOP_K),
+                                 question=question, **(search_params or {}))
+    return rerank_matches(question, results.get("matches", []) if results else [], CHAT_TOP_K)
+
+async def retrieve_matches_async(question, question_embedding, namespace, search_params=None):
+    results = await async_query_similar_docs(question_embedding, namespace, top_k=candidate_count(CHAT_TOP_K),
+                                             question=question, **(search_params or {}))
+    # The cross-encoder is CPU-bound, keep it off the event loop
+    return await sync_to_async(rerank_matches, thread_sensitive=False)(question, results.get("matches", []), CHAT_TOP_K)
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat_answer(tool_name, question, namespace, search_params=None):
+    """Generator for the streaming chat response: sources first, then answer tokens."""
+    try:
+        question_embedding = encode_question(question)
+        
+        if ANSWER_CACHE_ENABLED:
+            cached = answer_cache.get(namespace, question_embedding)
+            record_cache("answer", cached is not None)
+            if cached is not None:
+                payload, similarity = cached
+                yield sse_event("sources", {"sources": payload.get("sources", []), "cached": True})
+                yield sse_event("token", {"text": payload["answer"]})
+                yield sse_event("done", {"cached": True})
+                return
+        
+        matches = retrieve_matches(question, question_embedding, namespace, search_params)
+        if not matches:
+            yield sse_event("sources", {"sources": []})
+            yield sse_event("token", {"text": no_docs_answer(tool_name)})
+            yield sse_event("done", {})
+            return
+        
+        messages, sources = build_chat_messages(tool_name, question, matches)
+        yield sse_event("sources", {"sources": sources})
+        
+        # Queued behind the rate limits; the sources are already on screen while it waits
+        stream = llm_scheduler.stream(
+            messages,
+            model=CHAT_MODEL,
+            temperature=CHAT_TEMPERATURE,
+            max_tokens=CHAT_MAX_TOKENS
+        )
+        
+        answer_parts = []
+        for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                answer_parts.append(text)
+                yield sse_event("token", {"text": text})
+        
+        if ANSWER_CACHE_ENABLED and answer_parts:
+            answer_cache.set(namespace, question_embedding, {"answer": "".join(answer_parts), "sources": sources})
+        
+        yield sse_event("done", {})
+        
+    except LLMUnavailable as e:
+        print(f"LLM busy: {str(e)}")
+        yield sse_event("token", {"text": busy_answer(tool_name)})
+        yield sse_event("done", {"busy": True})
+    except Exception as e:
+        print(f"Error streaming chat answer: {str(e)}")
+        yield sse_event("token", {"text": still_learning_answer(tool_name)})
+        yield sse_event("done", {"error": True})
+
+def search_params_from(data):
+    """Optional per-request search parameters: ef_search (HNSW), probes (IVFFlat) and mode (vector/hybrid)."""
+    params = {}
+    for key in ('ef_search', 'probes'):
+        if data.get(key) is not None:
+            try:
+                params[key] = int(data[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be an integer")
+    if data.get('mode') is not None:
+        params['mode'] = resolve_mode(str(data['mode']), data.get('question'))
+    return params
+
+def wants_stream(request, data):
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
 @csrf_exempt
+@traced("chat")
 def chat_api(request):
     if request.method == 'POST':
         try:
@@ -356,69 +516,71 @@ def chat_api(request):
             if not question or not tool_name:
                 return JsonResponse({"error": "Missing question or tool_name"}, status=400)
             
+            try:
+                search_params = search_params_from(data)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            
             # Form the namespace name (similar to previous Pinecone index name)
             namespace = f"{tool_name}-docs"
             
+            # Server-sent events: send the sources right away, then tokens as Groq produces them
+            if wants_stream(request, data):
+                response = StreamingHttpResponse(
+                    stream_chat_answer(tool_name, question, namespace, search_params),
+                    content_type="text/event-stream"
+                )
+                response["Cache-Control"] = "no-cache"
+                response["X-Accel-Buffering"] = "no"  # Stop nginx from buffering the stream
+                return response
+            
             try:
-                # Get embeddings for the question
-                question_embedding = model.encode(question).tolist()
-                
-                # Query pgvector instead of Pinecone
-                results = query_similar_docs(question_embedding, namespace, top_k=4)
-                
-                # If no results, return a message
-                if not results or not results.get("matches"):
-                    return JsonResponse({
-                        "answer": f"I don't have enough information about {tool_name} to answer your question. We'll add more documentation soon."
-                    })
+                # Get embeddings for the question (cached for repeat questions)
+                question_embedding = encode_question(question)
                 
-                # Prepare context for Groq
-                contexts = []
-                for match in results["matches"]:
-                    metadata = match["metadata"]
-                    contexts.append(f"Section: {metadata.get('heading', '')}\n\nContent: {metadata.get('content', '')}")
+                # Return the answer of a near-identical question if we already have one
+                if ANSWER_CACHE_ENABLED:
+                    cached = answer_cache.get(namespace, question_embedding)
+                    record_cache("answer", cached is not None)
+                    if cached is not None:
+                        payload, similarity = cached
+                        return JsonResponse({**payload, "cached": True})
                 
-                # Join contexts
-                context = "\n\n" + "=" * 40 + "\n\n".join(contexts) + "\n\n" + "=" * 40 + "\n\n"
+                # Query pgvector instead of Pinecone, then rerank the candidates
+                matches = retrieve_matches(question, question_embedding, namespace, search_params)
                 
-                # Get answer from Groq
-                system_prompt = f"""You are an expert {tool_name.capitalize()} documentation assistant. Your task is to provide high-quality answers by:
-                1. SUMMARIZING the relevant information from the provided documentation context
-                2. EXTRACTING and HIGHLIGHTING any code examples that directly answer the question
-                3. STRUCTURING your answer in a clear format with proper sections
-                4. FOCUSING only on the parts of the context most relevant to the question
-                
-                FORMAT your response as follows:
-                - Start with a direct, concise answer to the question
-                - Include code examples in properly formatted markdown code blocks
-                - Cite the specific documentation sections you used
-                
-                If the provided context doesn't contain sufficient information, acknowledge this limitation clearly."""
+                # If no results, return a message
+                if not matches:
+                    return JsonResponse({"answer": no_docs_answer(tool_name)})
                 
-                user_prompt = f"Question: {question}\n\nDocumentation context:\n{context}"
+                messages, sources = build_chat_messages(tool_name, question, matches)
                 
-                response = groq_client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    model="llama3-8b-8192",
-                    temperature=0.1,
-                    max_tokens=1200
-                )
+                # Get answer from Groq, through the scheduler's queue and rate limits
+                try:
+                    response = llm_scheduler.complete(
+                        messages,
+                        model=CHAT_MODEL,
+                        temperature=CHAT_TEMPERATURE,
+                        max_tokens=CHAT_MAX_TOKENS
+                    )
+                except LLMUnavailable as e:
+                    print(f"LLM busy: {str(e)}")
+                    return JsonResponse({"answer": busy_answer(tool_name), "sources": sources, "busy": True})
                 
                 answer = response.choices[0].message.content
-                
-                return JsonResponse({
+                payload = {
                     "answer": answer,
-                    "sources": [match["metadata"].get("path", "") for match in results["matches"]]
-                })
+                    "sources": sources
+                }
+                
+                if ANSWER_CACHE_ENABLED:
+                    answer_cache.set(namespace, question_embedding, payload)
+                
+                return JsonResponse(payload)
                 
             except Exception as e:
                 print(f"Error querying pgvector or calling Groq: {str(e)}")
-                return JsonResponse({
-                    "answer": f"I'm still learning about {tool_name}. The documentation will be available soon."
-                })
+                return JsonResponse({"answer": still_learning_answer(tool_name)})
                 
         except Exception as e:
             print(f"Error processing request: {str(e)}")
@@ -426,6 +588,141 @@ def chat_api(request):
     
     return JsonResponse({"error": "Only POST requests allowed"}, status=405)
 
+async def stream_chat_answer_async(tool_name, question, namespace, search_params=None):
+    """Async generator for the streaming chat response under ASGI."""
+    try:
+        question_embedding = await async_encode_question(question)
+        
+        if ANSWER_CACHE_ENABLED:
+            cached = answer_cache.get(namespace, question_embedding)
+            record_cache("answer", cached is not None)
+            if cached is not None:
+                payload, similarity = cached
+                yield sse_event("sources", {"sources": payload.get("sources", []), "cached": True})
+                yield sse_event("token", {"text": payload["answer"]})
+                yield sse_event("done", {"cached": True})
+                return
+        
+        matches = await retrieve_matches_async(question, question_embedding, namespace, search_params)
+        if not matches:
+            yield sse_event("sources", {"sources": []})
+            yield sse_event("token", {"text": no_docs_answer(tool_name)})
+            yield sse_event("done", {})
+            return
+        
+        messages, sources = build_chat_messages(tool_name, question, matches)
+        yield sse_event("sources", {"sources": sources})
+        
+        stream = llm_scheduler.astream(
+            messages,
+            model=CHAT_MODEL,
+            temperature=CHAT_TEMPERATURE,
+            max_tokens=CHAT_MAX_TOKENS
+        )
+        
+        answer_parts = []
+        async for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                answer_parts.append(text)
+                yield sse_event("token", {"text": text})
+        
+        if ANSWER_CACHE_ENABLED and answer_parts:
+            answer_cache.set(namespace, question_embedding, {"answer": "".join(answer_parts), "sources": sources})
+        
+        yield sse_event("done", {})
+        
+    except LLMUnavailable as e:
+        print(f"LLM busy: {str(e)}")
+        yield sse_event("token", {"text": busy_answer(tool_name)})
+        yield sse_event("done", {"busy": True})
+    except Exception as e:
+        print(f"Error streaming chat answer: {str(e)}")
+        yield sse_event("token", {"text": still_learning_answer(tool_name)})
+        yield sse_event("done", {"error": True})
+
+@traced("chat_async")
+async def chat_api_async(request):
+    """Async version of ``chat_api`` for ASGI deployments.
+    
+    Nothing here blocks the event loop: encoding runs in a small thread pool,
+    pgvector is queried through asyncpg and the LLM scheduler is awaited.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Only POST requests allowed"}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        question = data.get('question')
+        tool_name = data.get('tool_name')
+        
+        if not question or not tool_name:
+            return JsonResponse({"error": "Missing question or tool_name"}, status=400)
+        
+        try:
+            search_params = search_params_from(data)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        
+        namespace = f"{tool_name}-docs"
+        
+        if wants_stream(request, data):
+            response = StreamingHttpResponse(
+                stream_chat_answer_async(tool_name, question, namespace, search_params),
+                content_type="text/event-stream"
+            )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
+        
+        try:
+            question_embedding = await async_encode_question(question)
+            
+            if ANSWER_CACHE_ENABLED:
+                cached = answer_cache.get(namespace, question_embedding)
+                record_cache("answer", cached is not None)
+                if cached is not None:
+                    payload, similarity = cached
+                    return JsonResponse({**payload, "cached": True})
+            
+            matches = await retrieve_matches_async(question, question_embedding, namespace, search_params)
+            if not matches:
+                return JsonResponse({"answer": no_docs_answer(tool_name)})
+            
+            messages, sources = build_chat_messages(tool_name, question, matches)
+            try:
+                response = await llm_scheduler.acomplete(
+                    messages,
+                    model=CHAT_MODEL,
+                    temperature=CHAT_TEMPERATURE,
+                    max_tokens=CHAT_MAX_TOKENS
+                )
+            except LLMUnavailable as e:
+                print(f"LLM busy: {str(e)}")
+                return JsonResponse({"answer": busy_answer(tool_name), "sources": sources, "busy": True})
+            
+            payload = {
+                "answer": response.choices[0].message.content,
+                "sources": sources
+            }
+            
+            if ANSWER_CACHE_ENABLED:
+                answer_cache.set(namespace, question_embedding, payload)
+            
+            return JsonResponse(payload)
+            
+        except Exception as e:
+            print(f"Error querying pgvector or calling Groq: {str(e)}")
+            return JsonResponse({"answer": still_learning_answer(tool_name)})
+            
+    except Exception as e:
+        print(f"Error processing request: {str(e)}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# csrf_exempt in Django 4.2 wraps the view in a sync function, which would hide
+# the coroutine from Django, so mark the async view directly instead.
+chat_api_async.csrf_exempt = True
+
 # Function to store documents in PostgreSQL
 @csrf_exempt
 def store_documents(request):
@@ -440,54 +737,20 @@ def store_documents(request):
             if not documents or not namespace or not doc_type:
                 return JsonResponse({"error": "Missing documents, namespace, or doc_type"}, status=400)
             
-            # Generate embeddings for documents
-            contents = [f"{doc.get('heading', '')}\n\n{doc.get('content', '')}" for doc in documents]
-            embeddings = model.encode(contents)
-            
-            # Store in database
-            conn = get_db_connection()
             try:
-                with conn.cursor() as cursor:
-                    records = []
-                    for i, doc in enumerate(documents):
-                        record = (
-                            namespace,
-                            doc_type,
-                            doc.get("heading", ""),
-                            doc.get("path", ""),
-                            doc.get("url", ""),
-                            doc.get("content", ""),
-                            doc.get("chunk_id"),
-                            doc.get("total_chunks"),
-                            doc.get("level", 1),
-                            embeddings[i].tolist()
-                        )
-                        records.append(record)
-                    
-                    execute_values(
-                        cursor,
-                        """
-                        INSERT INTO documents 
-                        (namespace, doc_type, heading, path, url, content, chunk_id, total_chunks, level, embedding)
-                        VALUES %s
-                        """,
-                        records,
-                        template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-                    )
-                    conn.commit()
-                    
+                # Encoded and upserted in batches; unchanged chunks are not re-embedded.
+                # "sync": true also deletes stored chunks of the namespace that weren't sent.
+                stats = ingest_documents(documents, namespace, doc_type, sync=bool(data.get('sync')))
+                
                 return JsonResponse({
                     "success": True,
-                    "message": f"Successfully stored {len(documents)} documents in namespace '{namespace}'",
-                    "count": len(documents)
+                    "message": f"Successfully stored {stats.documents} documents in namespace '{namespace}' ({stats.embedded} new or changed)",
+                    **stats.as_dict()
                 })
                 
             except Exception as e:
-                conn.rollback()
                 print(f"Error storing documents in PostgreSQL: {e}")
                 return JsonResponse({"error": str(e)}, status=500)
-            finally:
-                conn.close()
                 
         except Exception as e:
             print(f"Error processing document storage request: {str(e)}")
@@ -495,6 +758,74 @@ def store_documents(request):
     
     return JsonResponse({"error": "Only POST requests allowed"}, status=405)
 
+@csrf_exempt
+def store_documents_stream(request):
+    """Streaming ingestion: the request body is NDJSON, one chunk per line.
+    
+    namespace and doc_type come from the query string (or from each line), and
+    the body is read line by line so memory stays flat for large uploads.
+    With ?sync=1 the upload is treated as the full source of its namespaces.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Only POST requests allowed"}, status=405)
+    
+    namespace = request.GET.get('namespace')
+    doc_type = request.GET.get('doc_type')
+    
+    try:
+        batch_size = int(request.GET.get('batch_size', INGEST_BATCH_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "batch_size must be an integer"}, status=400)
+    
+    try:
+        stats = ingest_documents(
+            iter_ndjson(request), namespace, doc_type,
+            batch_size=batch_size,
+            sync=request.GET.get('sync', '').lower() in ('1', 'true', 'yes')
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        print(f"Error streaming documents into PostgreSQL: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+    
+    return JsonResponse({"success": True, **stats.as_dict()})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_chat_api(request):
+    """Answer many questions in one request, streaming one NDJSON result per line.
+    
+    The body is either JSON ({"items": [{"tool_name", "question", "id"?}, ...], ...})
+    or NDJSON with one item per line (Content-Type: application/x-ndjson), in which
+    case tool_name, top_k, mode, ef_search and probes come from the query string.
+    Results arrive in completion order; match them up by index or id.
+    """
+    try:
+        if request.content_type == 'application/x-ndjson':
+            options = request.GET
+            items = list(iter_ndjson(request))
+        else:
+            options = json.loads(request.body)
+            items = options.get('items')
+        valid, invalid = parse_batch_items(items, options.get('tool_name'))
+        # Every valid item has a question, so a hybrid mode stays hybrid
+        search_params = search_params_from({
+            **{key: options.get(key) for key in ('ef_search', 'probes', 'mode')},
+            'question': bool(valid),
+        })
+        top_k = parse_top_k(options.get('top_k'))
+    except (ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({"error": f"Invalid batch request: {e}"}, status=400)
+    
+    response = StreamingHttpResponse(
+        ndjson_lines(run_batch(valid, top_k=top_k, search_params=search_params, invalid=invalid)),
+        content_type='application/x-ndjson'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def create_shared_chat(request):
@@ -502,21 +833,15 @@ def create_shared_chat(request):
     try:
         data = json.loads(request.body)
         
-        # Generate a unique ID
-        chat_id = str(uuid.uuid4())[:8]
-        
         # Create chat object
         chat_data = {
-            'chat_id': chat_id,
             'tool_name': data.get('tool_name', 'generic'),
             'messages': data.get('messages', []),
             'created_at': data.get('created_at', time.strftime('%Y-%m-%dT%H:%M:%SZ'))
         }
         
-        # Save to file
-        file_path = os.path.join(SHARED_CHATS_DIR, f'{chat_id}.json')
-        with open(file_path, 'w') as f:
-            json.dump(chat_data, f)
+        # Save it; the store generates a unique ID
+        chat_id = shared_chat_store.create(chat_data)
         
         return JsonResponse({
             'success': True,
@@ -528,22 +853,35 @@ def create_shared_chat(request):
             'error': str(e)
         }, status=500)
 
-@require_http_methods(["GET"])
+# Shared chats are immutable snapshots, so browsers and CDNs may keep them until they expire
+SHARED_CHAT_MAX_AGE = 365 * 24 * 3600
+
+def shared_chat_cache_control(expires_at):
+    max_age = SHARED_CHAT_MAX_AGE
+    if expires_at:
+        max_age = max(0, min(max_age, int((expires_at - timezone.now()).total_seconds())))
+    return f"public, max-age={max_age}, immutable"
+
+@require_http_methods(["GET", "HEAD"])
 def get_shared_chat(request, chat_id):
-    """Retrieve a shared chat by ID"""
+    """Retrieve a shared chat by ID, with its AI messages pre-rendered to HTML"""
     try:
-        file_path = os.path.join(SHARED_CHATS_DIR, f'{chat_id}.json')
+        snapshot = shared_chat_store.snapshot(chat_id)
         
-        if not os.path.exists(file_path):
+        if snapshot is None:
             return JsonResponse({
                 'success': False,
                 'error': 'Chat not found'
             }, status=404)
         
-        with open(file_path, 'r') as f:
-            chat_data = json.load(f)
-        
-        return JsonResponse(chat_data)
+        # The body was serialized when the chat was shared; send the bytes as they are
+        body, etag, expires_at = snapshot
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = shared_chat_cache_control(expires_at)
+        return response
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from .db import ensure_pgvector, pgvector_ready
+from .embeddings import get_ml_model, get_torch_device, ml_model_loaded
+from .llm import get_groq_client
+from .memory_index import memory_index
+from .rerank import RERANK_ENABLED, get_rerank_model, rerank_model_loaded
+from .retrieval import RETRIEVAL_BACKEND
+
+# Load environment variables
+load_dotenv()
+
+# Load the model and check pgvector in a background thread when a server starts
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() in ("1", "true", "yes")
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+_warmup_state = {
+    "started_at": None,
+    "finished_at": None,
+    "errors": {},
+}
+
+
+def warm_up():
+    """Load the models, create the Groq client and check pgvector.
+
+    Each step is independent so a database outage doesn't keep the model from loading.
+    """
+    _warmup_state["started_at"] = time.time()
+    steps = [
+        ("model", lambda: get_ml_model().encode("warm up")),
+        ("groq", get_groq_client),
+        ("pgvector", ensure_pgvector),
+    ]
+    if RETRIEVAL_BACKEND == "memory":
+        steps.append(("memory_index", memory_index.refresh_all))
+    if RERANK_ENABLED:
+        steps.append(("rerank_model", lambda: get_rerank_model().predict([("warm up", "warm up")], show_progress_bar=False)))
+    for name, step in steps:
+        try:
+            step()
+            _warmup_state["errors"].pop(name, None)
+        except Exception as e:
+            print(f"⚠️ Warm-up step '{name}' failed: {e}")
+            _warmup_state["errors"][name] = str(e)
+    _warmup_state["finished_at"] = time.time()
+
+
+def start_background_warmup():
+    """Start ``warm_up()`` in a daemon thread; returns immediately.
+
+    Runs once per process, unless the previous attempt had failing steps.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        retry = _warmup_thread is not None and not _warmup_thread.is_alive() and _warmup_state["errors"]
+        if _warmup_thread is None or retry:
+            _warmup_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def readiness():
+    """Return ``(ready, status)`` for the readiness probe."""
+    status = {
+        "model_loaded": ml_model_loaded(),
+        "device": get_torch_device() if ml_model_loaded() else None,
+        "pgvector_ready": pgvector_ready(),
+        "rerank_model_loaded": rerank_model_loaded(),
+        "warmup_started": _warmup_state["started_at"] is not None,
+        "warmup_finished": _warmup_state["finished_at"] is not None,
+        "errors": dict(_warmup_state["errors"]),
+    }
+    ready = status["model_loaded"] and status["pgvector_ready"]
+    return ready, status